@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+단일 프로세스 배치 세션 실행기.
+
+run_batch_test.sh 는 모델/컨텍스트마다 `python run_test.py` 를 4번(initial 1회 + continuous 3회) 새로 띄우므로
+매번 openai/tiktoken/GPUtil/numpy 임포트, 토크나이저 로드, ResponseEvaluator 생성이 반복됩니다.
+이 스크립트는 한 프로세스 안에서 모든 실행을 수행하면서 토크나이저, HTTP 연결 풀, 평가기를 유지하고,
+generate_report.py 가 기대하는 것과 동일한 이름/형식의 실행별 JSON 파일을 기록합니다.
+
+알 수 없는 인자는 그대로 run_test.py 인자로 전달됩니다 (예: --limit-prompts 1, --concurrency 4).
+
+각 실행은 결과 JSON 옆의 같은 이름 .jsonl 에 프롬프트 단위로 즉시 기록됩니다 (run_test.py --output-jsonl).
+세션이 중단되면 같은 --timestamp 와 --resume 으로 다시 실행해 완료된 실행과 프롬프트를 건너뛸 수 있습니다.
+
+--schedule (Ollama) 은 실행을 모델 로드 단위 (모델, num_ctx) 별로 모아 돌리고, 그룹 동안 keep_alive 로 모델을 고정해
+실행 사이 유휴 시간에 모델이 내려가지 않게 한 뒤 그룹이 끝나면 내립니다. --prefetch-next 는 그룹의 마지막 실행과 동시에
+다음 모델을 올립니다 (두 모델이 함께 메모리에 올라갈 수 있어야 하며, 그 실행의 측정값에는 로드 부하가 섞입니다).
+세션이 끝나면 스케줄 없이 기본 keep_alive 로 돌렸을 때 대비 로드 횟수와 절약한 시간을 출력합니다 (ModelSwapScheduler 참고).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import run_test
+from evaluator import ResponseEvaluator
+from tokenizer_registry import safe_model_name # Same ':' / '/' -> '_' rule as run_batch_test.sh
+
+
+def result_file_path(results_dir: str, model: str, api_type: str, context: int, timestamp: str,
+                     test_type: str, run_index: int = None, config_id: str = None) -> str:
+    """run_batch_test.sh 와 같은 규칙의 결과 파일 경로를 만듭니다 (sweep_runner.py 는 타임스탬프 뒤에 config_id 를 붙임)."""
+    name = f"{safe_model_name(model)}_{api_type}_ctx{context}_{timestamp}_{f'{config_id}_' if config_id else ''}{test_type}"
+    if run_index is not None:
+        name += f"_{run_index}"
+    return os.path.join(results_dir, f"{name}.json")
+
+PIN_KEEP_ALIVE = '30m' # Renewed by every request; expires on its own if the session dies while a model is pinned
+OLLAMA_DEFAULT_KEEP_ALIVE = '5m' # What an unscheduled session runs with (the server default unless OLLAMA_KEEP_ALIVE is set)
+LOAD_DETECT_SEC = 0.1 # A request whose load_duration exceeds this had to load the model (an already loaded one reports a few ms)
+
+
+def plan_runs(models: list, contexts: list, continuous_runs: int) -> list:
+    """(model, context, test_type, run_index) 실행 목록을 bash 루프와 같은 순서로 만듭니다."""
+    runs = []
+    for model in models:
+        for context in contexts:
+            runs.append((model, context, 'initial', None))
+            for i in range(1, continuous_runs + 1):
+                runs.append((model, context, 'continuous', i))
+    return runs
+
+def model_load_key(run: tuple) -> tuple:
+    """실행에 필요한 Ollama 모델 로드 단위 (Ollama 는 num_ctx 가 바뀌면 모델을 다시 올리므로 (모델, 컨텍스트))."""
+    return run[0], run[1]
+
+def count_model_loads(runs: list) -> int:
+    """로드 단위가 바뀔 때마다 한 번 로드한다고 보고 세는 로드 횟수 (메모리에 모델 하나만 올라가는 경우)."""
+    keys = [model_load_key(run) for run in runs]
+    return sum(1 for i, key in enumerate(keys) if i == 0 or key != keys[i - 1])
+
+def schedule_runs(runs: list) -> list:
+    """같은 로드 단위의 실행을 모아 로드 횟수가 최소가 되도록 정렬합니다.
+
+    모델과 로드 단위는 처음 나온 순서를 따르고, 같은 단위 안의 순서 (initial 이 continuous 보다 먼저) 는 유지합니다.
+    plan_runs 의 순서는 이미 묶여 있으므로 그대로이고, 재개/외부에서 만든 실행 목록처럼 섞인 경우에만 바뀝니다.
+    """
+    model_first, key_first = {}, {}
+    for i, run in enumerate(runs):
+        model_first.setdefault(run[0], i)
+        key_first.setdefault(model_load_key(run), i)
+    return sorted(runs, key=lambda run: (model_first[run[0]], key_first[model_load_key(run)]))
+
+def observed_load_times(results: dict) -> list:
+    """실행 결과에서 모델을 올려야 했던 요청의 Ollama load_duration (초) 목록을 반환합니다."""
+    loads = []
+    for test in (results or {}).get('test_results', []):
+        load_sec = test['result'].get('metrics', {}).get('api_load_duration_sec') if test['result'].get('success') else None
+        if load_sec and load_sec > LOAD_DETECT_SEC:
+            loads.append(load_sec)
+    return loads
+
+class ModelSwapScheduler:
+    """Ollama 에서 같은 로드 단위 (모델, num_ctx) 의 실행을 모아 돌리고, 그룹마다 모델을 keep_alive 로 고정했다가 해제합니다.
+
+    비교 기준은 스케줄 없이 같은 실행 목록을 원래 순서와 서버 기본 keep_alive (baseline_keep_alive) 로 돌린 세션입니다.
+    그 세션이 치렀을 로드 = 원래 순서에서 로드 단위가 바뀐 횟수 + 같은 그룹의 실행 사이 유휴 시간이 기본 keep_alive 를 넘어
+    모델이 내려간 횟수 (keep_alive 와 같이 이전 실행의 마지막 요청이 끝난 시각부터 잰 간격 기준) 입니다.
+    절약 시간 = (기준 로드 - 스케줄 로드) x 이 세션에서 관측한 평균 로드 시간 + 미리 올리기가 이전 그룹 실행과 겹친 시간.
+
+    run_batch_session 이 실행마다 before_run/after_run 을 호출합니다. before_run 이 반환한 태그는 결과 dict 의 'schedule' 로
+    기록되어 generate_report.py 가 같은 값을 다시 계산할 수 있습니다.
+    """
+    def __init__(self, api_url: str, runs: list, prefetch: bool = False, pin_keep_alive=PIN_KEEP_ALIVE,
+                 baseline_keep_alive=OLLAMA_DEFAULT_KEEP_ALIVE):
+        self.api_url = api_url
+        self.prefetch = prefetch
+        self.pin_keep_alive = pin_keep_alive
+        self.baseline_keep_alive_sec = run_test.keep_alive_seconds(baseline_keep_alive)
+        self.original_loads = count_model_loads(runs)
+        self.runs = schedule_runs(runs)
+        self.scheduled_loads = count_model_loads(self.runs)
+        keys = [model_load_key(run) for run in self.runs]
+        self.group_keys = list(dict.fromkeys(keys)) # Runs of a group are contiguous after scheduling
+        self.group_of = [self.group_keys.index(key) for key in keys]
+        self.load_times = [] # Every observed load: requests that reported a load and prefetches
+        self.idle_before = {} # run index -> idle seconds since the last request of the previous run in the group
+        self.prefetched = {} # group -> {'load_sec', 'hidden_sec'} for groups loaded during the previous group
+        self._prefetch = None # (group, started, thread, holder)
+        self._last_end = None
+        self._last_request_end = None # Wall clock; keep_alive counts from the last request, not the end of the run
+
+    def run_test_args(self) -> list:
+        return ['--keep-alive', str(self.pin_keep_alive)]
+
+    def _is_first(self, n: int) -> bool:
+        return n == 0 or self.group_of[n - 1] != self.group_of[n]
+
+    def _is_last(self, n: int) -> bool:
+        return n == len(self.runs) - 1 or self.group_of[n + 1] != self.group_of[n]
+
+    def _start_prefetch(self, group: int):
+        model, context = self.group_keys[group]
+        holder = {}
+        def load():
+            holder['load_sec'] = run_test.load_ollama_model(self.api_url, model, self.pin_keep_alive, context)
+            holder['finished'] = time.perf_counter()
+        thread = threading.Thread(target=load, daemon=True)
+        print(f"  Prefetching {model} (num_ctx {context}) while the current group finishes", file=sys.stderr)
+        self._prefetch = (group, time.perf_counter(), thread, holder)
+        thread.start()
+
+    def _finish_prefetch(self, group_end: float):
+        """진행 중인 미리 올리기를 기다리고, 로드 시간 중 이전 그룹 실행과 겹친 부분 (hidden_sec) 을 기록합니다."""
+        group, started, thread, holder = self._prefetch
+        thread.join()
+        self._prefetch = None
+        if holder.get('load_sec') is not None:
+            self.prefetched[group] = {'load_sec': holder['load_sec'], 'hidden_sec': max(0.0, min(holder['finished'], group_end) - started)}
+            self.load_times.append(holder['load_sec'])
+
+    def before_run(self, n: int) -> dict:
+        """n 번째 실행 전에 호출됩니다. 결과에 기록할 태그를 반환합니다."""
+        group = self.group_of[n]
+        if not self._is_first(n) and self._last_request_end is not None:
+            self.idle_before[n] = time.time() - self._last_request_end
+        if self.prefetch and self._is_last(n) and group + 1 < len(self.group_keys) \
+                and self.group_keys[group + 1][0] != self.group_keys[group][0]: # Same model, other num_ctx would replace the running one
+            self._start_prefetch(group + 1)
+        model, context = self.group_keys[group]
+        prefetched = self.prefetched.get(group) or {}
+        return {'schedule': {
+            'group': group + 1,
+            'groups': len(self.group_keys),
+            'first_in_group': self._is_first(n),
+            'load_model': model,
+            'load_num_ctx': context,
+            'pin_keep_alive': self.pin_keep_alive,
+            'idle_before_sec': self.idle_before.get(n),
+            'baseline_keep_alive_sec': self.baseline_keep_alive_sec,
+            'load_detect_sec': LOAD_DETECT_SEC,
+            'prefetched': bool(prefetched),
+            'prefetch_load_sec': prefetched.get('load_sec'),
+            'prefetch_hidden_sec': prefetched.get('hidden_sec'),
+            'original_loads': self.original_loads,
+            'scheduled_loads': self.scheduled_loads,
+        }}
+
+    def after_run(self, n: int, results: dict = None):
+        """n 번째 실행 후에 호출됩니다 (실패하거나 건너뛴 실행은 results=None). 그룹이 끝나면 다음 모델이 다르면 내립니다."""
+        group = self.group_of[n]
+        self.load_times += observed_load_times(results)
+        self._last_end = time.perf_counter()
+        self._last_request_end = (results or {}).get('requests_end_time') or time.time()
+        if not self._is_last(n):
+            return
+        if self._prefetch:
+            self._finish_prefetch(self._last_end)
+        model = self.group_keys[group][0]
+        if group + 1 == len(self.group_keys) or self.group_keys[group + 1][0] != model:
+            run_test.unload_ollama_model(self.api_url, model) # Frees the memory instead of waiting for Ollama to evict it
+
+    def close(self):
+        """세션이 중간에 끝나도 고정한 모델이 남지 않도록 미리 올리던 모델과 마지막 모델을 내립니다."""
+        if self._prefetch:
+            self._finish_prefetch(time.perf_counter())
+        for model in dict.fromkeys(model for model, _ in self.group_keys):
+            models = run_test.fetch_ollama_models(self.api_url)
+            if models and run_test._ollama_model_entry(models, model):
+                run_test.unload_ollama_model(self.api_url, model)
+
+    def summary(self) -> dict:
+        """기준 세션 (원래 순서, 기본 keep_alive) 대비 로드 횟수와 절약한 시간."""
+        mean_load = run_test._mean(self.load_times)
+        expiry_reloads = sum(1 for idle in self.idle_before.values() if idle > self.baseline_keep_alive_sec)
+        baseline_loads = self.original_loads + expiry_reloads
+        avoided = baseline_loads - self.scheduled_loads
+        hidden = sum(p['hidden_sec'] for p in self.prefetched.values())
+        return {
+            'original_loads': self.original_loads,
+            'expiry_reloads': expiry_reloads,
+            'baseline_loads': baseline_loads,
+            'scheduled_loads': self.scheduled_loads,
+            'observed_loads': len(self.load_times),
+            'mean_load_sec': mean_load,
+            'loads_saved_sec': avoided * mean_load if mean_load else 0.0,
+            'prefetch_hidden_sec': hidden,
+            'saved_sec': (avoided * mean_load if mean_load else 0.0) + hidden,
+        }
+
+def run_argv(api_type: str, api_url: str, run: tuple, jsonl_path: str, resume: bool = False, run_test_args: list = None) -> list:
+    """실행 하나의 run_test.py 인자 목록을 만듭니다."""
+    model, context, test_type, _ = run
+    argv = ['--api-type', api_type, '--model', model, '--context', str(context), '--test-type', test_type,
+            '--output-jsonl', jsonl_path]
+    if api_url:
+        argv += ['--api-url', api_url]
+    if resume:
+        argv.append('--resume')
+    return argv + list(run_test_args or [])
+
+def check_run_args(api_type: str, api_url: str, runs: list, run_test_args: list = None):
+    """모든 실행의 run_test.py 인자를 미리 검증해, 잘못된 조합 (예: --output-reserve 이하의 컨텍스트) 이면 ValueError 를 냅니다.
+
+    실행 도중 parse_args 가 SystemExit 으로 세션 전체를 끝내지 않도록 서버를 띄우거나 첫 실행을 시작하기 전에 호출합니다.
+    """
+    for run in dict.fromkeys((model, context, test_type, None) for model, context, test_type, _ in runs):
+        try:
+            run_test.parse_args(run_argv(api_type, api_url, run, os.devnull, run_test_args=run_test_args))
+        except SystemExit:
+            raise ValueError(f"Invalid run_test.py arguments for {run[0]} context {run[1]} ({run[2]}); see the error above") from None
+
+def run_batch_session(api_type: str, api_url: str, runs: list, results_dir: str, timestamp: str,
+                      run_test_args: list = None, pause_sec: float = 2.0, resume: bool = False,
+                      config_id: str = None, tags: dict = None, scheduler: ModelSwapScheduler = None) -> list:
+    """계획된 실행들을 한 프로세스에서 순서대로 수행하고 결과 파일 경로 목록을 반환합니다.
+
+    resume 이면 결과 JSON 이 이미 있는 실행은 건너뛰고, 중단된 실행은 .jsonl 에서 이어서 수행합니다.
+    tags 는 각 결과 dict 에 그대로 덮어써 기록합니다 (sweep_runner.py 의 'sweep' 설정).
+    scheduler 를 주면 runs 대신 scheduler.runs 순서로 실행하고 실행마다 모델 고정/해제를 맡깁니다.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    evaluator = ResponseEvaluator() # 모든 실행에서 재사용
+    written = []
+    if scheduler:
+        runs = scheduler.runs
+        run_test_args = scheduler.run_test_args() + list(run_test_args or []) # An explicit --keep-alive wins
+
+    try:
+        for n, run in enumerate(runs):
+            path = _run_one(n, run, api_type, api_url, len(runs), results_dir, timestamp, run_test_args, pause_sec, resume,
+                            config_id, tags, scheduler, evaluator)
+            if path:
+                written.append(path)
+    finally:
+        if scheduler:
+            scheduler.close()
+    run_test.close_endpoint_pools()
+    return written
+
+def _run_one(n: int, run: tuple, api_type: str, api_url: str, total: int, results_dir: str, timestamp: str, run_test_args: list,
+             pause_sec: float, resume: bool, config_id: str, tags: dict, scheduler: ModelSwapScheduler, evaluator) -> str:
+    """실행 하나를 수행하고 결과 파일 경로를 반환합니다 (실패하면 None)."""
+    model, context, test_type, run_index = run
+    label = f"{model} (API: {api_type}, context: {context}, {test_type}{f' #{run_index}' if run_index else ''})"
+    print(f"[{n + 1}/{total}] Running {label}", file=sys.stderr)
+
+    path = result_file_path(results_dir, model, api_type, context, timestamp, test_type, run_index, config_id)
+    jsonl_path = os.path.splitext(path)[0] + '.jsonl'
+    if resume and os.path.exists(path) and os.path.getsize(path) > 0:
+        print(f"  Skipping, already completed: {path}", file=sys.stderr)
+        if scheduler:
+            scheduler.after_run(n) # Still unloads the model when this was the last run of its group
+        return path
+    tags = dict(tags or {}, **(scheduler.before_run(n) if scheduler else {}))
+
+    try:
+        args = run_test.parse_args(run_argv(api_type, api_url, run, jsonl_path, resume, run_test_args))
+    except SystemExit: # parser.error() already printed why; keep the session going
+        print(f"Error: invalid run_test.py arguments for {label}", file=sys.stderr)
+        if scheduler:
+            scheduler.after_run(n)
+        return None
+
+    started = time.perf_counter()
+    try:
+        results = run_test.run_test_suite(args, evaluator)
+    except Exception as e:
+        print(f"Error: run failed for {label}: {e}", file=sys.stderr)
+        results = None
+    if scheduler:
+        scheduler.after_run(n, results)
+    if results is None:
+        return None
+    results.update(tags)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"  Saved {path} ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+
+    if test_type == 'continuous' and pause_sec:
+        time.sleep(pause_sec) # run_batch_test.sh 와 같은 짧은 대기
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all initial/continuous sLLM test passes for several models and contexts in one process')
+    parser.add_argument('--api-type', default='ollama', choices=['ollama', 'tgi', 'vllm'], help='Type of API endpoint')
+    parser.add_argument('--api-url', default=None, help='Base URL for the API endpoint (defaults as in run_test.py)')
+    parser.add_argument('--models', nargs='+', required=True, help='Model names to test')
+    parser.add_argument('--contexts', nargs='+', type=int, default=[12800, 41200, 51200, 76800], help='Context lengths to test')
+    parser.add_argument('--continuous-runs', type=int, default=3, help='Number of continuous passes per model/context')
+    parser.add_argument('--results-dir', default='experiment_results', help='Directory for per-run JSON files')
+    parser.add_argument('--timestamp', default=None, help='Timestamp used in result filenames (default: now, YYYYMMDD_HHMMSS)')
+    parser.add_argument('--pause', type=float, default=2.0, help='Seconds to wait after each continuous pass')
+    parser.add_argument('--report', action='store_true', help='Generate the markdown report after all runs')
+    parser.add_argument('--resume', action='store_true', help='Skip runs whose result JSON exists and continue interrupted runs (use with the same --timestamp)')
+    parser.add_argument('--schedule', action='store_true', help='Ollama: regroup the runs to minimise model loads (a num_ctx change reloads the model), pin each model while its runs last and unload it afterwards')
+    parser.add_argument('--prefetch-next', action='store_true', help='With --schedule: load the next model during the last run of the current one (needs memory for both, e.g. OLLAMA_MAX_LOADED_MODELS>=2)')
+    parser.add_argument('--pin-keep-alive', type=run_test.parse_keep_alive, default=PIN_KEEP_ALIVE, help='keep_alive sent while a model is pinned by --schedule')
+    parser.add_argument('--baseline-keep-alive', type=run_test.parse_keep_alive, default=OLLAMA_DEFAULT_KEEP_ALIVE,
+                        help="The server's default keep_alive (OLLAMA_KEEP_ALIVE), used to count the reloads an unscheduled session would pay")
+    args, run_test_args = parser.parse_known_args()
+
+    timestamp = args.timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+    runs = plan_runs(args.models, args.contexts, args.continuous_runs)
+    if args.resume and not args.timestamp:
+        parser.error('--resume requires the --timestamp of the session to continue')
+    if (args.schedule or args.prefetch_next) and args.api_type != 'ollama':
+        parser.error('--schedule and --prefetch-next need --api-type ollama (vLLM/TGI serve one model per server)')
+    if args.prefetch_next and not args.schedule:
+        parser.error('--prefetch-next requires --schedule')
+    try:
+        check_run_args(args.api_type, args.api_url, runs, run_test_args)
+    except ValueError as e:
+        parser.error(str(e))
+    scheduler = None
+    if args.schedule:
+        scheduler = ModelSwapScheduler(args.api_url or run_test.DEFAULT_OLLAMA_URL, runs, args.prefetch_next, args.pin_keep_alive,
+                                       args.baseline_keep_alive)
+    session_started = time.perf_counter()
+    written = run_batch_session(args.api_type, args.api_url, runs, args.results_dir, timestamp, run_test_args, args.pause, args.resume,
+                                scheduler=scheduler)
+    print(f"Completed {len(written)}/{len(runs)} runs in {time.perf_counter() - session_started:.1f}s. Timestamp: {timestamp}", file=sys.stderr)
+    if scheduler:
+        summary = scheduler.summary()
+        mean_load = f"{summary['mean_load_sec']:.2f}s" if summary['mean_load_sec'] else 'not reported'
+        print(f"Model loads: unscheduled with keep_alive {args.baseline_keep_alive} would pay {summary['baseline_loads']} "
+              f"({summary['original_loads']} load unit changes + {summary['expiry_reloads']} idle expiries), scheduled {summary['scheduled_loads']}, "
+              f"observed {summary['observed_loads']} (mean load {mean_load}); saved ~{summary['loads_saved_sec']:.1f}s in loads + "
+              f"{summary['prefetch_hidden_sec']:.1f}s hidden by prefetch = {summary['saved_sec']:.1f}s wall-clock", file=sys.stderr)
+
+    if args.report and written:
+        import generate_report # pandas/matplotlib 은 보고서 생성 시에만 로드
+        generate_report.build_report(args.results_dir, timestamp)
+
+    # 이 실행의 타임스탬프를 stdout 으로 출력 (셸 스크립트에서 보고서 생성에 사용)
+    print(timestamp)
+
+if __name__ == '__main__':
+    main()
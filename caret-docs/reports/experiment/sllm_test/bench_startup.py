@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+run_test.py CLI 시작 시간 벤치마크.
+
+run_batch_test.sh 의 셸 루프는 매 반복마다 run_test.py 를 새로 띄우므로 임포트 비용이 그대로 누적됩니다.
+이 스크립트는 다음을 측정해 지연 임포트가 깨지는 회귀를 드러냅니다.
+  1. `python run_test.py --help` 의 wall-clock 시간 (여러 번 실행한 min/median/max)
+  2. `import run_test` 직후 로드된 무거운 의존성 목록 (비어 있어야 정상)
+  3. `python -X importtime` 기준 누적 임포트 시간이 큰 모듈 상위 N개
+
+--max-median-ms 를 주면 중앙값이 기준을 넘을 때, --fail-on-eager 를 주면 무거운 의존성이 미리 로드될 때 종료 코드 1 을 반환합니다.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ('asyncio', 'numpy', 'openai', 'tiktoken', 'tokenizers', 'requests', 'httpx', 'GPUtil', 'psutil', 'pandas')
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_cli_startup(runs: int, python: str = sys.executable) -> list:
+    """`run_test.py --help` 를 runs 번 실행해 각 소요 시간(ms)을 반환합니다."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([python, 'run_test.py', '--help'], cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def eagerly_loaded_modules(python: str = sys.executable) -> list:
+    """`import run_test` 만으로 로드되는 무거운 의존성 목록을 반환합니다."""
+    code = ("import json, sys; import run_test; "
+            f"print(json.dumps([m for m in {list(HEAVY_MODULES)!r} if m in sys.modules]))")
+    output = subprocess.run([python, '-c', code], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def import_time_breakdown(top: int, python: str = sys.executable) -> list:
+    """-X importtime 출력에서 누적 시간이 큰 최상위/직속 하위 모듈 (모듈, 누적 ms) 을 반환합니다."""
+    stderr = subprocess.run([python, '-X', 'importtime', '-c', 'import run_test'], cwd=SCRIPT_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    entries = []
+    for line in stderr.splitlines():
+        fields = line[len('import time:'):].split('|') if line.startswith('import time:') else []
+        if len(fields) != 3 or not fields[1].strip().isdigit(): # Header or unrelated line
+            continue
+        depth = (len(fields[2]) - len(fields[2].lstrip(' ')) - 1) // 2
+        if depth > 1: # Only top-level imports and their direct children are reported
+            continue
+        entries.append((fields[2].strip(), int(fields[1]) / 1000))
+    return sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark run_test.py CLI startup time and import laziness')
+    parser.add_argument('--runs', type=int, default=10, help='Number of `run_test.py --help` launches to time')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest imports to list')
+    parser.add_argument('--max-median-ms', type=float, default=None, help='Fail if the median startup time exceeds this')
+    parser.add_argument('--fail-on-eager', action='store_true', help='Fail if any heavy dependency is imported at module load')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    timings = time_cli_startup(args.runs)
+    eager = eagerly_loaded_modules()
+    breakdown = import_time_breakdown(args.top)
+    results = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'startup_ms_min': min(timings),
+        'startup_ms_median': statistics.median(timings),
+        'startup_ms_max': max(timings),
+        'eagerly_loaded_heavy_modules': eager,
+        'slowest_imports_ms': breakdown,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"run_test.py --help startup over {args.runs} runs: "
+              f"min {results['startup_ms_min']:.1f} ms, median {results['startup_ms_median']:.1f} ms, max {results['startup_ms_max']:.1f} ms")
+        print(f"Heavy modules loaded by `import run_test`: {', '.join(eager) if eager else 'none'}")
+        print("Slowest imports (cumulative, top two nesting levels):")
+        for name, ms in breakdown:
+            print(f"  {ms:8.1f} ms  {name}")
+
+    failed = False
+    if args.max_median_ms is not None and results['startup_ms_median'] > args.max_median_ms:
+        print(f"FAIL: median startup {results['startup_ms_median']:.1f} ms exceeds {args.max_median_ms} ms", file=sys.stderr)
+        failed = True
+    if args.fail_on_eager and eager:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(eager)}", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
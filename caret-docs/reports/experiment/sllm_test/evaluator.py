@@ -4,7 +4,6 @@ import ast
 import json
 from typing import Dict, List, Any
 from dataclasses import dataclass
-import numpy as np
 
 import random
 
@@ -379,9 +378,10 @@ def test_fibonacci(func):
             'total_score': total_score
         }
 
-def evaluate_model_responses(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """모델의 전체 응답 평가 - 여러 프롬프트에 대한 결과 집계"""
-    evaluator = ResponseEvaluator()
+def evaluate_model_responses(responses: List[Dict[str, Any]], evaluator: ResponseEvaluator = None) -> Dict[str, Any]:
+    """모델의 전체 응답 평가 - 여러 프롬프트에 대한 결과 집계 (evaluator 를 넘기면 재사용)"""
+    if evaluator is None:
+        evaluator = ResponseEvaluator()
     results = {}
 
     # 응답을 시나리오별로 그룹화 (프롬프트 인덱스도 고려해야 하지만, 일단 시나리오로만 그룹화)
@@ -405,6 +405,8 @@ def evaluate_model_responses(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
                  )
                  scenario_responses[scenario_id].append(scores)
 
+    import numpy as np # 평균 계산에만 필요하므로 지연 임포트 (initial 실행은 numpy 를 로드하지 않음)
+
     # 각 시나리오별 평균 점수 계산
     for scenario_id, score_list in scenario_responses.items():
         # 시나리오의 평균 점수 계산
@@ -9,6 +9,8 @@ import seaborn as sns
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 
+from result_files import find_result_files, read_result_file
+
 # --- Helper Functions ---
 
 def is_valid_df(df: Optional[pd.DataFrame], columns: List[str]) -> bool:
@@ -57,6 +59,32 @@ def safe_idxmax(series: pd.Series) -> Optional[str]:
     except ValueError:
         return None
 
+def config_columns(result: Dict) -> Dict:
+    """Flattens a run's sweep configuration (sweep_runner.py) and sampling parameters into server.<flag> / sampling.<name> columns."""
+    sweep = result.get('sweep') or {}
+    columns = {'config_id': sweep.get('config_id')}
+    for prefix, values in (('server', sweep.get('server_flags')), ('sampling', sweep.get('sampling') or result.get('sampling'))):
+        for name, value in (values or {}).items():
+            columns[f'{prefix}.{name}'] = json.dumps(value) if isinstance(value, (list, dict)) else value # Keeps the columns hashable for groupby
+    return columns
+
+def config_group_columns(df: pd.DataFrame, group_by: Optional[List[str]] = None) -> List[str]:
+    """Returns the columns to compare configurations by.
+
+    --group-by names are used as given; a bare name such as 'quantization' matches server.quantization or sampling.quantization.
+    Without --group-by: config_id, model and every server./sampling. column that differs between runs.
+    """
+    if not group_by:
+        varying = [c for c in df.columns if c.startswith(('server.', 'sampling.')) and df[c].nunique(dropna=False) > 1]
+        return ['config_id', 'model'] + varying
+    columns = []
+    for name in group_by:
+        matches = [name] if name in df.columns else [c for c in df.columns if '.' in c and c.split('.', 1)[1] == name]
+        if not matches:
+            print(f"Warning: --group-by column '{name}' not found in the results; ignoring it.")
+        columns += matches
+    return columns
+
 # --- Data Loading and Analysis ---
 
 def load_results(results_dir: str, timestamp: str) -> Tuple[List[Dict], List[Dict]]:
@@ -66,34 +94,22 @@ def load_results(results_dir: str, timestamp: str) -> Tuple[List[Dict], List[Dic
     
     print(f"Loading results from: {results_dir} with timestamp: {timestamp}")
     found_files = 0
-    for filename in os.listdir(results_dir):
-        # Ensure we only process files matching the timestamp and ending with .json
-        if timestamp in filename and filename.endswith('.json'):
-            filepath = os.path.join(results_dir, filename)
-            print(f"Processing file: {filename}")
-            found_files += 1
-            with open(filepath, 'r', encoding='utf-8-sig') as f:
-                content = f.read()
-                # Find the first '{' character to start parsing JSON
-                json_start_index = content.find('{')
-                if json_start_index != -1:
-                    json_content = content[json_start_index:]
-                    try:
-                        data = json.loads(json_content)
-                        # Basic validation
-                        if 'test_type' in data and 'test_results' in data:
-                            if data.get('test_type') == 'initial':
-                                initial_results.append(data)
-                            elif data.get('test_type') == 'continuous':
-                                continuous_results.append(data)
-                            else:
-                                print(f"Warning: Unknown test_type '{data.get('test_type')}' in file {filename}")
-                        else:
-                             print(f"Warning: Missing 'test_type' or 'test_results' in file {filename}")
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON from file {filename}: {e}")
-                else:
-                    print(f"Could not find JSON start in file {filename}")
+    for filepath in find_result_files(results_dir, timestamp):
+        filename = os.path.basename(filepath)
+        print(f"Processing file: {filename}")
+        found_files += 1
+        # Skips the BOM and any evaluator output printed before the JSON document
+        data = read_result_file(filepath)
+        if data is None:
+            print(f"Could not find a results JSON document in file {filename}")
+        elif data.get('test_type') == 'initial':
+            initial_results.append(data)
+        elif data.get('test_type') == 'continuous':
+            continuous_results.append(data)
+        elif 'test_type' not in data:
+            print(f"Warning: Missing 'test_type' in file {filename}")
+        else:
+            print(f"Warning: Unknown test_type '{data.get('test_type')}' in file {filename}")
     
     print(f"Found {found_files} files matching the timestamp.")
     print(f"Loaded {len(initial_results)} initial results and {len(continuous_results)} continuous results.")
@@ -111,6 +127,10 @@ def analyze_performance(results: List[Dict], test_type: str) -> pd.DataFrame:
         model = result.get('model', 'Unknown Model')
         context_length = result.get('context_length', 'N/A')
         api_type = result.get('api_type', 'unknown') 
+        run_timeline = (result.get('load_test') or {}).get('resource_timeline')
+        workload = result.get('workload_profile') # Prompt/response lengths sampled from real Caret requests
+        workload_name = os.path.basename(workload.get('path') or 'profile') if workload else None
+        config = config_columns(result)
 
         if not result.get('test_results'):
             print(f"Warning: No 'test_results' found for model {model} in {test_type} data.")
@@ -129,9 +149,17 @@ def analyze_performance(results: List[Dict], test_type: str) -> pd.DataFrame:
                 
                 gpu_memory_util = None
                 gpu_util = None
-                
+                ram_peak_percent = None
+
+                # Prefer the background-sampled peak (per request, else per concurrent run) over start/end snapshots
+                timeline = metrics.get('resource_timeline') or run_timeline
+                if isinstance(timeline, dict):
+                    gpu_memory_util = timeline.get('peak_gpu_memory_util')
+                    gpu_util = timeline.get('peak_gpu_util')
+                    ram_peak_percent = timeline.get('peak_ram_percent')
+
                 try:
-                    if gpu_stats_start and gpu_stats_end:
+                    if gpu_memory_util is None and gpu_stats_start and gpu_stats_end:
                         start_memory = max((stat.get('memory_util', 0) for stat in gpu_stats_start), default=0)
                         end_memory = max((stat.get('memory_util', 0) for stat in gpu_stats_end), default=0)
                         gpu_memory_util = max(start_memory, end_memory)
@@ -142,6 +170,13 @@ def analyze_performance(results: List[Dict], test_type: str) -> pd.DataFrame:
                 except Exception as e:
                     print(f"Warning: Error processing GPU stats for {model}, scenario {scenario_id}: {e}")
 
+                # Runs recorded before the prefill/decode split only have Ollama's prompt_eval numbers
+                prompt_tokens = metrics.get('prompt_tokens', metrics.get('api_prompt_eval_count'))
+                prefill_time = metrics.get('prefill_time', metrics.get('api_prompt_eval_duration_sec'))
+                prefill_tps = metrics.get('prefill_tokens_per_second')
+                if prefill_tps is None and prompt_tokens and prefill_time:
+                    prefill_tps = prompt_tokens / prefill_time
+
 
                 performance_data.append({
                     'model': model,
@@ -149,20 +184,241 @@ def analyze_performance(results: List[Dict], test_type: str) -> pd.DataFrame:
                     'test_type': test_type,
                     'api_type': api_type, 
                     'scenario': scenario_id,
+                    'workload': workload_name,
+                    **config, # config_id plus server.<flag> / sampling.<name> (sweep_runner.py)
+                    'turn': test.get('turn'), # Multi-turn sessions only (0-based)
+                    'probe_role': test.get('probe_role'), # Prefix cache probe only (cold/warm/control)
+                    'batch_size': metrics.get('batch_size'), # Offline batch mode only (prompts per /v1/completions request)
+                    'cancel_role': test.get('cancel_role'), # Cancellation test only (idle/followup)
+                    'output_length_target': test.get('output_length_target'), # Output-length sweep only (pinned max_tokens)
+                    'cold_role': test.get('cold_role'), # Cold-start test only (first/warm/cold/followup)
+                    'conversation_tokens': metrics.get('conversation_tokens'),
                     'total_time': metrics.get('total_time'),
                     'time_to_first_token': metrics.get('time_to_first_token'),
+                    'connection_reused': metrics.get('connection_reused'), # None for runs recorded before pooling
                     'tokens_per_second': metrics.get('tokens_per_second_calculated'), # Use calculated TPS
                     'api_tokens_per_second': metrics.get('api_tokens_per_second'), # API reported TPS (if available)
                     'generated_tokens': metrics.get('generated_tokens'),
+                    'generated_tokens_source': metrics.get('generated_tokens_source', 'tiktoken:cl100k_base (legacy)'), # server_usage or tokenizer:<name>
+                    'prompt_tokens': prompt_tokens,
+                    'prompt_tokens_source': metrics.get('prompt_tokens_source'), # server_usage or tokenizer:<name>
+                    'prompt_fill_tokens': metrics.get('prompt_fill_tokens', 0), # Repository code padded in for the context sweep
+                    'prefill_time': prefill_time,
+                    'prefill_time_source': metrics.get('prefill_time_source'), # server (Ollama prompt_eval_duration) or ttft
+                    'prefill_tokens_per_second': prefill_tps,
+                    'decode_tokens_per_second': metrics.get('decode_tokens_per_second', metrics.get('api_tokens_per_second')),
+                    'itl_p50': metrics.get('itl_p50'), # Inter-token latency (if timeline was captured)
+                    'itl_p99': metrics.get('itl_p99'),
+                    'longest_stall_sec': metrics.get('longest_stall_sec'),
                     'gpu_memory_util': gpu_memory_util,
-                    'gpu_util': gpu_util
+                    'gpu_util': gpu_util,
+                    'ram_peak_percent': ram_peak_percent
                 })
             else:
                  print(f"Skipping failed test result for model {model}, scenario {scenario_id}.")
 
     return pd.DataFrame(performance_data)
 
-# --- Plotting ---
+def analyze_saturation(results: List[Dict]) -> pd.DataFrame:
+    """Collects saturation-search summaries (max sustainable throughput under a TTFT SLO) into a DataFrame."""
+    saturation_data = []
+    for result in results:
+        saturation = result.get('saturation')
+        if not saturation:
+            continue
+        saturation_data.append({
+            'model': result.get('model', 'Unknown Model'),
+            'context_length': result.get('context_length', 'N/A'),
+            'api_type': result.get('api_type', 'unknown'),
+            'dimension': saturation.get('dimension'),
+            'slo_ttft_p95': saturation.get('slo_ttft_p95'),
+            'max_sustainable_level': saturation.get('max_sustainable_level'),
+            'max_sustainable_throughput': saturation.get('max_sustainable_throughput'),
+            'max_sustainable_request_rate': saturation.get('max_sustainable_request_rate'),
+            'curve_points': len(saturation.get('curve', [])),
+        })
+    return pd.DataFrame(saturation_data)
+
+def analyze_multi_turn(results: List[Dict]) -> pd.DataFrame:
+    """Collects multi-turn session summaries (TTFT growth as the conversation history grows) into a DataFrame."""
+    session_data = []
+    for result in results:
+        for session in (result.get('multi_turn') or {}).get('sessions', []):
+            session_data.append({
+                'model': result.get('model', 'Unknown Model'),
+                'api_type': result.get('api_type', 'unknown'),
+                'scenario': session.get('scenario_id'),
+                'turns': session.get('successful_turns'),
+                'ttft_first': session.get('ttft_first'),
+                'ttft_last': session.get('ttft_last'),
+                'ttft_growth': session.get('ttft_growth'),
+                'conversation_tokens_last': session.get('conversation_tokens_last'),
+                'ttft_ms_per_1k_tokens': session.get('ttft_ms_per_1k_conversation_tokens'),
+            })
+    return pd.DataFrame(session_data)
+
+def analyze_prefix_probe(results: List[Dict]) -> pd.DataFrame:
+    """Collects shared-prefix cache probe summaries (warm vs control TTFT) into a DataFrame."""
+    probe_data = []
+    for result in results:
+        probe = result.get('prefix_cache_probe')
+        if not probe:
+            continue
+        counters = probe.get('server_prefix_cache_counters') or {}
+        hits = sum(v for k, v in counters.items() if 'hits' in k)
+        queries = sum(v for k, v in counters.items() if 'queries' in k)
+        probe_data.append({
+            'model': result.get('model', 'Unknown Model'),
+            'api_type': result.get('api_type', 'unknown'),
+            'prefix_tokens': probe.get('prefix_tokens'),
+            'pairs': probe.get('pairs'),
+            'cold_ttft': probe.get('cold_ttft_mean'),
+            'warm_ttft': probe.get('warm_ttft_mean'),
+            'control_ttft': probe.get('control_ttft_mean'),
+            'ttft_reduction_sec': probe.get('ttft_reduction_sec'),
+            'ttft_reduction_pct': probe.get('ttft_reduction_pct'),
+            'server_hit_rate_pct': hits / queries * 100 if queries else None, # vLLM /metrics, None for other backends
+        })
+    return pd.DataFrame(probe_data)
+
+def analyze_batch(results: List[Dict]) -> pd.DataFrame:
+    """Collects offline batch-mode summaries (one /v1/completions request per prompt list) into a DataFrame."""
+    batch_data = []
+    for result in results:
+        batch = result.get('batch_test')
+        if not batch:
+            continue
+        batch_data.append({
+            'model': result.get('model', 'Unknown Model'),
+            'api_type': result.get('api_type', 'unknown'),
+            'batch_size': batch.get('batch_size'),
+            'n': batch.get('n'),
+            'items': batch.get('successful_items'),
+            'aggregate_tokens_per_second': batch.get('aggregate_tokens_per_second'),
+            'item_latency_p50': batch.get('item_latency_p50'),
+            'item_latency_p99': batch.get('item_latency_p99'),
+            'ttft_p50': batch.get('ttft_p50'),
+        })
+    return pd.DataFrame(batch_data)
+
+def analyze_cancellation(results: List[Dict]) -> pd.DataFrame:
+    """Collects client-abort cancellation summaries (how long the server keeps decoding after a disconnect) into a DataFrame."""
+    cancel_data = []
+    for result in results:
+        cancellation = result.get('cancellation')
+        if not cancellation:
+            continue
+        tokens, seconds = cancellation.get('abort_after_tokens'), cancellation.get('abort_after_sec')
+        cancel_data.append({
+            'model': result.get('model', 'Unknown Model'),
+            'api_type': result.get('api_type', 'unknown'),
+            'abort_after': ' / '.join(filter(None, [f"{tokens} tokens" if tokens else None, f"{seconds}s" if seconds else None])),
+            'trials': cancellation.get('trials'),
+            'time_to_abort': cancellation.get('time_to_abort_mean'),
+            'release_sec': cancellation.get('release_sec_mean'),
+            'idle_ttft': cancellation.get('idle_ttft_mean'),
+            'followup_ttft': cancellation.get('followup_ttft_mean'),
+            'followup_ttft_penalty': cancellation.get('followup_ttft_penalty_mean'),
+            'wasted_decode_sec': cancellation.get('wasted_decode_sec'),
+            'wasted_decode_source': cancellation.get('wasted_decode_source'),
+        })
+    return pd.DataFrame(cancel_data)
+
+def analyze_output_lengths(results: List[Dict]) -> pd.DataFrame:
+    """Collects output-length sweep summaries (decode throughput per pinned response length) into a DataFrame."""
+    length_data = []
+    for result in results:
+        for row in result.get('output_length_sweep') or []:
+            length_data.append({
+                'model': result.get('model', 'Unknown Model'),
+                'api_type': result.get('api_type', 'unknown'),
+                'output_tokens': row.get('output_tokens'),
+                'requests': row.get('successful_requests'),
+                'generated_tokens': row.get('generated_tokens_mean'),
+                'reached_target_pct': row.get('reached_target_pct'),
+                'ttft': row.get('ttft_mean'),
+                'decode_tokens_per_second': row.get('decode_tokens_per_second_mean'),
+                'itl_p99': row.get('itl_p99_mean'),
+            })
+    return pd.DataFrame(length_data)
+
+def analyze_cold_start(results: List[Dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Collects cold-start measurements into (readiness/first-request, Ollama keep_alive) DataFrames.
+
+    Readiness comes from run_test.py --cold-start and from the sweep_runner.py launchers (one row per server start).
+    """
+    ready_data, keep_alive_data, launches_seen = [], [], set()
+    for result in results:
+        model, api_type = result.get('model', 'Unknown Model'), result.get('api_type', 'unknown')
+        cold_start = result.get('cold_start')
+        if cold_start:
+            disk = cold_start.get('ready_disk_read_bytes')
+            ready_data.append({
+                'model': model,
+                'api_type': api_type,
+                'source': f"cold-start ({cold_start.get('ready_reference')})",
+                'time_to_ready': cold_start.get('time_to_ready_sec'),
+                'ready_disk_read_mb': disk / 1e6 if disk is not None else None,
+                'first_ttft': cold_start.get('first_ttft'),
+                'warm_ttft': cold_start.get('warm_ttft_mean'),
+                'first_request_penalty': cold_start.get('first_request_penalty_sec'),
+                'first_load_sec': cold_start.get('first_load_sec'),
+            })
+            for row in cold_start.get('keep_alive') or []:
+                keep_alive_data.append(dict({'model': model, 'api_type': api_type}, **row))
+        launcher = (result.get('sweep') or {}).get('launcher') or {}
+        launch_key = (model, launcher.get('command'), launcher.get('time_to_ready_sec'))
+        if launcher.get('time_to_ready_sec') is not None and launch_key not in launches_seen:
+            launches_seen.add(launch_key) # All configurations run on one server start share its launcher record
+            disk = launcher.get('ready_disk_read_bytes')
+            ready_data.append({
+                'model': model,
+                'api_type': api_type,
+                'source': f"sweep {launcher.get('type')} ({result['sweep'].get('config_id')})",
+                'time_to_ready': launcher['time_to_ready_sec'],
+                'ready_disk_read_mb': disk / 1e6 if disk is not None else None,
+            })
+    keep_alive_df = pd.DataFrame(keep_alive_data)
+    for column in ('cold_disk_read_bytes', 'followup_disk_read_bytes'):
+        if column in keep_alive_df.columns:
+            keep_alive_df[column.replace('_bytes', '_mb')] = keep_alive_df.pop(column) / 1e6
+    return pd.DataFrame(ready_data), keep_alive_df
+
+def analyze_schedule(results: List[Dict]) -> pd.DataFrame:
+    """One row per model load group of a batch_session.py --schedule run (Ollama), aggregated over the group's runs."""
+    groups = {}
+    for result in results:
+        schedule = result.get('schedule')
+        if not schedule:
+            continue
+        row = groups.setdefault(schedule['group'], {
+            'group': schedule['group'],
+            'model': schedule['load_model'],
+            'num_ctx': schedule['load_num_ctx'],
+            'runs': 0,
+            'loads': [],
+            'idle_max_sec': None,
+            'idle_expiries': 0,
+            'prefetched': schedule['prefetched'],
+            'prefetch_hidden_sec': schedule.get('prefetch_hidden_sec'),
+            'original_loads': schedule['original_loads'],
+            'scheduled_loads': schedule['scheduled_loads'],
+            'baseline_keep_alive_sec': schedule['baseline_keep_alive_sec'],
+        })
+        row['runs'] += 1
+        row['loads'] += [test['result']['metrics']['api_load_duration_sec'] for test in result.get('test_results', [])
+                         if test['result'].get('success') and (test['result']['metrics'].get('api_load_duration_sec') or 0) > schedule['load_detect_sec']]
+        if schedule['prefetched'] and schedule['first_in_group']:
+            row['loads'].append(schedule['prefetch_load_sec'])
+        idle = schedule.get('idle_before_sec')
+        if idle is not None:
+            row['idle_max_sec'] = max(idle, row['idle_max_sec'] or 0.0)
+            row['idle_expiries'] += idle > schedule['baseline_keep_alive_sec']
+    rows = []
+    for row in groups.values():
+        loads = row.pop('loads')
+        rows.append(dict(row, observed_loads=len(loads), load_sec=sum(loads) / len(loads) if loads else None, load_sec_total=sum(loads)))
+    return pd.DataFrame(rows)
 
 def generate_performance_plots(initial_df: pd.DataFrame, continuous_df: pd.DataFrame, output_dir: str, timestamp: str):
     """Generates performance metric plots."""
@@ -248,7 +504,12 @@ def generate_performance_plots(initial_df: pd.DataFrame, continuous_df: pd.DataF
 
 # --- Report Generation ---
 
-def generate_markdown_report(initial_df: pd.DataFrame, continuous_df: pd.DataFrame, output_dir: str, timestamp: str):
+def generate_markdown_report(initial_df: pd.DataFrame, continuous_df: pd.DataFrame, output_dir: str, timestamp: str,
+                             saturation_df: Optional[pd.DataFrame] = None, multi_turn_df: Optional[pd.DataFrame] = None,
+                             prefix_probe_df: Optional[pd.DataFrame] = None, batch_df: Optional[pd.DataFrame] = None,
+                             cancellation_df: Optional[pd.DataFrame] = None, output_length_df: Optional[pd.DataFrame] = None,
+                             group_by: Optional[List[str]] = None, cold_start_df: Optional[pd.DataFrame] = None,
+                             keep_alive_df: Optional[pd.DataFrame] = None, schedule_df: Optional[pd.DataFrame] = None):
     """Generates a markdown report summarizing the performance."""
     
     report = f"""# sLLM Performance Test Report
@@ -269,6 +530,19 @@ Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
     report += f"- Tested Models: {', '.join(sorted(list(all_models))) if all_models else 'N/A'}\n"
     report += f"- Context Lengths: {', '.join(map(str, sorted([c for c in all_contexts if c != 'N/A']))) if all_contexts else 'N/A'}\n" # Filter out N/A
 
+    # Where generated token counts (and therefore calculated TPS) came from, per model
+    token_sources = [df[['model', 'generated_tokens_source']] for df in (initial_df, continuous_df) if is_valid_df(df, ['model', 'generated_tokens_source'])]
+    if token_sources:
+        sources_by_model = pd.concat(token_sources).groupby('model')['generated_tokens_source'].unique()
+        report += "- Token Count Sources: " + "; ".join(f"{model}: {', '.join(sorted(sources))}" for model, sources in sources_by_model.items()) + "\n"
+
+    workload_frames = [df[['workload', 'prompt_tokens', 'generated_tokens']] for df in (initial_df, continuous_df) if is_valid_df(df, ['workload'])]
+    workload_df = pd.concat(workload_frames).dropna(subset=['workload']) if workload_frames else pd.DataFrame()
+    if not workload_df.empty:
+        workload_means = workload_df.groupby('workload')[['prompt_tokens', 'generated_tokens']].mean()
+        report += "- Workload Profiles (mean prompt / generated tokens): " + "; ".join(
+            f"{name}: {row.prompt_tokens:.0f} / {row.generated_tokens:.0f}" for name, row in workload_means.iterrows()) + "\n"
+
     report += """
 ## 2. Performance Analysis Summary
 """
@@ -328,17 +602,25 @@ Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             continuous_mem = safe_mean(model_cont['gpu_memory_util']) if is_valid_df(model_cont, ['gpu_memory_util']) else np.nan
             initial_gpu = safe_mean(model_init['gpu_util']) if is_valid_df(model_init, ['gpu_util']) else np.nan
             continuous_gpu = safe_mean(model_cont['gpu_util']) if is_valid_df(model_cont, ['gpu_util']) else np.nan
+            initial_prefill = safe_mean(model_init['prefill_tokens_per_second']) if is_valid_df(model_init, ['prefill_tokens_per_second']) else np.nan
+            continuous_prefill = safe_mean(model_cont['prefill_tokens_per_second']) if is_valid_df(model_cont, ['prefill_tokens_per_second']) else np.nan
+            initial_decode = safe_mean(model_init['decode_tokens_per_second']) if is_valid_df(model_init, ['decode_tokens_per_second']) else np.nan
+            continuous_decode = safe_mean(model_cont['decode_tokens_per_second']) if is_valid_df(model_cont, ['decode_tokens_per_second']) else np.nan
 
             report += f"""
 #### {model}
 - Initial Loading:
   * Avg. Response Time: {initial_time:.2f}s
   * Avg. Tokens/Second: {initial_tps:.2f}
+  * Avg. Prefill Tokens/Second: {initial_prefill:.2f}
+  * Avg. Decode Tokens/Second: {initial_decode:.2f}
   * Avg. Max GPU Memory: {initial_mem:.2f}%
   * Avg. Max GPU Utilization: {initial_gpu:.2f}%
 - Continuous Response:
   * Avg. Response Time: {continuous_time:.2f}s
   * Avg. Tokens/Second: {continuous_tps:.2f}
+  * Avg. Prefill Tokens/Second: {continuous_prefill:.2f}
+  * Avg. Decode Tokens/Second: {continuous_decode:.2f}
   * Avg. Max GPU Memory: {continuous_mem:.2f}%
   * Avg. Max GPU Utilization: {continuous_gpu:.2f}%
 - Performance Change (Time): {improvement:.2f}%
@@ -349,6 +631,198 @@ Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
          report += "\nNo models found in the results.\n"
 
 
+    if is_valid_df(saturation_df, ['model', 'max_sustainable_throughput']):
+        report += """
+### 2.4 Max Sustainable Throughput (TTFT p95 SLO)
+```
+{}
+```
+""".format(saturation_df.sort_values(['model', 'context_length']).to_string(index=False))
+
+    # Cold (new TCP connection) vs warm (pooled keep-alive) TTFT
+    reuse_frames = [df[['model', 'connection_reused', 'time_to_first_token']] for df in (initial_df, continuous_df)
+                    if is_valid_df(df, ['model', 'connection_reused', 'time_to_first_token'])]
+    reuse_df = pd.concat(reuse_frames).dropna(subset=['connection_reused']) if reuse_frames else pd.DataFrame()
+    if not reuse_df.empty:
+        reuse_df = reuse_df.assign(connection=reuse_df['connection_reused'].map({True: 'warm', False: 'cold'}))
+        report += """
+### 2.5 TTFT by Connection State (cold = new connection, warm = reused)
+```
+{}
+```
+""".format(reuse_df.groupby(['model', 'connection'])['time_to_first_token'].agg(['count', 'mean', 'median', 'min', 'max']).to_string())
+
+    # Context sweep: prompts padded towards each context length, so prefill cost grows with the context
+    sweep_frames = [df for df in (initial_df, continuous_df) if is_valid_df(df, ['model', 'context_length', 'prompt_tokens', 'prefill_tokens_per_second'])]
+    sweep_df = pd.concat(sweep_frames) if sweep_frames else pd.DataFrame()
+    if not sweep_df.empty:
+        sweep_df = sweep_df[sweep_df['context_length'] != 'N/A'].dropna(subset=['prompt_tokens'])
+    if not sweep_df.empty:
+        report += """
+### 2.6 Context Length Sweep (prompt tokens, TTFT, prefill and decode throughput)
+```
+{}
+```
+""".format(sweep_df.groupby(['model', 'context_length'])[['prompt_tokens', 'time_to_first_token', 'prefill_tokens_per_second', 'decode_tokens_per_second']].mean().to_string())
+
+    # Prompt-side (prefill) and output-side (decode) cost separately, for sizing prompt-heavy vs output-heavy workloads
+    phase_frames = [df for df in (initial_df, continuous_df) if is_valid_df(df, ['model', 'api_type', 'prompt_tokens', 'prefill_time', 'decode_tokens_per_second'])]
+    phase_df = pd.concat(phase_frames).dropna(subset=['prompt_tokens']) if phase_frames else pd.DataFrame()
+    if not phase_df.empty:
+        phase_columns = ['prompt_tokens', 'prefill_time', 'prefill_tokens_per_second', 'generated_tokens', 'decode_tokens_per_second']
+        phase_table = phase_df.groupby(['model', 'api_type'])[phase_columns].mean()
+        sources = phase_df.fillna({'prompt_tokens_source': 'legacy', 'prefill_time_source': 'legacy'}).groupby(['model', 'api_type'])
+        phase_table['prompt_tokens_source'] = sources['prompt_tokens_source'].agg(lambda v: ', '.join(sorted(set(v))))
+        phase_table['prefill_time_source'] = sources['prefill_time_source'].agg(lambda v: ', '.join(sorted(set(v))))
+        report += """
+### 2.7 Prefill vs Decode (mean per request)
+prefill_time comes from the server (Ollama prompt_eval_duration) where reported, otherwise from the client-side TTFT,
+which also includes queueing and network time.
+```
+{}
+```
+""".format(phase_table.to_string())
+
+    # Multi-turn sessions: TTFT per turn while the re-sent history grows (flat TTFT = prefix cache reuse)
+    turn_frames = [df for df in (initial_df, continuous_df) if is_valid_df(df, ['model', 'api_type', 'turn', 'conversation_tokens'])]
+    turn_df = pd.concat(turn_frames).dropna(subset=['turn']) if turn_frames else pd.DataFrame()
+    if not turn_df.empty:
+        turn_df = turn_df.assign(turn=turn_df['turn'].astype(int) + 1)
+        report += """
+### 2.8 Multi-turn Sessions (TTFT by turn)
+Each turn re-sends the whole conversation. With working prefix caching only the new tokens are prefilled, so TTFT stays
+roughly flat as conversation_tokens grows; without it TTFT grows with the conversation (about 1000 / prefill tokens/s ms per 1k tokens).
+```
+{}
+```
+""".format(turn_df.groupby(['model', 'api_type', 'turn'])[['conversation_tokens', 'prompt_tokens', 'time_to_first_token']].mean().to_string())
+        if is_valid_df(multi_turn_df, ['model', 'ttft_ms_per_1k_tokens']):
+            report += """
+Per session:
+```
+{}
+```
+""".format(multi_turn_df.sort_values(['model', 'api_type', 'scenario']).to_string(index=False))
+
+    # Shared-prefix probe: warm (same prefix, new question) vs control (fresh prefix of the same length, same question)
+    if is_valid_df(prefix_probe_df, ['model', 'warm_ttft', 'control_ttft']):
+        report += """
+### 2.9 Prefix Cache Probe (shared prefix, different question)
+warm re-sends a prefix the server has just seen; control sends an unseen prefix of the same length with the same question.
+ttft_reduction = control - warm is the prefill time the server saves by reusing the cached prefix (about 0 when caching is off).
+```
+{}
+```
+""".format(prefix_probe_df.sort_values(['model', 'api_type']).to_string(index=False))
+
+    # Offline batch mode vs streaming the same prompts one at a time (rows without batch_size)
+    if is_valid_df(batch_df, ['model', 'api_type', 'aggregate_tokens_per_second']):
+        batch_table = batch_df.copy()
+        streamed_frames = [df for df in (initial_df, continuous_df) if is_valid_df(df, ['model', 'api_type', 'batch_size', 'generated_tokens', 'total_time'])]
+        streamed = pd.concat(streamed_frames) if streamed_frames else pd.DataFrame()
+        streamed = streamed[streamed['batch_size'].isna() & streamed['turn'].isna() & streamed['probe_role'].isna() & streamed['cancel_role'].isna()
+                            & streamed['output_length_target'].isna() & streamed['cold_role'].isna()] if not streamed.empty else streamed
+        if not streamed.empty:
+            # One request at a time: tokens generated over the summed request times
+            sums = streamed.groupby(['model', 'api_type'])[['generated_tokens', 'total_time']].sum()
+            sequential_tps = (sums['generated_tokens'] / sums['total_time']).rename('sequential_tokens_per_second')
+            batch_table = batch_table.join(sequential_tps, on=['model', 'api_type'])
+            batch_table['speedup'] = batch_table['aggregate_tokens_per_second'] / batch_table['sequential_tokens_per_second']
+        report += """
+### 2.10 Offline Batch Throughput (prompt list in one /v1/completions request)
+aggregate = generated tokens / batch request time; sequential = the same timestamp's streamed requests sent one at a time.
+item_latency is the time until each item's last token, i.e. what a bulk job waits for every result.
+```
+{}
+```
+""".format(batch_table.sort_values(['model', 'api_type', 'batch_size']).to_string(index=False))
+
+    # Client-abort cancellation: GPU time spent on responses nobody reads any more
+    if is_valid_df(cancellation_df, ['model', 'api_type', 'wasted_decode_sec']):
+        report += """
+### 2.11 Cancellation (decode time wasted after a client abort)
+release_sec: abort until the server dropped the request (vLLM /metrics num_requests_running, Ollama /api/ps expires_at).
+followup_ttft_penalty: extra TTFT of a short request sent right after an abort, compared with the same request on an idle server.
+wasted_decode_sec uses release_sec where the backend exposes it, otherwise the follow-up penalty.
+```
+{}
+```
+""".format(cancellation_df.sort_values(['model', 'api_type']).to_string(index=False))
+
+    # Decode speed as the response grows (KV cache and attention cost per token increase with length)
+    if is_valid_df(output_length_df, ['model', 'api_type', 'output_tokens', 'decode_tokens_per_second']):
+        report += """
+### 2.12 Decode Throughput by Output Length (pinned max_tokens)
+vLLM is held to the target with ignore_eos/min_tokens; Ollama and TGI only cap the response, so rows with
+reached_target_pct below 100 stopped early at EOS and measure a shorter response than output_tokens.
+```
+{}
+```
+""".format(output_length_df.sort_values(['model', 'api_type', 'output_tokens']).to_string(index=False))
+
+    # Server configuration matrix (sweep_runner.py), or any --group-by columns for ordinary runs
+    config_frames = [df for df in (initial_df, continuous_df) if is_valid_df(df, ['config_id', 'time_to_first_token'])]
+    config_rows = pd.concat(config_frames) if config_frames else pd.DataFrame()
+    if not config_rows.empty and not group_by:
+        config_rows = config_rows[config_rows['config_id'].notna()]
+    config_group = config_group_columns(config_rows, group_by) if not config_rows.empty else []
+    if config_group:
+        config_metrics = ['time_to_first_token', 'prefill_tokens_per_second', 'decode_tokens_per_second', 'itl_p99', 'total_time']
+        grouped = config_rows.groupby(config_group, dropna=False)
+        config_table = grouped[config_metrics].mean()
+        config_table.insert(0, 'requests', grouped.size())
+        report += """
+### 2.13 Configuration Comparison (mean per request, grouped by {})
+```
+{}
+```
+""".format(', '.join(config_group), config_table.to_string())
+
+    # Cold start: server readiness, first request after ready and Ollama model loads per keep_alive
+    if is_valid_df(cold_start_df, ['model', 'api_type', 'time_to_ready']):
+        report += """
+### 2.14 Cold Start (time to ready, first request, model load)
+time_to_ready counts from the server start (--server-start-time or the sweep launcher's server command), or from the
+cold-start mode start when neither is known. first_request_penalty = first TTFT after ready - warm TTFT of the same prompt.
+Disk reads are system-wide (psutil) and only meaningful when the server runs on this machine; 0 MB on a reload means
+the weights came from the page cache.
+```
+{}
+```
+""".format(cold_start_df.sort_values(['model', 'api_type']).to_string(index=False))
+        if is_valid_df(keep_alive_df, ['keep_alive', 'cold_load_sec']):
+            report += """
+Ollama keep_alive: each row unloads the model, sends a cold request with that keep_alive, waits gap_sec and sends a follow-up.
+loaded_after_gap shows whether the model was still in memory (/api/ps); followup_load_sec is the reload cost when it was not.
+```
+{}
+```
+""".format(keep_alive_df.assign(keep_alive=keep_alive_df['keep_alive'].astype(str)).to_string(index=False))
+
+    # Model-swap-aware batch schedule (Ollama): loads per group and the wall-clock saved against the unscheduled order
+    if is_valid_df(schedule_df, ['group', 'observed_loads', 'original_loads', 'scheduled_loads']):
+        schedule_df = schedule_df.sort_values('group')
+        observed = int(schedule_df['observed_loads'].sum())
+        mean_load = schedule_df['load_sec_total'].sum() / observed if observed else 0.0
+        original_loads, scheduled_loads = int(schedule_df['original_loads'].iloc[0]), int(schedule_df['scheduled_loads'].iloc[0])
+        expiries = int(schedule_df['idle_expiries'].sum())
+        hidden = schedule_df['prefetch_hidden_sec'].fillna(0).sum()
+        baseline_loads = original_loads + expiries
+        saved = (baseline_loads - scheduled_loads) * mean_load + hidden
+        report += """
+### 2.15 Model Swap Schedule (Ollama, batch_session.py --schedule)
+Runs are grouped per (model, num_ctx) load and each model is pinned with keep_alive while its group runs.
+The baseline is the same runs without --schedule: the original order with the server default keep_alive ({:g}s), which pays one load
+per load unit change plus one per idle gap between runs longer than that keep_alive (idle_expiries, measured in this session).
+Model loads: baseline {} ({} load unit changes + {} idle expiries), scheduled {}, observed {} (load_duration > detection threshold or prefetch).
+Estimated wall-clock saved: {:.1f}s ({} avoided loads x {:.2f}s mean observed load + {:.1f}s of prefetch overlapped with the previous group).
+```
+{}
+```
+""".format(schedule_df['baseline_keep_alive_sec'].iloc[0], baseline_loads, original_loads, expiries, scheduled_loads, observed,
+           saved, baseline_loads - scheduled_loads, mean_load, hidden,
+           schedule_df.drop(columns=['original_loads', 'scheduled_loads', 'baseline_keep_alive_sec', 'load_sec_total']).to_string(index=False))
+
     report += """
 ## 3. GPU Resource Usage Summary
 
@@ -401,9 +875,11 @@ GPU Usage:
     
     if all_models:
         characteristics_available = False
+        # Keep the columns on a missing test type (e.g. a probe-only initial run) so the means below come out as NaN
+        no_data = pd.DataFrame(columns=['total_time', 'tokens_per_second', 'gpu_memory_util'], dtype=float)
         for model in sorted(list(all_models)):
-            model_init = initial_df[initial_df['model'] == model] if is_valid_df(initial_df, ['model']) else pd.DataFrame()
-            model_cont = continuous_df[continuous_df['model'] == model] if is_valid_df(continuous_df, ['model']) else pd.DataFrame()
+            model_init = initial_df[initial_df['model'] == model] if is_valid_df(initial_df, ['model']) else no_data
+            model_cont = continuous_df[continuous_df['model'] == model] if is_valid_df(continuous_df, ['model']) else no_data
 
             if model_init.empty and model_cont.empty:
                 continue # Skip if no data for this model
@@ -488,18 +964,14 @@ GPU Usage:
 
 # --- Main Execution ---
 
-def main():
-    parser = argparse.ArgumentParser(description='Generate sLLM performance test report')
-    parser.add_argument('--results-dir', required=True, help='Directory containing JSON result files')
-    parser.add_argument('--timestamp', required=True, help='Timestamp used in the result filenames (e.g., YYYYMMDD_HHMMSS)')
-    args = parser.parse_args()
-    
-    if not os.path.isdir(args.results_dir):
-        print(f"Error: Results directory not found: {args.results_dir}")
+def build_report(results_dir: str, timestamp: str, group_by: Optional[List[str]] = None):
+    """Loads, analyzes and writes plots plus the markdown report for one timestamp (group_by: columns for section 2.13)."""
+    if not os.path.isdir(results_dir):
+        print(f"Error: Results directory not found: {results_dir}")
         return
 
     # Load results
-    initial_results, continuous_results = load_results(args.results_dir, args.timestamp)
+    initial_results, continuous_results = load_results(results_dir, timestamp)
     
     if not initial_results and not continuous_results:
         print("Error: No valid result files found for the given timestamp. Cannot generate report.")
@@ -511,12 +983,39 @@ def main():
     
     # Generate plots (only if data exists)
     if not initial_df.empty or not continuous_df.empty:
-        generate_performance_plots(initial_df, continuous_df, args.results_dir, args.timestamp)
+        generate_performance_plots(initial_df, continuous_df, results_dir, timestamp)
     else:
         print("Skipping plot generation as no valid performance data was loaded.")
         
+    saturation_df = analyze_saturation(initial_results + continuous_results)
+
+    multi_turn_df = analyze_multi_turn(initial_results + continuous_results)
+
+    prefix_probe_df = analyze_prefix_probe(initial_results + continuous_results)
+
+    batch_df = analyze_batch(initial_results + continuous_results)
+
+    cancellation_df = analyze_cancellation(initial_results + continuous_results)
+
+    output_length_df = analyze_output_lengths(initial_results + continuous_results)
+
+    cold_start_df, keep_alive_df = analyze_cold_start(initial_results + continuous_results)
+
+    schedule_df = analyze_schedule(initial_results + continuous_results)
+
     # Generate report
-    generate_markdown_report(initial_df, continuous_df, args.results_dir, args.timestamp)
+    generate_markdown_report(initial_df, continuous_df, results_dir, timestamp, saturation_df, multi_turn_df, prefix_probe_df, batch_df,
+                             cancellation_df, output_length_df, group_by, cold_start_df, keep_alive_df, schedule_df)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate sLLM performance test report')
+    parser.add_argument('--results-dir', required=True, help='Directory containing JSON result files')
+    parser.add_argument('--timestamp', required=True, help='Timestamp used in the result filenames (e.g., YYYYMMDD_HHMMSS)')
+    parser.add_argument('--group-by', nargs='+', default=None,
+                        help='Columns to compare runs by in section 2.13, e.g. server.quantization sampling.temperature context_length')
+    args = parser.parse_args()
+
+    build_report(args.results_dir, args.timestamp, args.group_by)
 
 if __name__ == '__main__':
     main()
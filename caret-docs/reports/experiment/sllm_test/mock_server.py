@@ -0,0 +1,711 @@
+#!/usr/bin/env python3
+"""
+로컬 모의 추론 서버 (Ollama / OpenAI 호환 스트리밍).
+
+GPU 장비에서 vLLM/Ollama 를 띄우지 않고도 run_test.py 하네스 자체의 처리량과 타이밍 정확도를 측정하기 위한 서버입니다.
+표준 라이브러리(ThreadingHTTPServer)만 사용하며 다음 엔드포인트를 제공합니다.
+  - POST /api/generate, /api/chat       : Ollama NDJSON 스트림 (마지막 청크에 eval_count/eval_duration 등 포함)
+  - POST /v1/chat/completions, /v1/completions : OpenAI SSE 스트림 (stream_options.include_usage 지원)
+    /v1/completions 는 vLLM 처럼 prompt 목록과 n 을 받아, 항목별 응답을 동시에 진행하며 choices[].index 로 구분해 보냅니다.
+  - GET  /health, /api/ps, /api/tags, /v1/models, /metrics (vLLM 과 같은 이름의 Prometheus 게이지)
+
+응답 타이밍은 ResponsePlan (토큰 목록 + 요청 시작 기준 토큰별 송신 시각) 으로 정해지며,
+기본 SyntheticSource 는 --prefill-delay, --prefill-tokens-per-second, --tokens-per-second, --jitter, --seed 로 계획을 만들고,
+응답 길이는 --response-tokens 를 max_tokens 로 자르되 vLLM 의 ignore_eos/min_tokens 가 있으면 그만큼 늘립니다.
+--prefix-cache 를 주면 vLLM 의 automatic prefix caching 처럼 이전 요청과 겹치는 앞부분(16 토큰 블록 단위)은 prefill 시간에서 뺍니다.
+replay_server.py 처럼 다른 plan source 를 create_server() 에 넘겨 재사용할 수 있습니다.
+--max-concurrency 를 넘는 요청은 대기열에서 기다리며 (대기 시간은 TTFT 에 포함), --reject-when-busy 면 503 을 반환합니다.
+클라이언트가 스트림을 끊으면 다음 청크를 쓸 때 중단하고, --ignore-cancel 이면 계획된 마지막 토큰 시각까지 슬롯을 계속 점유합니다
+(취소를 무시하고 decode 를 계속하는 서버 흉내). /api/ps 의 expires_at 은 Ollama 처럼 실행 중 요청이 모두 끝난 시각 + keep_alive
+(요청의 keep_alive, 기본 5분) 이고, 만료된 모델은 /api/ps 에서 빠집니다. --load-delay 를 주면 메모리에 없는 모델의 Ollama 요청은
+그만큼 기다린 뒤 시작하고 load_duration 으로 보고하며, 프롬프트 없는 /api/generate 는 Ollama 처럼 모델을 올리거나 (keep_alive 0 이면) 내립니다.
+--startup-delay 동안은 모든 요청에 503 을 반환해 서버 기동 (모델 로드) 중인 vLLM 을 흉내 냅니다.
+Ollama 처럼 options.num_ctx 가 올라가 있는 값과 다르면 모델을 다시 올리고, --max-loaded-models 를 넘으면 가장 오래 쓰지 않은 모델을 내립니다.
+
+--self-check 는 임시 포트로 서버를 띄우고 run_test.run_api_query 로 측정한 TTFT/디코드 속도를 설정값과 비교합니다.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import run_test # Standard library only at import time; shares the keep_alive parser and the self-check client
+
+WORDS = ('def', 'return', 'self', 'value', 'result', 'for', 'item', 'in', 'range', 'if', 'else', 'None',
+         'import', 'class', 'data', 'index', 'count', 'list', 'dict', 'True', 'False', 'print', 'raise', 'with')
+
+
+PREFIX_CACHE_BLOCK = 16 # Tokens per cached block, as in vLLM's paged KV cache
+KEEP_ALIVE_SEC = 300 # Ollama's default keep_alive, used for the /api/ps expires_at
+
+
+def approximate_tokens(text: str) -> list:
+    """단어/구두점 단위의 근사 토큰 목록을 반환합니다."""
+    return re.findall(r"\w+|[^\w\s]", text or '')
+
+def approximate_token_count(text: str) -> int:
+    """단어/구두점 단위의 근사 토큰 수를 반환합니다 (모의 서버의 prompt_eval_count 용)."""
+    return len(approximate_tokens(text))
+
+class PrefixCache:
+    """이전 프롬프트의 블록 해시(앞 블록들을 연쇄한 해시)를 기억해 새 프롬프트의 캐시된 앞부분 길이를 계산합니다."""
+    def __init__(self, max_blocks: int = 1_000_000):
+        self.max_blocks = max_blocks
+        self.queries = 0 # Prompt tokens looked up (vllm:prefix_cache_queries_total)
+        self.hits = 0 # Prompt tokens served from the cache (vllm:prefix_cache_hits_total)
+        self._blocks = set()
+        self._lock = threading.Lock()
+
+    def lookup_and_insert(self, tokens: list) -> int:
+        """tokens 중 이미 캐시된 앞부분의 토큰 수를 반환하고, tokens 의 모든 완전한 블록을 캐시에 넣습니다."""
+        hashes = []
+        chained = 0
+        for start in range(0, len(tokens) - PREFIX_CACHE_BLOCK + 1, PREFIX_CACHE_BLOCK):
+            chained = hash((chained, tuple(tokens[start:start + PREFIX_CACHE_BLOCK])))
+            hashes.append(chained)
+        with self._lock:
+            hits = 0
+            while hits < len(hashes) and hashes[hits] in self._blocks:
+                hits += 1
+            if len(self._blocks) + len(hashes) > self.max_blocks:
+                self._blocks.clear() # Crude eviction; the mock only needs recent prefixes
+            self._blocks.update(hashes)
+            self.queries += len(tokens)
+            self.hits += hits * PREFIX_CACHE_BLOCK
+        return hits * PREFIX_CACHE_BLOCK
+
+class ResponsePlan:
+    """한 요청의 응답 계획: 보낼 토큰 텍스트와 각 토큰의 송신 시각 (처리 시작 기준 초)."""
+    __slots__ = ('tokens', 'offsets', 'prompt_tokens', 'prefill_sec', 'finish_reason')
+
+    def __init__(self, tokens: list, offsets: list, prompt_tokens: int, prefill_sec: float, finish_reason: str = 'stop'):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.prompt_tokens = prompt_tokens
+        self.prefill_sec = prefill_sec
+        self.finish_reason = finish_reason
+
+    def truncated(self, max_tokens: int):
+        """max_tokens 개까지만 보내는 계획을 반환합니다 (None 이면 그대로)."""
+        if max_tokens is None or max_tokens >= len(self.tokens):
+            return self
+        return ResponsePlan(self.tokens[:max_tokens], self.offsets[:max_tokens], self.prompt_tokens, self.prefill_sec, 'length')
+
+class SyntheticSource:
+    """설정값(prefill 지연, 토큰 속도, 지터)으로 결정적인 합성 응답 계획을 만듭니다.
+
+    첫 토큰은 prefill_delay (+ prefill_tokens_per_second 가 있으면 프롬프트 토큰 수 / prefill_tokens_per_second) 시점에,
+    이후 토큰은 1/tokens_per_second 간격으로 송신됩니다.
+    jitter 는 간격에 곱해지는 ±비율 (0.1 = ±10%, 평균은 유지) 입니다.
+    """
+    def __init__(self, prefill_delay: float = 0.2, tokens_per_second: float = 50.0, jitter: float = 0.0,
+                 response_tokens: int = 128, seed: int = None, prefill_tokens_per_second: float = 0.0,
+                 prefix_cache: bool = False):
+        self.prefill_delay = prefill_delay
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.prefix_cache = PrefixCache() if prefix_cache else None
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.response_tokens = response_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def describe(self) -> dict:
+        return {
+            'source': 'synthetic',
+            'prefill_delay': self.prefill_delay,
+            'prefill_tokens_per_second': self.prefill_tokens_per_second,
+            'prefix_cache': self.prefix_cache is not None,
+            'tokens_per_second': self.tokens_per_second,
+            'jitter': self.jitter,
+            'response_tokens': self.response_tokens,
+        }
+
+    def plan(self, request: dict) -> ResponsePlan:
+        interval = 1.0 / self.tokens_per_second
+        count = self.response_tokens
+        if request.get('ignore_eos') and request.get('max_tokens'):
+            count = request['max_tokens'] # Generates until the cap, as vLLM does with ignore_eos
+        count = max(count, request.get('min_tokens') or 0)
+        with self._lock: # One shared RNG keeps a seeded run reproducible in request order
+            tokens = [self._rng.choice(WORDS) + ' ' for _ in range(count)]
+            factors = [1 + self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 1.0 for _ in range(count - 1)]
+        prompt = approximate_tokens(request['prompt'])
+        prompt_tokens = len(prompt)
+        cached_tokens = self.prefix_cache.lookup_and_insert(prompt) if self.prefix_cache else 0
+        prefill = self.prefill_delay
+        if self.prefill_tokens_per_second:
+            # Long prompts take proportionally longer to the first token; cached prefix blocks are skipped
+            prefill += (prompt_tokens - cached_tokens) / self.prefill_tokens_per_second
+        offsets = [prefill]
+        for factor in factors:
+            offsets.append(offsets[-1] + interval * factor)
+        return ResponsePlan(tokens, offsets, prompt_tokens, prefill)
+
+class MockServerState:
+    """핸들러 스레드들이 공유하는 설정, 동시성 제한, 카운터입니다."""
+    def __init__(self, source, max_concurrency: int = 0, reject_when_busy: bool = False, ignore_cancel: bool = False,
+                 load_delay: float = 0.0, startup_delay: float = 0.0, max_loaded_models: int = 0):
+        self.source = source
+        self.load_delay = load_delay
+        self.max_loaded_models = max_loaded_models
+        self.ready_at = time.monotonic() + startup_delay
+        self.reject_when_busy = reject_when_busy
+        self.ignore_cancel = ignore_cancel
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.requests_total = 0
+        self.requests_rejected = 0
+        self.requests_cancelled = 0
+        self.prompt_tokens_total = 0
+        self.generation_tokens_total = 0
+        self.models = {} # model name -> last request time (for /api/ps)
+        self.expires = {} # model name -> unload time (epoch seconds), reset when the server goes idle
+        self.loaded = {} # Models in "memory" (until their expires time passes) -> num_ctx they were loaded with
+
+    def count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def is_loaded(self, model: str, now: float) -> bool:
+        """모델이 메모리에 있는지 반환합니다 (self.lock 을 잡은 상태에서 호출)."""
+        return model in self.loaded and (self.running > 0 or self.expires.get(model, float('inf')) > now)
+
+    def load(self, model: str, num_ctx: int = None) -> float:
+        """모델을 메모리에 올린 것으로 표시하고, 새로 올려야 했으면 로드 시간 (--load-delay) 을 반환합니다.
+
+        Ollama 처럼 다른 num_ctx 로 요청하면 다시 올리고, --max-loaded-models 를 넘으면 마지막 요청이 가장 오래된 모델부터 내립니다.
+        """
+        with self.lock:
+            now = time.time()
+            if self.is_loaded(model, now) and self.loaded[model] == num_ctx:
+                return 0.0
+            self.loaded.pop(model, None)
+            others = sorted((name for name in self.loaded if self.is_loaded(name, now)), key=lambda name: self.models.get(name, 0))
+            while self.max_loaded_models and len(others) >= self.max_loaded_models:
+                evicted = others.pop(0)
+                self.loaded.pop(evicted)
+                self.expires.pop(evicted, None)
+            self.loaded[model] = num_ctx
+            self.expires.pop(model, None)
+        return self.load_delay
+
+def _keep_alive_seconds(value) -> float:
+    """요청의 keep_alive 를 초로 바꿉니다 (없으면 기본 5분, 잘못된 값은 run_test.keep_alive_seconds 처럼 ValueError)."""
+    return KEEP_ALIVE_SEC if value is None else run_test.keep_alive_seconds(value)
+
+def _parse_request(path: str, body: dict) -> dict:
+    """엔드포인트별 요청 본문을 공통 형식으로 정규화합니다.
+
+    prompt 는 시스템/대화 이력을 포함한 전체 입력, user_prompt 는 마지막 사용자 입력입니다.
+    keep_alive 가 잘못된 기간 문자열이면 ValueError 를 냅니다 (Ollama 는 400 으로 거부).
+    """
+    request = {'path': path, 'model': body.get('model', 'mock'), 'body': body}
+    messages = body.get('messages') or []
+    user_prompt = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+    if path == '/api/generate':
+        request.update(api='ollama', prompt=(body.get('system') or '') + (body.get('prompt') or ''), user_prompt=body.get('prompt') or '',
+                       stream=body.get('stream', True), max_tokens=(body.get('options') or {}).get('num_predict'),
+                       keep_alive=_keep_alive_seconds(body.get('keep_alive')), load_only=not body.get('prompt'),
+                       num_ctx=(body.get('options') or {}).get('num_ctx'))
+    elif path == '/api/chat':
+        request.update(api='ollama', prompt=''.join(m.get('content') or '' for m in messages), user_prompt=user_prompt,
+                       stream=body.get('stream', True), max_tokens=(body.get('options') or {}).get('num_predict'),
+                       keep_alive=_keep_alive_seconds(body.get('keep_alive')), load_only=not messages,
+                       num_ctx=(body.get('options') or {}).get('num_ctx'))
+    else:
+        if path == '/v1/chat/completions':
+            prompt = ''.join(m.get('content') or '' for m in messages)
+        else:
+            prompt = body.get('prompt') or ''
+            request['prompts'] = prompt if isinstance(prompt, list) else [prompt] # A list is one batched request
+            request['n'] = max(1, body.get('n') or 1)
+            prompt = prompt[0] if isinstance(prompt, list) and prompt else prompt
+            user_prompt = prompt
+        request.update(api='openai', prompt=prompt, user_prompt=user_prompt, stream=body.get('stream', False), max_tokens=body.get('max_tokens'),
+                       include_usage=bool((body.get('stream_options') or {}).get('include_usage')),
+                       min_tokens=body.get('min_tokens'), ignore_eos=bool(body.get('ignore_eos'))) # vLLM sampling extensions
+    if request['max_tokens'] is not None and request['max_tokens'] < 0: # Ollama num_predict -1 = unlimited
+        request['max_tokens'] = None
+    return request
+
+def _batch_items(request: dict) -> list:
+    """prompt 목록 x n 을 항목별 요청 목록으로 펼칩니다 (choices[].index 순서, 단일 요청이면 [request])."""
+    prompts, n = request.get('prompts') or [request['prompt']], request.get('n', 1)
+    if len(prompts) * n == 1:
+        return [request]
+    return [dict(request, prompt=prompt, user_prompt=prompt) for prompt in prompts for _ in range(n)]
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so connection reuse in the harness behaves as with real servers
+    server_version = 'sllm-mock/1.0'
+
+    def log_message(self, format, *args):
+        pass # Per-request access logs would distort timing on busy runs
+
+    @property
+    def state(self) -> MockServerState:
+        return self.server.state
+
+    # --- Response helpers ---
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str, content_type: str = 'text/plain; version=0.0.4'):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    # --- GET endpoints ---
+
+    def _starting(self) -> bool:
+        """--startup-delay 가 지나기 전이면 503 을 보내고 True 를 반환합니다."""
+        if time.monotonic() >= self.state.ready_at:
+            return False
+        self._send_json(503, {'error': 'server is starting (mock --startup-delay)'})
+        return True
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if self._starting():
+            return
+        if path == '/health':
+            self._send_text(200, 'ok', 'text/plain')
+        elif path == '/':
+            self._send_text(200, 'Ollama is running', 'text/plain')
+        elif path == '/api/ps':
+            with self.state.lock:
+                now = time.time()
+                models = [{'name': name, 'model': name, 'expires_at': _iso_time(self.state.expires[name]) if name in self.state.expires else None}
+                          for name in self.state.models if self.state.is_loaded(name, now)]
+            self._send_json(200, {'models': models})
+        elif path == '/api/tags':
+            with self.state.lock:
+                models = [{'name': name, 'model': name} for name in self.state.models]
+            self._send_json(200, {'models': models})
+        elif path == '/v1/models':
+            with self.state.lock:
+                models = [{'id': name, 'object': 'model', 'owned_by': 'mock'} for name in self.state.models]
+            self._send_json(200, {'object': 'list', 'data': models})
+        elif path == '/metrics':
+            self._send_text(200, self._prometheus_metrics())
+        else:
+            self._send_json(404, {'error': f'unknown endpoint {path}'})
+
+    def _prometheus_metrics(self) -> str:
+        """vLLM 과 같은 메트릭 이름으로 현재 상태를 Prometheus 텍스트 형식으로 반환합니다."""
+        s = self.state
+        with s.lock:
+            values = (
+                ('vllm:num_requests_running', 'gauge', s.running),
+                ('vllm:num_requests_waiting', 'gauge', s.waiting),
+                ('vllm:prompt_tokens_total', 'counter', s.prompt_tokens_total),
+                ('vllm:generation_tokens_total', 'counter', s.generation_tokens_total),
+                ('mock:requests_total', 'counter', s.requests_total),
+                ('mock:requests_rejected_total', 'counter', s.requests_rejected),
+                ('mock:requests_cancelled_total', 'counter', s.requests_cancelled),
+            )
+        cache = getattr(s.source, 'prefix_cache', None)
+        if cache is not None:
+            values += (('vllm:prefix_cache_queries_total', 'counter', cache.queries), ('vllm:prefix_cache_hits_total', 'counter', cache.hits))
+        lines = []
+        for name, kind, value in values:
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f'{name}{{model_name="mock"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # --- POST endpoints ---
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path not in ('/api/generate', '/api/chat', '/v1/chat/completions', '/v1/completions'):
+            self._send_json(404, {'error': f'unknown endpoint {path}'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': f'invalid JSON body: {e}'})
+            return
+        if self._starting():
+            return
+
+        try:
+            request = _parse_request(path, body)
+        except ValueError as e: # Invalid keep_alive duration, rejected like Ollama does
+            self._send_json(400, {'error': str(e)})
+            return
+        state = self.state
+        if request.get('load_only'):
+            self._serve_load_request(request)
+            return
+        try:
+            plans = [state.source.plan(item).truncated(request['max_tokens']) for item in _batch_items(request)]
+        except LookupError as e: # A plan source with no response for this request (e.g. strict replay)
+            self._send_json(404, {'error': str(e)})
+            return
+        state.count(requests_total=1)
+        with state.lock:
+            state.models[request['model']] = time.time()
+
+        if state.slots is not None:
+            state.count(waiting=1)
+            acquired = state.slots.acquire(blocking=not state.reject_when_busy)
+            state.count(waiting=-1)
+            if not acquired:
+                state.count(requests_rejected=1)
+                self._send_json(503, {'error': 'server busy (mock concurrency limit reached)'})
+                return
+        try:
+            if request['api'] == 'ollama':
+                request['load_sec'] = state.load(request['model'], request['num_ctx']) # Ollama loads on demand; vLLM loads at startup
+            self._serve_generation(request, plans)
+        except (BrokenPipeError, ConnectionResetError): # Client aborted the stream
+            state.count(requests_cancelled=1)
+            self.close_connection = True
+        finally:
+            if state.slots is not None:
+                state.slots.release()
+
+    def _serve_load_request(self, request: dict):
+        """프롬프트 없는 Ollama 요청: keep_alive 0 이면 모델을 내리고, 아니면 올려 두기만 합니다 (done_reason load/unload)."""
+        state, model = self.state, request['model']
+        if request['keep_alive'] == 0:
+            with state.lock:
+                state.loaded.pop(model, None)
+                state.expires.pop(model, None)
+            reason = 'unload'
+        else:
+            time.sleep(state.load(model, request['num_ctx']))
+            with state.lock:
+                state.models[model] = time.time()
+                if state.running == 0:
+                    state.expires[model] = time.time() + request['keep_alive']
+            reason = 'load'
+        self._send_json(200, {'model': model, 'created_at': _iso_now(), 'response': '', 'done': True, 'done_reason': reason})
+
+    def _serve_generation(self, request: dict, plans: list):
+        state = self.state
+        if request.get('load_sec'):
+            time.sleep(request['load_sec']) # Counted in the client TTFT, reported as load_duration
+        # Planned offsets start once the request holds a slot, so queueing time adds to the client-side TTFT
+        start = time.perf_counter()
+        plan = plans[0]
+        state.count(running=len(plans), prompt_tokens_total=sum(p.prompt_tokens for p in plans))
+        try:
+            if len(plans) > 1:
+                self._serve_openai_batch(request, plans, start)
+            elif not request['stream']:
+                self._serve_non_streaming(request, plan, start)
+            elif request['api'] == 'ollama':
+                self._serve_ollama_stream(request, plan, start)
+            else:
+                self._serve_openai_stream(request, plan, start)
+        except (BrokenPipeError, ConnectionResetError):
+            if state.ignore_cancel: # Keep "decoding" the aborted request until its planned end
+                delay = start + max((p.offsets[-1] for p in plans if p.offsets), default=0) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            raise
+        finally:
+            with state.lock:
+                state.running -= len(plans)
+                if state.running == 0:
+                    state.expires[request['model']] = time.time() + request.get('keep_alive', KEEP_ALIVE_SEC)
+
+    def _emit_tokens(self, plan: ResponsePlan, start: float, encode):
+        """계획된 시각에 맞춰 토큰별 청크를 송신합니다 (누적 오차가 없도록 절대 시각 기준으로 대기)."""
+        for i, (token, offset) in enumerate(zip(plan.tokens, plan.offsets)):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._write_chunk(encode(i, token))
+            self.state.count(generation_tokens_total=1)
+
+    def _ollama_final_metrics(self, plan: ResponsePlan, start: float, load_sec: float = 0.0) -> dict:
+        first = plan.offsets[0] if plan.offsets else plan.prefill_sec
+        end = time.perf_counter() - start
+        return {
+            'done': True,
+            'done_reason': plan.finish_reason,
+            'total_duration': int((end + load_sec) * 1e9),
+            'load_duration': int(load_sec * 1e9),
+            'prompt_eval_count': plan.prompt_tokens,
+            'prompt_eval_duration': int(plan.prefill_sec * 1e9),
+            'eval_count': len(plan.tokens),
+            'eval_duration': int(max(end - first, 0) * 1e9),
+        }
+
+    def _serve_ollama_stream(self, request: dict, plan: ResponsePlan, start: float):
+        model = request['model']
+        chat = request['path'] == '/api/chat'
+
+        def encode(i, token, done=False):
+            chunk = {'model': model, 'created_at': _iso_now()}
+            if chat:
+                chunk['message'] = {'role': 'assistant', 'content': token}
+            else:
+                chunk['response'] = token
+            chunk['done'] = done
+            return json.dumps(chunk).encode('utf-8') + b'\n'
+
+        self._start_stream('application/x-ndjson')
+        self._emit_tokens(plan, start, encode)
+        final = json.loads(encode(None, ''))
+        final.update(self._ollama_final_metrics(plan, start, request.get('load_sec', 0.0)))
+        self._write_chunk(json.dumps(final).encode('utf-8') + b'\n')
+        self._end_stream()
+
+    def _serve_openai_stream(self, request: dict, plan: ResponsePlan, start: float):
+        model = request['model']
+        chat = request['path'] == '/v1/chat/completions'
+        completion_id = f"cmpl-mock-{self.state.requests_total}"
+        created = int(time.time())
+
+        def event(payload: dict) -> bytes:
+            return b'data: ' + json.dumps(payload).encode('utf-8') + b'\n\n'
+
+        def choice(i, token, finish_reason=None):
+            if chat:
+                delta = {'content': token}
+                if i == 0:
+                    delta['role'] = 'assistant'
+                return {'index': 0, 'delta': delta, 'finish_reason': finish_reason}
+            return {'index': 0, 'text': token, 'finish_reason': finish_reason}
+
+        obj = 'chat.completion.chunk' if chat else 'text_completion'
+
+        def encode(i, token):
+            return event({'id': completion_id, 'object': obj, 'created': created, 'model': model, 'choices': [choice(i, token)]})
+
+        self._start_stream('text/event-stream')
+        self._emit_tokens(plan, start, encode)
+        final_choice = choice(len(plan.tokens), '', plan.finish_reason)
+        if chat:
+            final_choice['delta'] = {}
+        self._write_chunk(event({'id': completion_id, 'object': obj, 'created': created, 'model': model, 'choices': [final_choice]}))
+        if request.get('include_usage'):
+            usage = {'prompt_tokens': plan.prompt_tokens, 'completion_tokens': len(plan.tokens),
+                     'total_tokens': plan.prompt_tokens + len(plan.tokens)}
+            self._write_chunk(event({'id': completion_id, 'object': obj, 'created': created, 'model': model, 'choices': [], 'usage': usage}))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._end_stream()
+
+    def _serve_non_streaming(self, request: dict, plan: ResponsePlan, start: float):
+        # Same timing as a stream: respond once the last planned token would have been sent
+        if plan.offsets:
+            delay = start + plan.offsets[-1] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.state.count(generation_tokens_total=len(plan.tokens))
+        text = ''.join(plan.tokens)
+        if request['api'] == 'ollama':
+            payload = {'model': request['model'], 'created_at': _iso_now()}
+            if request['path'] == '/api/chat':
+                payload['message'] = {'role': 'assistant', 'content': text}
+            else:
+                payload['response'] = text
+            payload.update(self._ollama_final_metrics(plan, start, request.get('load_sec', 0.0)))
+        else:
+            chat = request['path'] == '/v1/chat/completions'
+            message = {'index': 0, 'finish_reason': plan.finish_reason}
+            if chat:
+                message['message'] = {'role': 'assistant', 'content': text}
+            else:
+                message['text'] = text
+            payload = {'id': f"cmpl-mock-{self.state.requests_total}", 'object': 'chat.completion' if chat else 'text_completion',
+                       'created': int(time.time()), 'model': request['model'], 'choices': [message],
+                       'usage': {'prompt_tokens': plan.prompt_tokens, 'completion_tokens': len(plan.tokens),
+                                 'total_tokens': plan.prompt_tokens + len(plan.tokens)}}
+        self._send_json(200, payload)
+
+    def _serve_openai_batch(self, request: dict, plans: list, start: float):
+        """prompt 목록/n 요청: 모든 항목의 계획을 같은 시작 시각에서 동시에 진행합니다 (배치 처리된 서버와 같이).
+
+        스트림에서는 청크마다 choice 하나를 보내고, 항목의 마지막 토큰 직후 그 항목의 finish_reason 청크를 보냅니다.
+        """
+        model = request['model']
+        completion_id = f"cmpl-mock-{self.state.requests_total}"
+        created = int(time.time())
+        usage = {'prompt_tokens': sum(p.prompt_tokens for p in plans), 'completion_tokens': sum(len(p.tokens) for p in plans)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        def event(choices: list, **extra) -> bytes:
+            payload = {'id': completion_id, 'object': 'text_completion', 'created': created, 'model': model, 'choices': choices}
+            payload.update(extra)
+            return b'data: ' + json.dumps(payload).encode('utf-8') + b'\n\n'
+
+        if not request['stream']:
+            delay = start + max((p.offsets[-1] for p in plans if p.offsets), default=0) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.state.count(generation_tokens_total=usage['completion_tokens'])
+            choices = [{'index': i, 'text': ''.join(p.tokens), 'finish_reason': p.finish_reason} for i, p in enumerate(plans)]
+            self._send_json(200, {'id': completion_id, 'object': 'text_completion', 'created': created, 'model': model,
+                                  'choices': choices, 'usage': usage})
+            return
+
+        self._start_stream('text/event-stream')
+        for index, plan in enumerate(plans):
+            if not plan.tokens:
+                self._write_chunk(event([{'index': index, 'text': '', 'finish_reason': plan.finish_reason}]))
+        schedule = sorted((offset, index, i) for index, plan in enumerate(plans) for i, offset in enumerate(plan.offsets))
+        for offset, index, i in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            plan = plans[index]
+            self._write_chunk(event([{'index': index, 'text': plan.tokens[i], 'finish_reason': None}]))
+            self.state.count(generation_tokens_total=1)
+            if i == len(plan.tokens) - 1:
+                self._write_chunk(event([{'index': index, 'text': '', 'finish_reason': plan.finish_reason}]))
+        if request.get('include_usage'):
+            self._write_chunk(event([], usage=usage))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._end_stream()
+
+def _iso_now() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+def _iso_time(epoch: float) -> str:
+    if epoch == float('inf'): # keep_alive < 0: Ollama reports now + the largest Go duration (~292 years)
+        epoch = time.time() + (2 ** 63 - 1) / 1e9
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat(timespec='microseconds')
+
+def create_server(source, host: str = '127.0.0.1', port: int = 11434, max_concurrency: int = 0,
+                  reject_when_busy: bool = False, ignore_cancel: bool = False, load_delay: float = 0.0,
+                  startup_delay: float = 0.0, max_loaded_models: int = 0) -> ThreadingHTTPServer:
+    """plan source 를 사용하는 서버를 생성합니다 (port 0 이면 임의 포트, server.server_address 로 확인)."""
+    server = ThreadingHTTPServer((host, port), MockRequestHandler)
+    server.daemon_threads = True
+    server.state = MockServerState(source, max_concurrency, reject_when_busy, ignore_cancel, load_delay, startup_delay, max_loaded_models)
+    return server
+
+def serve_in_background(server: ThreadingHTTPServer) -> threading.Thread:
+    """서버를 데몬 스레드에서 실행합니다 (self-check 및 다른 스크립트에서 사용)."""
+    thread = threading.Thread(target=server.serve_forever, name='mock-server', daemon=True)
+    thread.start()
+    return thread
+
+def self_check(source: SyntheticSource, requests_per_api: int, tolerance: float, max_concurrency: int = 0, warmup: int = 1) -> bool:
+    """run_test.run_api_query 로 측정한 TTFT/디코드 속도가 설정값과 tolerance 이내로 일치하는지 확인합니다.
+
+    API 별 처음 warmup 개 요청은 첫 연결/지연 임포트 비용을 포함하므로 (cold) 로 표시만 하고 판정에서 제외합니다.
+    """
+    server = create_server(source, port=0, max_concurrency=max_concurrency)
+    serve_in_background(server)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    expected_itl = 1.0 / source.tokens_per_second
+    ttft_budget = source.prefill_delay * tolerance + 0.005 # Absolute slack for loopback + scheduler latency
+    ok = True
+
+    print(f"Self-check against {url}: prefill {source.prefill_delay * 1000:.1f} ms, "
+          f"{source.tokens_per_second:.1f} tokens/s, jitter ±{source.jitter * 100:.0f}%, {source.response_tokens} tokens", file=sys.stderr)
+    print(f"{'api':8} {'ttft_ms':>9} {'ttft_err_ms':>11} {'decode_tps':>10} {'tps_err_%':>9} {'tokens':>6} {'overhead_ms':>11}", file=sys.stderr)
+    for api_type in ('ollama', 'vllm'):
+        ttft_errors, tps_errors = [], []
+        for i in range(warmup + requests_per_api):
+            cold = i < warmup
+            result = run_test.run_api_query(api_type, url, 'mock', f"self-check prompt {i}", "You are a helpful AI assistant.", None)
+            if not result['success']:
+                print(f"{api_type:8} FAILED: {result.get('error')}", file=sys.stderr)
+                ok = False
+                continue
+            m = result['metrics']
+            expected_ttft = source.prefill_delay
+            if source.prefill_tokens_per_second and m.get('prompt_tokens'):
+                expected_ttft += m['prompt_tokens'] / source.prefill_tokens_per_second
+            ttft_err = m['time_to_first_token'] - expected_ttft
+            decode_tps = 1.0 / m['itl_mean'] if m.get('itl_mean') else 0.0
+            tps_err = (decode_tps - source.tokens_per_second) / source.tokens_per_second
+            print(f"{api_type:8} {m['time_to_first_token'] * 1000:9.2f} {ttft_err * 1000:11.2f} {decode_tps:10.2f} "
+                  f"{tps_err * 100:9.2f} {m['generated_tokens']:6d} {m['harness_overhead_sec'] * 1000:11.2f}{' (cold)' if cold else ''}", file=sys.stderr)
+            if cold:
+                continue
+            ttft_errors.append(abs(ttft_err))
+            tps_errors.append(abs(tps_err))
+            if abs(ttft_err) > max(ttft_budget, expected_ttft * tolerance + 0.005) or abs(tps_err) > tolerance or m['generated_tokens'] != source.response_tokens:
+                ok = False
+        if ttft_errors:
+            print(f"{api_type:8} mean |TTFT error| {sum(ttft_errors) / len(ttft_errors) * 1000:.2f} ms, "
+                  f"mean |decode rate error| {sum(tps_errors) / len(tps_errors) * 100:.2f}%", file=sys.stderr)
+    run_test.close_endpoint_pools()
+    server.shutdown()
+    print(f"Self-check {'PASSED' if ok else 'FAILED'} (tolerance {tolerance * 100:.1f}%, TTFT slack {ttft_budget * 1000:.1f} ms, "
+          f"expected ITL {expected_itl * 1000:.2f} ms)", file=sys.stderr)
+    return ok
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Local mock Ollama/OpenAI streaming server for harness benchmarks')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=11434, help='Port (11434 = Ollama default, 8000 = vLLM default)')
+    parser.add_argument('--prefill-delay', type=float, default=0.2, help='Seconds before the first token (TTFT)')
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=0.0, help='Add prompt tokens / this rate to the TTFT (0 = fixed --prefill-delay)')
+    parser.add_argument('--prefix-cache', action='store_true', help='Skip the prefill time of prompt prefixes seen in earlier requests (with --prefill-tokens-per-second)')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help='Decode rate after the first token')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Relative per-token interval jitter (0.1 = ±10%%)')
+    parser.add_argument('--response-tokens', type=int, default=128, help='Tokens per response (capped by max_tokens/num_predict)')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='Requests generated at once (0 = unlimited); others queue')
+    parser.add_argument('--reject-when-busy', action='store_true', help='Return 503 instead of queueing when --max-concurrency is reached')
+    parser.add_argument('--ignore-cancel', action='store_true', help='Keep generating aborted requests until their planned end (holds the slot, like a server that ignores disconnects)')
+    parser.add_argument('--load-delay', type=float, default=0.0, help='Seconds an Ollama request waits when its model is not loaded (reported as load_duration)')
+    parser.add_argument('--max-loaded-models', type=int, default=0, help='Ollama models kept in memory at once (0 = unlimited); loading another evicts the least recently used, like OLLAMA_MAX_LOADED_MODELS')
+    parser.add_argument('--startup-delay', type=float, default=0.0, help='Seconds after start during which every request gets 503, like vLLM loading its model')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for response text and jitter')
+    parser.add_argument('--self-check', action='store_true', help='Start on a free port, measure with run_test.py and compare with the configured values')
+    parser.add_argument('--self-check-requests', type=int, default=3, help='Requests per API type in --self-check')
+    parser.add_argument('--self-check-warmup', type=int, default=1, help='Unchecked warm-up requests per API type in --self-check')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='Allowed relative error in --self-check')
+    return parser
+
+def main():
+    args = build_arg_parser().parse_args()
+    source = SyntheticSource(args.prefill_delay, args.tokens_per_second, args.jitter, args.response_tokens, args.seed,
+                             args.prefill_tokens_per_second, args.prefix_cache)
+
+    if args.self_check:
+        sys.exit(0 if self_check(source, args.self_check_requests, args.tolerance, args.max_concurrency, args.self_check_warmup) else 1)
+
+    server = create_server(source, args.host, args.port, args.max_concurrency, args.reject_when_busy, args.ignore_cancel,
+                           args.load_delay, args.startup_delay, args.max_loaded_models)
+    print(f"Mock server listening on http://{args.host}:{server.server_address[1]} ({json.dumps(source.describe())})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
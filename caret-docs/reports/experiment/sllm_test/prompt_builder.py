@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+컨텍스트 길이 스윕용 프롬프트 빌더.
+
+예전에는 run_test.py 의 --context 가 결과 파일에 기록만 되어, 12800~76800 스윕도 모두 짧은 시나리오 프롬프트로 측정되었습니다.
+이 모듈은 시나리오 프롬프트 앞에 이 저장소의 실제 소스 코드(src/, caret-src/ 의 .ts)를 채워 넣어
+모델 토크나이저 기준 목표 토큰 수에 맞춘 프롬프트를 만듭니다. 작업 지시는 항상 프롬프트 끝에 남습니다.
+
+채움 코드는 프롬프트 텍스트의 CRC32 로 정한 위치부터 잘라 오므로 같은 프롬프트는 실행/백엔드가 달라도 같은 입력이 되고,
+서로 다른 프롬프트는 앞부분이 달라 서버의 prefix cache 때문에 prefill 이 생략되는 일이 없습니다.
+저장소 소스를 찾지 못하면 이 디렉토리의 .py 파일을 사용합니다.
+
+python prompt_builder.py <model> <target_tokens> [<prompt>] 로 채운 결과의 토큰 수를 확인할 수 있습니다.
+"""
+import glob
+import os
+import sys
+import zlib
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..', '..', '..'))
+DEFAULT_FILLER_PATTERNS = ('src/**/*.ts', 'caret-src/**/*.ts')
+FALLBACK_FILLER_PATTERN = os.path.join(SCRIPT_DIR, '*.py')
+MAX_CORPUS_CHARS = 2_000_000 # About 500k tokens, enough for the largest context in the sweep
+FILL_HEADER = "The following source files from the project are provided as context.\n\n"
+TASK_HEADER = "\n\n---\nUsing the context above where relevant, complete the following task.\n\n"
+
+
+def filler_files(root: str = REPO_ROOT, patterns: tuple = DEFAULT_FILLER_PATTERNS) -> list:
+    """채움에 사용할 소스 파일 경로를 정렬해 반환합니다 (테스트와 .d.ts 제외)."""
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(root, pattern), recursive=True))
+    paths = [p for p in paths if not p.endswith('.d.ts') and '.test.' not in p and f'{os.sep}__tests__{os.sep}' not in p]
+    return sorted(paths) or sorted(glob.glob(FALLBACK_FILLER_PATTERN))
+
+def load_filler_corpus(paths: list, max_chars: int = MAX_CORPUS_CHARS) -> str:
+    """파일들을 '// File: <경로>' 머리말과 함께 이어 붙인 코드 말뭉치를 반환합니다 (max_chars 에서 중단)."""
+    parts = []
+    total = 0
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError:
+            continue
+        part = f"// File: {os.path.relpath(path, REPO_ROOT)}\n{text}\n"
+        parts.append(part)
+        total += len(part)
+        if total >= max_chars:
+            break
+    return ''.join(parts)
+
+class PromptBuilder:
+    """모델 토크나이저 기준으로 프롬프트를 목표 토큰 수까지 코드로 채웁니다.
+
+    말뭉치는 처음 필요할 때 한 번 토큰화하고, 채운 결과는 (프롬프트, 목표 토큰 수) 별로 캐시합니다.
+    """
+    def __init__(self, tokenizer, corpus: str = None):
+        self.tokenizer = tokenizer
+        self._corpus = corpus
+        self._corpus_ids = None
+        self._cache = {}
+
+    @property
+    def corpus_ids(self) -> list:
+        if self._corpus_ids is None:
+            if self._corpus is None:
+                self._corpus = load_filler_corpus(filler_files())
+            self._corpus_ids = self.tokenizer.encode(self._corpus)
+            if not self._corpus_ids:
+                raise ValueError('Prompt filler corpus is empty')
+        return self._corpus_ids
+
+    def filler_text(self, tokens: int, key: str) -> str:
+        """말뭉치에서 key 의 CRC32 로 정한 위치부터 tokens 개 토큰 분량의 코드를 디코드해 반환합니다."""
+        ids = self.corpus_ids
+        while len(ids) < tokens: # Only for targets beyond the corpus size; repeats the code
+            ids = ids + self.corpus_ids
+        offset = zlib.crc32(key.encode('utf-8')) % (len(ids) - tokens + 1)
+        return self.tokenizer.decode(ids[offset:offset + tokens])
+
+    def _compose(self, prompt: str, fill_ids: int) -> str:
+        return FILL_HEADER + self.filler_text(fill_ids, prompt) + TASK_HEADER + prompt
+
+    def fill(self, prompt: str, target_tokens: int) -> tuple:
+        """(채운 프롬프트, 통계 dict) 를 반환합니다.
+
+        잘라 낸 토큰을 디코드한 뒤 다시 세면 경계에서 토큰 수가 달라질 수 있으므로, 완성된 프롬프트를 다시 세어
+        목표의 1% (최소 8 토큰) 이내가 될 때까지 몇 번 보정합니다. 통계의 prompt_fill_tokens 는 채운 코드의 토큰 수,
+        prompt_built_tokens 는 완성된 사용자 프롬프트의 토큰 수입니다. 프롬프트가 이미 목표 이상이면 그대로 둡니다.
+        """
+        key = (prompt, target_tokens)
+        if key in self._cache:
+            return self._cache[key]
+        base_tokens = self.tokenizer.count(FILL_HEADER + TASK_HEADER + prompt)
+        text, built_tokens = prompt, self.tokenizer.count(prompt)
+        fill_ids = target_tokens - base_tokens
+        for _ in range(4):
+            if fill_ids <= 0:
+                break
+            text = self._compose(prompt, fill_ids)
+            built_tokens = self.tokenizer.count(text)
+            if abs(built_tokens - target_tokens) <= max(8, target_tokens // 100):
+                break
+            fill_ids = round(fill_ids * (target_tokens - base_tokens) / max(1, built_tokens - base_tokens))
+        stats = {
+            'prompt_target_tokens': target_tokens,
+            'prompt_fill_tokens': max(0, built_tokens - base_tokens) if text is not prompt else 0,
+            'prompt_built_tokens': built_tokens,
+        }
+        self._cache[key] = (text, stats)
+        return text, stats
+
+_builders = {}
+
+def get_prompt_builder(tokenizer) -> PromptBuilder:
+    """토크나이저별 PromptBuilder 를 반환합니다 (프로세스 내에서 재사용)."""
+    builder = _builders.get(tokenizer.name)
+    if builder is None:
+        builder = _builders[tokenizer.name] = PromptBuilder(tokenizer)
+    return builder
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python prompt_builder.py <model> <target_tokens> [<prompt>]", file=sys.stderr)
+        sys.exit(1)
+    from tokenizer_registry import get_tokenizer
+    tokenizer = get_tokenizer(sys.argv[1])
+    prompt = sys.argv[3] if len(sys.argv) > 3 else "Summarize what this code does."
+    text, stats = get_prompt_builder(tokenizer).fill(prompt, int(sys.argv[2]))
+    print(f"tokenizer: {tokenizer.name} ({tokenizer.source})")
+    for name, value in stats.items():
+        print(f"{name}: {value}")
+    print(f"characters: {len(text)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+experiment_results/ 기록 재생 서버.
+
+저장된 run_test.py 결과의 응답 텍스트와 타이밍(TTFT, 토큰 속도)을 mock_server.py 와 같은 Ollama NDJSON /
+OpenAI SSE 프로토콜로 다시 스트리밍합니다. GPU 없이 실제 트래픽과 같은 응답으로 evaluator/보고서 변경을 반복하고,
+하네스 쪽 성능 변경을 고정된 워크로드로 A/B 비교하기 위한 용도입니다.
+
+요청은 마지막 사용자 프롬프트 (모델 이름이 같으면 우선) 로 기록과 매칭하며, 같은 프롬프트의 기록이 여러 개면 순서대로 돌아가며 사용합니다.
+매칭되는 기록이 없으면 전체 기록을 순서대로 사용하고, --strict 면 404 를 반환합니다.
+토큰 송신 시각은 기록에 chunk_timeline 이 있으면 그대로, 없으면 TTFT 이후 generation_time 동안 균등 간격으로 재현합니다.
+--time-scale 0.1 처럼 주면 모든 지연을 비율대로 줄여 빠르게 재생합니다.
+
+--verify N 은 임의 포트로 재생 서버를 띄우고 기록 N 개를 run_test.run_api_query 로 다시 측정해 기록값과 비교합니다.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+
+from mock_server import ResponsePlan, approximate_token_count, create_server, serve_in_background
+from result_files import find_result_files, infer_api_type, read_result_file
+
+
+class RecordedResponse:
+    """재생 가능한 기록 하나 (성공한 프롬프트 결과)."""
+    __slots__ = ('model', 'api_type', 'scenario_id', 'prompt', 'response', 'ttft', 'generation_time',
+                 'generated_tokens', 'prompt_tokens', 'chunk_offsets', 'source_file')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.generated_tokens / self.generation_time if self.generation_time else 0.0
+
+def _recorded_chunk_offsets(metrics: dict):
+    """기록된 chunk_timeline 을 첫 청크 기준 초 단위 목록으로 복원합니다 (없으면 None)."""
+    timeline = metrics.get('chunk_timeline')
+    if not timeline:
+        return None
+    from run_test import decode_timeline # Same float32 base64 format as the recorder
+    return [ms / 1000 for ms in decode_timeline(timeline)]
+
+def load_recordings(results_dir: str, timestamp: str = None, model: str = None, api_type: str = None) -> list:
+    """결과 파일들에서 재생 가능한 기록 목록을 만듭니다 (실패했거나 응답/타이밍이 없는 결과는 제외)."""
+    recordings = []
+    for path in find_result_files(results_dir, timestamp):
+        data = read_result_file(path)
+        if data is None:
+            continue
+        run_api_type = infer_api_type(data, path)
+        if (model and data.get('model') != model) or (api_type and run_api_type != api_type):
+            continue
+        for test in data.get('test_results', []):
+            result = test.get('result', {})
+            metrics = result.get('metrics') or {}
+            if not result.get('success') or not result.get('response') or metrics.get('time_to_first_token') is None:
+                continue
+            generated_tokens = metrics.get('generated_tokens') or 0
+            if generated_tokens <= 0:
+                continue
+            prompt_tokens = metrics.get('prompt_tokens') or metrics.get('api_prompt_eval_count') or metrics.get('ollama_prompt_eval_count')
+            recordings.append(RecordedResponse(
+                model=data.get('model'),
+                api_type=run_api_type,
+                scenario_id=test.get('scenario_id'),
+                prompt=test.get('prompt') or '',
+                response=result['response'],
+                ttft=metrics['time_to_first_token'],
+                generation_time=metrics.get('generation_time') or 0.0,
+                generated_tokens=generated_tokens,
+                prompt_tokens=prompt_tokens,
+                chunk_offsets=_recorded_chunk_offsets(metrics),
+                source_file=path,
+            ))
+    return recordings
+
+def split_into_chunks(text: str, count: int) -> list:
+    """text 를 순서를 유지한 채 count 개(텍스트 길이 이하)의 비어 있지 않은 조각으로 나눕니다.
+
+    단어/공백/구두점 단위로 나눈 뒤 조각이 많으면 인접 조각을 균등하게 합치고, 적으면 글자 단위로 균등하게 자릅니다.
+    요청마다 계획을 만들 때 TTFT 에 더해지지 않도록 선형 시간으로 처리합니다.
+    """
+    count = max(1, min(count, len(text)))
+    pieces = re.findall(r'\w+|\s+|[^\w\s]', text)
+    if len(pieces) >= count:
+        bounds = [round(i * len(pieces) / count) for i in range(count + 1)]
+        return [''.join(pieces[bounds[i]:bounds[i + 1]]) for i in range(count)]
+    bounds = [round(i * len(text) / count) for i in range(count + 1)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+class ReplaySource:
+    """기록된 응답을 mock_server 의 ResponsePlan 으로 바꿔 주는 plan source 입니다."""
+    def __init__(self, recordings: list, strict: bool = False, time_scale: float = 1.0):
+        if not recordings:
+            raise ValueError('No replayable recordings found')
+        self.recordings = recordings
+        self.strict = strict
+        self.time_scale = time_scale
+        self._by_prompt = {}
+        self._by_model_prompt = {}
+        for recording in recordings:
+            self._by_prompt.setdefault(recording.prompt, []).append(recording)
+            self._by_model_prompt.setdefault((recording.model, recording.prompt), []).append(recording)
+        self._next = {} # lookup key -> next index (round-robin over repeated recordings)
+        self._lock = threading.Lock()
+
+    def describe(self) -> dict:
+        return {
+            'source': 'replay',
+            'recordings': len(self.recordings),
+            'distinct_prompts': len(self._by_prompt),
+            'models': sorted({r.model for r in self.recordings if r.model}),
+            'strict': self.strict,
+            'time_scale': self.time_scale,
+        }
+
+    def _take(self, key, candidates: list) -> RecordedResponse:
+        with self._lock:
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+        return candidates[index % len(candidates)]
+
+    def select(self, request: dict) -> RecordedResponse:
+        """요청에 재생할 기록을 고릅니다 (모델+프롬프트, 프롬프트, 전체 순)."""
+        prompt = request.get('user_prompt') or request['prompt']
+        candidates = self._by_model_prompt.get((request['model'], prompt))
+        if candidates:
+            return self._take((request['model'], prompt), candidates)
+        candidates = self._by_prompt.get(prompt)
+        if candidates:
+            return self._take(prompt, candidates)
+        if self.strict:
+            raise LookupError(f"No recording for prompt: {prompt[:80]!r}")
+        return self._take(None, self.recordings)
+
+    def plan(self, request: dict) -> ResponsePlan:
+        recording = self.select(request)
+        if recording.chunk_offsets:
+            offsets = [recording.ttft + offset for offset in recording.chunk_offsets]
+        else:
+            count = min(recording.generated_tokens, len(recording.response))
+            interval = recording.generation_time / (count - 1) if count > 1 else 0.0
+            offsets = [recording.ttft + i * interval for i in range(count)]
+        tokens = split_into_chunks(recording.response, len(offsets))
+        offsets = [offset * self.time_scale for offset in offsets[:len(tokens)]]
+        prompt_tokens = recording.prompt_tokens or approximate_token_count(request['prompt'])
+        return ResponsePlan(tokens, offsets, prompt_tokens, recording.ttft * self.time_scale)
+
+def verify(recordings: list, count: int, time_scale: float):
+    """기록 count 개를 재생 서버로 다시 측정해 기록된 TTFT/TPS 와 비교합니다 (time_scale 을 되돌려 비교)."""
+    import run_test
+
+    server = create_server(ReplaySource(recordings[:1], time_scale=time_scale), port=0)
+    serve_in_background(server)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{'api':7} {'scenario':22} {'rec_ttft':>8} {'ttft':>8} {'rec_tps':>8} {'tps':>8} {'rec_tok':>7} {'tok':>7}", file=sys.stderr)
+    step = max(1, len(recordings) // count)
+    worst_ttft = worst_tps = 0.0
+    for api_type in ('ollama', 'vllm'): # Warm-up: first connection and lazy imports are not part of the comparison
+        run_test.run_api_query(api_type, url, recordings[0].model, recordings[0].prompt, "You are a helpful AI assistant.", None)
+    for recording in recordings[::step][:count]:
+        server.state.source = ReplaySource([recording], time_scale=time_scale) # Serve exactly this recording
+        api_type = 'vllm' if recording.api_type in ('vllm', 'tgi') else 'ollama'
+        result = run_test.run_api_query(api_type, url, recording.model, recording.prompt, "You are a helpful AI assistant.", None)
+        if not result['success']:
+            print(f"{api_type:7} {recording.scenario_id or '-':22} FAILED: {result.get('error')}", file=sys.stderr)
+            continue
+        m = result['metrics']
+        ttft = m['time_to_first_token'] / time_scale
+        tps = m['tokens_per_second_calculated'] * time_scale
+        print(f"{api_type:7} {(recording.scenario_id or '-')[:22]:22} {recording.ttft:8.3f} {ttft:8.3f} "
+              f"{recording.tokens_per_second:8.2f} {tps:8.2f} {recording.generated_tokens:7d} {m['generated_tokens']:7d}", file=sys.stderr)
+        worst_ttft = max(worst_ttft, abs(ttft - recording.ttft))
+        if recording.tokens_per_second:
+            worst_tps = max(worst_tps, abs(tps - recording.tokens_per_second) / recording.tokens_per_second)
+    run_test.close_endpoint_pools()
+    server.shutdown()
+    print(f"Worst TTFT difference: {worst_ttft * 1000:.1f} ms, worst TPS difference: {worst_tps * 100:.1f}%", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded experiment_results responses over the Ollama/OpenAI streaming protocols')
+    parser.add_argument('--results-dir', default='experiment_results', help='Directory with run_test.py result files')
+    parser.add_argument('--timestamp', default=None, help='Only replay result files whose name contains this timestamp')
+    parser.add_argument('--model', default=None, help='Only replay recordings of this model')
+    parser.add_argument('--recorded-api-type', default=None, choices=['ollama', 'tgi', 'vllm'], help='Only replay recordings made against this API type')
+    parser.add_argument('--strict', action='store_true', help='Return 404 for prompts with no recording instead of replaying another one')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Multiply all recorded delays (0.1 = 10x faster)')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=11434, help='Port (11434 = Ollama default, 8000 = vLLM default)')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='Requests replayed at once (0 = unlimited); others queue')
+    parser.add_argument('--list', action='store_true', help='Print a summary of the loaded recordings and exit')
+    parser.add_argument('--verify', type=int, default=0, metavar='N', help='Re-measure N recordings through run_test.py and compare with the recorded timings')
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.results_dir, args.timestamp, args.model, args.recorded_api_type)
+    if not recordings:
+        print(f"Error: No replayable recordings in {args.results_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.list:
+        summary = {}
+        for r in recordings:
+            entry = summary.setdefault(f"{r.model} ({r.api_type})", {'recordings': 0, 'prompts': set()})
+            entry['recordings'] += 1
+            entry['prompts'].add(r.prompt)
+        print(json.dumps({name: {'recordings': e['recordings'], 'distinct_prompts': len(e['prompts'])} for name, e in summary.items()}, indent=2))
+        return
+    if args.verify:
+        verify(recordings, args.verify, args.time_scale)
+        return
+
+    source = ReplaySource(recordings, args.strict, args.time_scale)
+    server = create_server(source, args.host, args.port, args.max_concurrency)
+    print(f"Replay server listening on http://{args.host}:{server.server_address[1]} ({json.dumps(source.describe())})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
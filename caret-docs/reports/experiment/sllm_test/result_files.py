@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+experiment_results/ 결과 파일 읽기/쓰기 도우미.
+
+run_test.py 의 stdout 을 그대로 저장한 파일에는 BOM(가끔 두 번)과, 평가 중 실행된 코드가 출력한 텍스트
+("34", "The ..." 등) 가 JSON 앞에 섞여 있습니다. generate_report.py 와 replay_server.py 가 같은 규칙으로
+파일을 읽도록 여기에서 처리합니다. 무거운 의존성 없이 표준 라이브러리만 사용합니다.
+
+스트리밍 JSONL 형식 (run_test.py --output-jsonl) 은 한 줄에 레코드 하나이며 record_type 으로 구분합니다.
+  - run          : 실행 헤더 (api_type, model, test_type 등, test_results 제외). --resume 으로 이어 쓸 때마다 하나씩 추가
+  - prompt_result: test_results 항목 하나 (프롬프트가 끝나는 즉시 기록)
+  - summary      : 실행 종료 시의 집계 (load_test, quality_evaluation 등)
+"""
+import glob
+import json
+import os
+import queue
+import re
+import threading
+
+_decoder = json.JSONDecoder()
+
+
+def read_result_file(path: str):
+    """결과 파일에서 run_test.py 결과 dict 를 찾아 반환합니다 (없거나 손상된 경우 None).
+
+    .jsonl 은 read_jsonl_results() 로 재구성합니다. .json 은 줄 맨 앞의 '{' 위치마다 JSON 디코딩을 시도해,
+    앞쪽에 섞인 출력 안의 '{' 에 속지 않도록 합니다.
+    """
+    if path.endswith('.jsonl'):
+        return read_jsonl_results(path)
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        content = f.read().lstrip('\ufeff')
+    for match in re.finditer(r'^\{', content, re.MULTILINE):
+        try:
+            data, _ = _decoder.raw_decode(content, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict) and 'test_results' in data:
+            return data
+    return None
+
+def read_jsonl_records(path: str) -> list:
+    """JSONL 레코드 목록을 반환합니다. 중단된 실행의 마지막 줄처럼 잘린 줄은 건너뜁니다."""
+    records = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and 'record_type' in record:
+                records.append(record)
+    return records
+
+def read_jsonl_results(path: str):
+    """스트리밍 JSONL 을 run_test.py 의 결과 dict 형식으로 재구성합니다 (run 레코드가 없으면 None).
+
+    --resume 으로 이어 쓴 파일에서는 나중에 성공한 (scenario_id, prompt_index) 의 이전 실패 기록을 제외합니다.
+    summary 레코드가 없으면 (중단된 실행) 'incomplete': True 를 표시합니다.
+    """
+    records = read_jsonl_records(path)
+    runs = [r for r in records if r['record_type'] == 'run']
+    if not runs:
+        return None
+    results = {k: v for k, v in runs[0].items() if k != 'record_type'}
+    prompt_results = [{k: v for k, v in r.items() if k != 'record_type'} for r in records if r['record_type'] == 'prompt_result']
+    if len(runs) > 1:
+        succeeded = {(r.get('scenario_id'), r.get('prompt_index')) for r in prompt_results if r.get('result', {}).get('success')}
+        prompt_results = [r for r in prompt_results
+                          if r.get('result', {}).get('success') or (r.get('scenario_id'), r.get('prompt_index')) not in succeeded]
+        results['resumed_runs'] = len(runs) - 1
+    results['test_results'] = prompt_results
+    # Only a summary written after the last (resumed) run header describes the whole file
+    last_run_index = max(i for i, r in enumerate(records) if r['record_type'] == 'run')
+    summaries = [r for r in records[last_run_index:] if r['record_type'] == 'summary']
+    if summaries:
+        results.update({k: v for k, v in summaries[-1].items() if k not in ('record_type', 'test_results')})
+    else:
+        results['incomplete'] = True
+    return results
+
+def find_result_files(results_dir: str, timestamp: str = None) -> list:
+    """results_dir 의 결과 파일 경로 목록을 (timestamp 가 있으면 이름에 포함된 것만) 정렬해 반환합니다.
+
+    같은 이름의 .json 과 .jsonl 이 함께 있으면 한 번만 세도록 비어 있지 않은 .json 을 우선하고,
+    .json 이 비어 있으면 (실행이 중단된 경우) .jsonl 을 사용합니다.
+    """
+    paths = sorted(glob.glob(os.path.join(results_dir, '*.json')) + glob.glob(os.path.join(results_dir, '*.jsonl')))
+    if timestamp:
+        paths = [p for p in paths if timestamp in os.path.basename(p)]
+    selected = []
+    for path in paths:
+        stem, ext = os.path.splitext(path)
+        if ext == '.jsonl' and os.path.exists(stem + '.json') and os.path.getsize(stem + '.json') > 0:
+            continue
+        if ext == '.json' and os.path.getsize(path) == 0 and os.path.exists(stem + '.jsonl'):
+            continue
+        selected.append(path)
+    return selected
+
+def infer_api_type(data: dict, path: str) -> str:
+    """api_type 필드가 없는 예전 결과는 파일 이름 (<model>_<api>_ctx...) 에서 API 타입을 추정합니다."""
+    if data.get('api_type'):
+        return data['api_type']
+    match = re.search(r'_(ollama|vllm|tgi)_', os.path.basename(path))
+    return match.group(1) if match else 'ollama' # Runs before the api_type field existed were Ollama-only
+
+def _truncate_partial_line(path: str, chunk_size: int = 65536):
+    """중단된 실행이 남긴 마지막 미완성 줄 (개행 없음) 을 잘라내 이어 쓰기가 그 뒤에 붙지 않게 합니다."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            if pos == end and chunk.endswith(b'\n'):
+                return
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            pos = start
+        f.truncate(0) # Not even the first line was completed
+
+class JsonlResultWriter:
+    """결과 레코드를 JSONL 로 한 줄씩 기록합니다 (레코드마다 flush + fsync).
+
+    디스크 쓰기는 백그라운드 스레드에서 수행하므로 동시 부하 모드의 이벤트 루프가 fsync 로 멈추지 않습니다.
+    append=True 면 기존 파일 뒤에 이어 씁니다 (--resume).
+    """
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        if append:
+            _truncate_partial_line(path)
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._drain, name='jsonl-writer', daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            line = self._queue.get()
+            if line is None:
+                break
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def write(self, record_type: str, payload: dict):
+        """record_type 을 붙인 레코드 하나를 기록 대기열에 넣습니다."""
+        record = {'record_type': record_type}
+        record.update(payload)
+        self._queue.put(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        """대기 중인 레코드를 모두 기록하고 파일을 닫습니다."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -21,6 +21,10 @@ container_port=8000 # 컨테이너 내부 포트 (vLLM 기본값)
 vllm_image="vllm/vllm-openai:v0.5.1" # Update to a newer stable version (v0.5.1)
 container_name="vllm_test_container" # 관리할 컨테이너 이름
 health_check_timeout_sec=600 # vLLM 준비 대기 시간 (초)
+# vLLM 컨텍스트 창 (--max-model-len). 비워 두면 모델 기본값을 사용하며, 이보다 큰 컨텍스트는 run_test.py 가 서버 한도에 맞춰 줄여 측정합니다.
+# 예: vllm_max_model_len=76800 (Qwen2.5 는 32768 초과 시 rope scaling 설정 필요)
+vllm_max_model_len=""
+ollama_keep_alive="5m" # Ollama 서버의 기본 keep_alive (OLLAMA_KEEP_ALIVE). 스케줄러의 절약 시간 계산 기준
 # shm_size="4g" # vLLM은 PagedAttention으로 shm 중요도 낮음 (필요시 주석 해제)
 
 # !!! 중요: 허깅페이스 Hub 토큰 (Gated 모델 접근 시 필요) !!!
@@ -48,7 +52,7 @@ models=(
   # "mistralai/Mistral-7B-Instruct-v0.1" 
 )
 
-# 컨텍스트 크기
+# 컨텍스트 크기 (run_test.py 가 프롬프트를 컨텍스트 - 응답 여유(2048) 토큰까지 저장소 코드로 채워 측정, Ollama 는 num_ctx 도 지정)
 contexts=(12800 41200 51200 76800)
 
 # 결과 저장 디렉토리
@@ -63,6 +67,20 @@ log_file="${results_dir}/batch_test_${timestamp}.log"
 echo "sLLM 성능 테스트 시작 using API type: $api_type at $api_url: $(date)" | tee -a "$log_file"
 echo "----------------------------------------" | tee -a "$log_file"
 
+# Ollama: 모든 모델을 한 세션에서 실행 (모델/num_ctx 별로 실행을 모아 그룹 동안 keep_alive 로 고정하고 끝나면 내림)
+# "Model loads:" 줄은 스케줄 없이 서버 기본 keep_alive (ollama_keep_alive, OLLAMA_KEEP_ALIVE 와 맞출 것) 로 돌렸을 때와 비교합니다.
+# 다음 모델을 함께 올릴 메모리가 있으면 (OLLAMA_MAX_LOADED_MODELS>=2) --prefetch-next 를 추가해 모델 로드를 이전 모델 실행과 겹칠 수 있습니다.
+if [ "$api_type" == "ollama" ]; then
+  echo "배치 세션 실행 중 (스케줄링): ${models[*]} (API: $api_type, 컨텍스트: ${contexts[*]})" | tee -a "$log_file"
+  python batch_session.py --api-type "$api_type" --api-url "$api_url" --models "${models[@]}" --contexts "${contexts[@]}" \
+      --continuous-runs 3 --results-dir "$results_dir" --timestamp "$timestamp" --schedule --baseline-keep-alive "$ollama_keep_alive" > /dev/null 2>> "$log_file"
+  if [ $? -ne 0 ]; then
+      echo "오류: 배치 세션 실패" | tee -a "$log_file"
+  fi
+  grep "Model loads:" "$log_file" | tail -1
+  models=() # 아래 모델별 루프 (vLLM 컨테이너 관리) 는 건너뜀
+fi
+
 # 각 모델과 컨텍스트 크기 조합에 대해 테스트 실행
 for model in "${models[@]}"; do
     # Create a safe filename (replace slashes and colons)
@@ -87,6 +105,7 @@ for model in "${models[@]}"; do
     fi
 
     # 2. Start the new vLLM container
+    # (다른 양자화/플래그/샘플링 조합 비교는 이 명령을 고치지 말고 sweep_runner.py 와 JSON 매트릭스를 사용하세요)
     echo "새 vLLM 컨테이너 '$container_name' 시작 중 (모델: '$model')..." | tee -a "$log_file"
     # Note: Ensure volume_path uses Linux-style paths for WSL/Docker
     docker_command="docker run --gpus all -d --name $container_name \
@@ -104,6 +123,9 @@ for model in "${models[@]}"; do
         --quantization awq \
         --trust-remote-code" # Often needed for Qwen models
         # --gpu-memory-utilization 0.85 # Remove for now, rely on quantization
+    if [ -n "$vllm_max_model_len" ]; then
+        docker_command="$docker_command --max-model-len $vllm_max_model_len"
+    fi
 
     echo "실행 명령어: $docker_command" | tee -a "$log_file"
     eval "$docker_command" > /dev/null
@@ -120,12 +142,15 @@ for model in "${models[@]}"; do
     while [ $(( $(date +%s) - start_time )) -lt $health_check_timeout_sec ]; do
         # Check only for 200 status code using curl -f (fail silently on error)
         if curl -s -f "$health_check_url" > /dev/null; then
-            echo "vLLM 컨테이너 준비 완료!" | tee -a "$log_file"
+            # Poll every second so the logged time to ready is accurate (run_test.py --cold-start measures it in detail)
+            echo "vLLM 컨테이너 준비 완료! (준비 시간: $(( $(date +%s) - start_time ))초)" | tee -a "$log_file"
             ready=true
             break
         fi
-        echo "vLLM 대기 중..." | tee -a "$log_file"
-        sleep 10
+        if [ $(( ($(date +%s) - start_time) % 10 )) -eq 0 ]; then
+            echo "vLLM 대기 중..." | tee -a "$log_file"
+        fi
+        sleep 1
     done
 
     if [ "$ready" = false ]; then
@@ -138,49 +163,16 @@ for model in "${models[@]}"; do
   # --- End vLLM Container Management ---
 
 
-  for context in "${contexts[@]}"; do
-    echo "테스트 시리즈 시작: $model (API: $api_type, 컨텍스트: $context)" | tee -a "$log_file"
-
-    # 메모리 정리 및 모델 다운로드 (Ollama specific)
-    if [ "$api_type" == "ollama" ]; then
-      # ... (Ollama cleanup/pull logic remains here) ...
-    fi
-
-    # 결과 파일명 (include api_type)
-    result_file_initial="${results_dir}/${safe_model_name}_${api_type}_ctx${context}_${timestamp}_initial.json"
-    result_file_continuous_base="${results_dir}/${safe_model_name}_${api_type}_ctx${context}_${timestamp}_continuous"
-
-    # 1. 초기 로딩 테스트
-    echo "초기 로딩 테스트 실행 중..." | tee -a "$log_file"
-    # vLLM uses the base URL for the OpenAI compatible server
-    run_test_api_url=$api_url 
-    python run_test.py --api-type "$api_type" --api-url "$run_test_api_url" --model "$model" --context "$context" --test-type "initial" > "$result_file_initial" 2>> "$log_file"
-    if [ $? -ne 0 ]; then
-        echo "오류: 초기 테스트 실패 ($model, 컨텍스트 $context)" | tee -a "$log_file"
-        # Optionally skip continuous tests if initial fails
-        # continue
-    fi
-
-    # 2-4. 연속 응답 테스트 (3회)
-    echo "연속 응답 테스트 실행 중..." | tee -a "$log_file"
-    for i in {1..3}; do
-        echo "연속 테스트 #$i 실행 중..." | tee -a "$log_file"
-        result_file_continuous="${result_file_continuous_base}_${i}.json"
-        python run_test.py --api-type "$api_type" --api-url "$run_test_api_url" --model "$model" --context "$context" --test-type "continuous" > "$result_file_continuous" 2>> "$log_file"
-        if [ $? -ne 0 ]; then
-            echo "오류: 연속 테스트 #$i 실패 ($model, 컨텍스트 $context)" | tee -a "$log_file"
-        fi
-        sleep 2 # 짧은 대기 시간
-    done
-
-    # 메모리 정리 (Ollama specific)
-    if [ "$api_type" == "ollama" ]; then
-      # ... (Ollama cleanup logic remains here) ...
-    fi
-
-    echo "테스트 시리즈 완료: $model (API: $api_type, 컨텍스트: $context)" | tee -a "$log_file"
-    echo "----------------------------------------" | tee -a "$log_file"
-  done # End context loop
+  # 모든 컨텍스트의 초기 로딩/연속 응답 테스트를 하나의 Python 프로세스에서 실행
+  # (토크나이저, HTTP 연결, 평가기를 재사용하며 결과 파일 이름은 기존과 동일)
+  echo "배치 세션 실행 중: $model (API: $api_type, 컨텍스트: ${contexts[*]})" | tee -a "$log_file"
+  python batch_session.py --api-type "$api_type" --api-url "$api_url" --models "$model" --contexts "${contexts[@]}" \
+      --continuous-runs 3 --results-dir "$results_dir" --timestamp "$timestamp" > /dev/null 2>> "$log_file"
+  if [ $? -ne 0 ]; then
+      echo "오류: 배치 세션 실패 ($model)" | tee -a "$log_file"
+  fi
+  echo "테스트 시리즈 완료: $model (API: $api_type)" | tee -a "$log_file"
+  echo "----------------------------------------" | tee -a "$log_file"
 
   # --- Stop vLLM container after all contexts for the model are tested ---
   if [ "$api_type" == "vllm" ]; then
@@ -1,33 +1,43 @@
 #!/usr/bin/env python3
 import argparse
+import base64
 import json
+import os
+import random
+import re
 import sys
 import time
+import threading
+import weakref
 import subprocess
-import psutil
-import GPUtil
-import psutil # Added for system RAM monitoring
-import requests
-import openai # Added for OpenAI compatible APIs like TGI
+from array import array
 from datetime import datetime
 from evaluator import ResponseEvaluator, evaluate_model_responses
-import tiktoken # Token counting
+from result_files import JsonlResultWriter, read_jsonl_results
+from tokenizer_registry import TokenizerLoadError, get_registry, get_tokenizer
+
+# Heavy third-party dependencies are imported lazily where they are used, so a run only pays for what it needs:
+# psutil/GPUtil (resource stats), requests (Ollama), openai (TGI/vLLM), httpx and asyncio (concurrent modes), tokenizers/tiktoken (token counting, via tokenizer_registry).
+# bench_startup.py measures the resulting CLI startup time.
 
 # Default URLs (can be overridden by command-line arguments)
 DEFAULT_OLLAMA_URL = "http://localhost:11434"
 DEFAULT_TGI_URL = "http://localhost:8080" # Common default for TGI (Kept for reference)
 DEFAULT_VLLM_URL = "http://localhost:8000" # Default for vLLM OpenAI compatible server
+DEFAULT_SAMPLE_INTERVAL = 0.1 # Background GPU/RAM sampling interval in seconds
+DEFAULT_OUTPUT_RESERVE = 2048 # Tokens of --context left free for the response when prompts are padded
+CHAT_TEMPLATE_ALLOWANCE = 64 # Tokens added by chat templates around the system and user messages
+DEFAULT_PROBE_PREFIX_TOKENS = 4096 # Shared prefix length for --prefix-cache-probe without --context/--fill-tokens
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600} # Go duration units accepted by Ollama's keep_alive
+DEFAULT_OUTPUT_LENGTHS = '128,512,2048,8192' # --output-lengths sweep without a value
+OPENAI_SAMPLING_PARAMS = ('temperature', 'top_p', 'seed', 'stop', 'presence_penalty', 'frequency_penalty', 'max_tokens') # Others go in extra_body
+OLLAMA_SAMPLING_ALIASES = {'max_tokens': 'num_predict', 'repetition_penalty': 'repeat_penalty'} # OpenAI/vLLM name -> Ollama option
 
-# Initialize tokenizer (using tiktoken as an example, adjust if needed for the specific model)
-# Using cl100k_base which is common for many models like GPT-4
-try:
-    encoding = tiktoken.get_encoding("cl100k_base")
-except:
-    encoding = tiktoken.encoding_for_model("gpt-4") # Fallback
 
 def get_gpu_stats():
     """GPU 상태 정보를 가져옵니다."""
     try:
+        import GPUtil
         gpus = GPUtil.getGPUs()
         stats = []
         for gpu in gpus:
@@ -46,6 +56,7 @@ def get_gpu_stats():
 def get_ram_stats():
     """시스템 RAM 상태 정보를 가져옵니다."""
     try:
+        import psutil # Added for system RAM monitoring
         mem = psutil.virtual_memory()
         return {
             'total_gb': mem.total / (1024**3),
@@ -58,43 +69,544 @@ def get_ram_stats():
         print(f"RAM stats error: {e}", file=sys.stderr)
         return "Error fetching RAM stats"
 
+def get_disk_read_bytes():
+    """시스템 전체 디스크 읽기 누적 바이트를 반환합니다 (psutil 이 없거나 지원하지 않으면 None). 구간 전후의 차이로 모델 로드 I/O 를 잽니다."""
+    try:
+        import psutil
+        counters = psutil.disk_io_counters()
+        return counters.read_bytes if counters else None
+    except Exception:
+        return None
+
+def _disk_read_since(before):
+    after = get_disk_read_bytes()
+    return after - before if before is not None and after is not None else None
+
+class ResourceSampler:
+    """요청(또는 전체 실행)이 진행되는 동안 GPU/RAM 사용량을 백그라운드 스레드에서 고정 간격으로 샘플링합니다.
+
+    시작/종료 두 지점만 보던 get_gpu_stats 방식과 달리 실제 피크를 잡아냅니다.
+    피크/평균은 모든 샘플로 계산하고, 시계열은 max_points 를 넘으면 절반으로 솎아내(stride 2배) 크기를 제한합니다.
+    GPU 가 없거나 GPUtil 호출이 실패하면 GPU 항목은 None 으로 두고 RAM 만 계속 샘플링합니다.
+    """
+    COLUMNS = ('offset_sec', 'gpu_memory_util', 'gpu_util', 'gpu_memory_used_mb', 'ram_percent', 'ram_used_gb')
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, max_points: int = 300):
+        self.interval = interval
+        self.max_points = max_points
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+        self._gpu_available = True
+        self._points = []
+        self._stride = 1
+        self._sample_count = 0
+        self._peaks = {}
+        self._sums = {}
+        self._counts = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        """샘플링 스레드를 시작합니다."""
+        self._start_time = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> dict:
+        """샘플링을 멈추고 요약을 반환합니다."""
+        self._stop_event.set()
+        self._thread.join()
+        return self.summary()
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self._stop_event.wait(self.interval):
+                break
+
+    def _read_gpu(self) -> tuple:
+        if not self._gpu_available:
+            return None, None, None
+        try:
+            import GPUtil
+            gpus = GPUtil.getGPUs()
+        except Exception as e:
+            print(f"GPU sampling disabled: {e}", file=sys.stderr)
+            gpus = []
+        if not gpus:
+            self._gpu_available = False
+            return None, None, None
+        return (max(gpu.memoryUtil * 100 for gpu in gpus),
+                max(gpu.load * 100 for gpu in gpus),
+                sum(gpu.memoryUsed for gpu in gpus))
+
+    def _sample(self):
+        offset = time.perf_counter() - self._start_time
+        gpu_memory_util, gpu_util, gpu_memory_used_mb = self._read_gpu()
+        try:
+            import psutil
+            mem = psutil.virtual_memory()
+            ram_percent, ram_used_gb = mem.percent, mem.used / (1024**3)
+        except Exception:
+            ram_percent, ram_used_gb = None, None
+
+        point = (offset, gpu_memory_util, gpu_util, gpu_memory_used_mb, ram_percent, ram_used_gb)
+        for name, value in zip(self.COLUMNS[1:], point[1:]):
+            if value is None:
+                continue
+            self._peaks[name] = max(self._peaks.get(name, value), value)
+            self._sums[name] = self._sums.get(name, 0.0) + value
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+        if self._sample_count % self._stride == 0:
+            self._points.append(point)
+            if len(self._points) > self.max_points:
+                self._points = self._points[::2]
+                self._stride *= 2
+        self._sample_count += 1
+
+    def summary(self) -> dict:
+        """피크/평균과 다운샘플링된 시계열을 반환합니다."""
+        summary = {
+            'interval_sec': self.interval,
+            'samples': self._sample_count,
+            'gpu_available': self._gpu_available,
+        }
+        for name in self.COLUMNS[1:]:
+            count = self._counts.get(name)
+            summary[f'peak_{name}'] = self._peaks.get(name)
+            summary[f'mean_{name}'] = self._sums[name] / count if count else None
+        summary['series'] = {
+            'columns': list(self.COLUMNS),
+            'stride': self._stride,
+            'points': [list(point) for point in self._points],
+        }
+        return summary
+
+def encode_timeline(arrivals: array) -> dict:
+    """청크 도착 시각(perf_counter_ns) 배열을 첫 청크 기준 오프셋(ms, float32 little-endian)으로 압축해 base64 dict 로 반환합니다.
+
+    청크당 4바이트이므로 32k 토큰 응답도 약 170KB(base64) 로 결과 JSON 에 보관할 수 있습니다.
+    """
+    if not arrivals:
+        return {'format': 'float32-le-base64', 'unit': 'ms', 'origin': 'first_chunk', 'count': 0, 'data': ''}
+    origin = arrivals[0]
+    offsets = array('f', ((t - origin) / 1e6 for t in arrivals))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return {
+        'format': 'float32-le-base64',
+        'unit': 'ms',
+        'origin': 'first_chunk',
+        'count': len(offsets),
+        'data': base64.b64encode(offsets.tobytes()).decode('ascii')
+    }
+
+def decode_timeline(timeline: dict) -> array:
+    """encode_timeline 결과를 첫 청크 기준 오프셋(ms) array('f') 로 복원합니다."""
+    offsets = array('f')
+    offsets.frombytes(base64.b64decode(timeline.get('data', '')))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets
+
+def summarize_inter_token_latency(arrivals: array) -> dict:
+    """청크 도착 간격(inter-token latency) 백분위수와 가장 긴 정지 구간을 계산합니다 (입력: ns, 출력 단위: 초)."""
+    gaps = [(arrivals[k] - arrivals[k - 1]) / 1e9 for k in range(1, len(arrivals))]
+    summary = {
+        'chunk_count': len(arrivals),
+        'itl_mean': sum(gaps) / len(gaps) if gaps else None,
+        'longest_stall_sec': None,
+        'longest_stall_offset_sec': None, # 가장 긴 정지가 끝난 시점 (첫 청크 기준)
+    }
+    summary.update(latency_percentiles(gaps, 'itl'))
+    if gaps:
+        stall_index = max(range(len(gaps)), key=gaps.__getitem__)
+        summary['longest_stall_sec'] = gaps[stall_index]
+        summary['longest_stall_offset_sec'] = (arrivals[stall_index + 1] - arrivals[0]) / 1e9
+    return summary
+
+class StreamAccumulator:
+    """스트리밍 응답 청크를 누적합니다.
+
+    측정 구간(hot loop)에서는 청크 append 와 도착 타임스탬프 기록만 수행하고,
+    문자열 결합과 토큰화는 마지막 청크 이후 finish() 에서 한 번에 처리합니다.
+    (루프 안의 `+=` 문자열 결합과 청크별 tiktoken 호출이 generation_time 을 부풀리던 문제 해결)
+    도착 시각은 dict 목록 대신 array('q') 에 단조 시계(perf_counter_ns) 정수로 저장해 청크당 8바이트만 사용합니다.
+    """
+    __slots__ = ('chunks', 'arrivals', 'first_token_ns')
+
+    def __init__(self):
+        self.chunks = []
+        self.arrivals = array('q')
+        self.first_token_ns = None
+
+    def add(self, token_text: str):
+        """청크 하나를 기록합니다 (빈 청크는 호출하지 않음)."""
+        now = time.perf_counter_ns()
+        if self.first_token_ns is None:
+            self.first_token_ns = now
+        self.chunks.append(token_text)
+        self.arrivals.append(now)
+
+    def finish(self, tokenizer) -> tuple:
+        """(응답 전체 텍스트, 모델 토크나이저 기준 생성 토큰 수) 를 반환합니다.
+
+        토큰 수는 청크 경계에 영향받지 않도록 결합된 전체 텍스트를 한 번 인코딩해 계산합니다.
+        """
+        text = "".join(self.chunks)
+        return text, tokenizer.count(text)
+
+    def timeline_metrics(self) -> dict:
+        """inter-token latency 요약과 압축된 청크 도착 타임라인을 반환합니다."""
+        metrics = summarize_inter_token_latency(self.arrivals)
+        metrics['chunk_timeline'] = encode_timeline(self.arrivals)
+        return metrics
+
+def _calculate_stream_metrics(start_ns: int, first_token_ns: int, end_ns: int, generated_tokens: int) -> dict:
+    """스트리밍 타임스탬프(perf_counter_ns)로부터 공통 지연/처리량 메트릭(초 단위)을 계산합니다."""
+    total_time = (end_ns - start_ns) / 1e9
+    time_to_first = (first_token_ns - start_ns) / 1e9 if first_token_ns is not None else None
+    generation_time = (end_ns - first_token_ns) / 1e9 if first_token_ns is not None else None
+    tokens_per_second_calculated = generated_tokens / generation_time if generation_time and generation_time > 0 else 0
+    return {
+        'total_time': total_time,
+        'time_to_first_token': time_to_first,
+        'generated_tokens': generated_tokens,
+        'generation_time': generation_time,
+        'tokens_per_second_calculated': tokens_per_second_calculated,
+    }
+
+def _token_count_metrics(tokenizer, tokenizer_tokens: int, usage_generated: int = None, usage_prompt: int = None) -> dict:
+    """생성/프롬프트 토큰 수와 각 값의 출처를 반환합니다.
+
+    서버가 usage 토큰 수(Ollama eval_count/prompt_eval_count, OpenAI 호환 usage)를 보고하면 그 값을 우선하고,
+    없으면 모델 토크나이저로 센 값을 사용합니다. 비교를 위해 토크나이저 값은 항상 함께 기록합니다.
+    """
+    tokenizer_source = f"tokenizer:{tokenizer.name}"
+    return {
+        'generated_tokens': usage_generated if usage_generated is not None else tokenizer_tokens,
+        'generated_tokens_source': 'server_usage' if usage_generated is not None else tokenizer_source,
+        'generated_tokens_tokenizer': tokenizer_tokens,
+        'prompt_tokens': usage_prompt,
+        'prompt_tokens_source': 'server_usage' if usage_prompt is not None else None,
+        'tokenizer': tokenizer.name,
+    }
+
+def _phase_metrics(metrics: dict, final_metrics: dict, tokenizer, prompt: str, system_prompt: str, fill_stats: dict,
+                   history: list = None) -> dict:
+    """prefill (프롬프트 처리) 와 decode (토큰 생성) 구간을 나눈 메트릭을 반환합니다.
+
+    프롬프트 토큰 수는 서버 usage 를 우선하고, 없으면 시스템 + 사용자 프롬프트를 모델 토크나이저로 셉니다 (채팅 템플릿 토큰 제외).
+    구간 시간은 Ollama 가 보고한 prompt_eval_duration/eval_duration 을 우선하고, 없으면 클라이언트에서 잰
+    TTFT (대기열/네트워크 시간 포함) 와 첫 토큰 이후 시간을 사용합니다. 첫 토큰은 prefill 의 결과이므로
+    클라이언트 기준 decode 처리량은 (생성 토큰 수 - 1) ÷ 첫 토큰 이후 시간입니다.
+    history (멀티턴 세션의 이전 대화) 가 있으면 대화 전체의 토큰 수를 conversation_tokens 로 함께 기록합니다.
+    """
+    request_tokens = (fill_stats.get('prompt_built_tokens') or tokenizer.count(prompt)) + tokenizer.count(system_prompt or '')
+    if history is not None:
+        request_tokens += sum(tokenizer.count(message['content']) for message in history)
+    prompt_tokens = metrics.get('prompt_tokens')
+    prompt_tokens_source = metrics.get('prompt_tokens_source')
+    if prompt_tokens is None:
+        prompt_tokens = request_tokens
+        prompt_tokens_source = f"tokenizer:{tokenizer.name}"
+
+    if final_metrics.get('prompt_eval_duration'):
+        prefill_time, prefill_time_source = final_metrics['prompt_eval_duration'] / 1e9, 'server'
+    else:
+        prefill_time, prefill_time_source = metrics.get('time_to_first_token'), 'ttft'
+    generated_tokens = metrics.get('generated_tokens') or 0
+    if final_metrics.get('eval_duration'):
+        decode_time, decode_time_source = final_metrics['eval_duration'] / 1e9, 'server'
+        decode_tokens = final_metrics.get('eval_count', generated_tokens)
+    else:
+        decode_time, decode_time_source = metrics.get('generation_time'), 'client'
+        decode_tokens = generated_tokens - 1
+    phase = {
+        'prompt_tokens': prompt_tokens,
+        'prompt_tokens_source': prompt_tokens_source,
+        'prefill_time': prefill_time,
+        'prefill_time_source': prefill_time_source,
+        'prefill_tokens_per_second': prompt_tokens / prefill_time if prompt_tokens and prefill_time else None,
+        'decode_time': decode_time,
+        'decode_time_source': decode_time_source,
+        'decode_tokens_per_second': decode_tokens / decode_time if decode_tokens > 0 and decode_time else None,
+    }
+    if history is not None:
+        phase['conversation_tokens'] = request_tokens
+    return phase
+
+def _prompt_request_options(prompt: str, request_options: dict) -> dict:
+    """request_options 에 이 프롬프트 전용 설정 (per_prompt: 워크로드 프로파일에서 뽑은 fill_tokens/max_tokens) 을 덮어쓴 dict 를 반환합니다."""
+    overrides = (request_options or {}).get('per_prompt', {}).get(prompt)
+    if not overrides:
+        return request_options
+    merged = dict(request_options)
+    merged.update(overrides)
+    return merged
+
+def _prepare_prompt(tokenizer, prompt: str, request_options: dict) -> tuple:
+    """request_options 의 fill_tokens 가 있으면 프롬프트를 그 토큰 수까지 코드로 채웁니다 (측정 구간 밖에서 호출).
+
+    (요청에 보낼 프롬프트, 채움 통계 dict) 를 반환합니다. 결과의 'prompt' 에는 원래 시나리오 프롬프트가 남습니다.
+    """
+    fill_tokens = (request_options or {}).get('fill_tokens')
+    if not fill_tokens:
+        return prompt, {}
+    from prompt_builder import get_prompt_builder
+    return get_prompt_builder(tokenizer).fill(prompt, fill_tokens)
+
+def _usage_token_counts(api_type: str, final_metrics: dict, usage) -> tuple:
+    """서버가 보고한 (생성 토큰 수, 프롬프트 토큰 수) 를 반환합니다 (보고하지 않은 값은 None)."""
+    if api_type == 'ollama':
+        return final_metrics.get('eval_count'), final_metrics.get('prompt_eval_count')
+    if usage is not None:
+        return getattr(usage, 'completion_tokens', None), getattr(usage, 'prompt_tokens', None)
+    return None, None
+
+def _openai_request_params(api_type: str, request_options: dict = None) -> dict:
+    """OpenAI 호환 요청의 추가 파라미터를 반환합니다.
+
+    vLLM 에는 usage 토큰 수를 마지막 청크로 받기 위한 stream_options 를 (vLLM 만 지원 확인), request_options 의 max_tokens 는 그대로 전달합니다.
+    output_tokens (응답 길이 고정) 는 max_tokens 로 보내고, vLLM 에는 EOS 에서 멈추지 않도록 ignore_eos/min_tokens 를 함께 보냅니다.
+    sampling (--sampling) 은 OpenAI 표준 파라미터는 그대로, 그 밖의 것 (top_k, min_p, repetition_penalty 등 vLLM 확장) 은 extra_body 로 보냅니다.
+    """
+    params = {}
+    if api_type == 'vllm':
+        params['stream_options'] = {'include_usage': True}
+    for key, value in ((request_options or {}).get('sampling') or {}).items():
+        if key in OPENAI_SAMPLING_PARAMS:
+            params[key] = value
+        else:
+            params.setdefault('extra_body', {})[key] = value
+    if (request_options or {}).get('max_tokens'):
+        params['max_tokens'] = request_options['max_tokens']
+    output_tokens = (request_options or {}).get('output_tokens')
+    if output_tokens:
+        params['max_tokens'] = output_tokens
+        if api_type == 'vllm': # vLLM sampling extensions; TGI has no equivalent, so there it is only a cap
+            params.setdefault('extra_body', {}).update(ignore_eos=True, min_tokens=output_tokens)
+    return params
+
+def _ollama_api_metrics(final_metrics: dict, generated_tokens: int, tokens_per_second_calculated: float) -> dict:
+    """Ollama 최종 청크(done=true)에서 API 보고 메트릭을 추출합니다."""
+    ollama_eval_count = final_metrics.get('eval_count', generated_tokens)
+    ollama_eval_duration_ns = final_metrics.get('eval_duration', 0)
+    ollama_tps = (ollama_eval_count / (ollama_eval_duration_ns / 1e9)) if ollama_eval_duration_ns > 0 else tokens_per_second_calculated
+    return {
+        'api_eval_count': ollama_eval_count, # Renamed
+        'api_eval_duration_sec': ollama_eval_duration_ns / 1e9 if ollama_eval_duration_ns else None, # Renamed
+        'api_tokens_per_second': ollama_tps, # Renamed
+        'api_load_duration_sec': final_metrics.get('load_duration', 0) / 1e9 if final_metrics.get('load_duration') else None, # Renamed
+        'api_prompt_eval_count': final_metrics.get('prompt_eval_count'), # Renamed
+        'api_prompt_eval_duration_sec': final_metrics.get('prompt_eval_duration', 0) / 1e9 if final_metrics.get('prompt_eval_duration') else None # Renamed
+    }
+
+def _ollama_options(request_options: dict) -> dict:
+    """request_options 를 Ollama 요청의 options 로 변환합니다 (num_ctx: 컨텍스트 창 크기, max_tokens/output_tokens -> num_predict).
+
+    Ollama 에는 ignore_eos 가 없으므로 output_tokens 는 상한으로만 동작합니다 (모델이 먼저 끝내면 더 짧음).
+    sampling (--sampling) 은 OpenAI 이름을 Ollama 이름으로 바꿔 (max_tokens -> num_predict 등) 그대로 넣습니다.
+    """
+    options = {}
+    for key, value in ((request_options or {}).get('sampling') or {}).items():
+        options[OLLAMA_SAMPLING_ALIASES.get(key, key)] = value
+    if (request_options or {}).get('num_ctx'):
+        options['num_ctx'] = request_options['num_ctx'] # Without it Ollama silently truncates long prompts to its default window
+    if (request_options or {}).get('max_tokens'):
+        options['num_predict'] = request_options['max_tokens']
+    if (request_options or {}).get('output_tokens'):
+        options['num_predict'] = request_options['output_tokens']
+    return options
+
+def _build_ollama_payload(model: str, prompt: str, system_prompt: str, request_options: dict = None) -> dict:
+    """Ollama /api/generate 스트리밍 요청 본문을 구성합니다."""
+    payload = {
+        "prompt": prompt,
+        "model": model,
+        "stream": True,
+        "system": system_prompt,
+        "raw": False # Assuming we want templating
+    }
+    options = _ollama_options(request_options)
+    if options:
+        payload["options"] = options
+    if (request_options or {}).get('keep_alive') is not None:
+        payload["keep_alive"] = request_options['keep_alive'] # How long Ollama keeps the model loaded afterwards (0 = unload)
+    return payload
+
+def _build_ollama_chat_payload(model: str, prompt: str, system_prompt: str, history: list, request_options: dict = None) -> dict:
+    """이전 대화(history)를 포함한 Ollama /api/chat 스트리밍 요청 본문을 구성합니다."""
+    payload = {
+        "model": model,
+        "messages": _build_openai_messages(prompt, system_prompt, history),
+        "stream": True,
+    }
+    options = _ollama_options(request_options)
+    if options:
+        payload["options"] = options
+    if (request_options or {}).get('keep_alive') is not None:
+        payload["keep_alive"] = request_options['keep_alive'] # How long Ollama keeps the model loaded afterwards (0 = unload)
+    return payload
+
+def _build_openai_messages(prompt: str, system_prompt: str, history: list = None) -> list:
+    """OpenAI 호환 chat 메시지 목록을 구성합니다 (history 는 이전 user/assistant 메시지)."""
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.extend(history or [])
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+# --- Persistent per-endpoint connections ---
+
+class ConnectionTracker:
+    """응답이 사용한 연결 객체를 기억해 연결 재사용(warm) 여부를 판별합니다.
+
+    requests(urllib3) 는 response.raw.connection, httpx 는 response.extensions['network_stream'] 를 관찰합니다.
+    WeakSet 을 사용하므로 닫힌 연결은 자동으로 잊혀집니다.
+    """
+    def __init__(self):
+        self._connections = weakref.WeakSet()
+
+    def observe(self, connection) -> bool:
+        """연결 객체를 기록하고, 이전에 본 연결이면 True 를 반환합니다 (판별 불가 시 None)."""
+        if connection is None:
+            return None
+        try:
+            reused = connection in self._connections
+            self._connections.add(connection)
+        except TypeError: # Object does not support weak references
+            return None
+        return reused
+
+    def observe_requests_response(self, response) -> bool:
+        return self.observe(getattr(response.raw, 'connection', None))
+
+    def observe_httpx_response(self, response) -> bool:
+        return self.observe(response.extensions.get('network_stream'))
+
+class EndpointPool:
+    """엔드포인트(api_url)별로 실행 전체에 걸쳐 유지되는 HTTP 세션/클라이언트를 보관합니다.
+
+    매 프롬프트마다 새 TCP 연결을 맺던 비용이 TTFT 에 섞이지 않도록 keep-alive 연결을 재사용하고,
+    각 요청이 기존 연결을 재사용했는지를 tracker 로 기록합니다.
+    """
+    def __init__(self, api_url: str):
+        self.api_url = api_url
+        self.tracker = ConnectionTracker()
+        self._session = None
+        self._openai_client = None
+
+    @property
+    def session(self):
+        """Ollama 용 requests.Session (지연 생성)."""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    @property
+    def openai_client(self):
+        """TGI/vLLM 용 OpenAI 호환 클라이언트 (지연 생성)."""
+        if self._openai_client is None:
+            import openai # Added for OpenAI compatible APIs like TGI
+            self._openai_client = openai.OpenAI(base_url=f"{self.api_url}/v1", api_key="dummy") # Use dummy key for local servers
+        return self._openai_client
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+        if self._openai_client is not None:
+            self._openai_client.close()
+
+_endpoint_pools = {}
+
+def _api_error_types(api_type: str, async_client: bool = False) -> tuple:
+    """API 타입별로 '서버/통신 오류' 로 분류할 예외 타입을 반환합니다 (해당 라이브러리만 임포트)."""
+    if api_type == 'ollama':
+        if async_client:
+            import httpx
+            return (httpx.HTTPError,)
+        import requests
+        return (requests.exceptions.RequestException,)
+    if api_type == 'tgi' or api_type == 'vllm':
+        import openai
+        return (openai.APIError,)
+    return ()
+
+def get_endpoint_pool(api_url: str) -> EndpointPool:
+    """api_url 에 해당하는 EndpointPool 을 반환합니다 (프로세스 내에서 재사용)."""
+    pool = _endpoint_pools.get(api_url)
+    if pool is None:
+        pool = _endpoint_pools[api_url] = EndpointPool(api_url)
+    return pool
+
+def close_endpoint_pools():
+    """열려 있는 모든 엔드포인트 연결을 닫습니다."""
+    for pool in _endpoint_pools.values():
+        pool.close()
+    _endpoint_pools.clear()
+
 # Renamed function to be more generic
-def run_api_query(api_type: str, api_url: str, model: str, prompt: str, system_prompt: str) -> dict:
-    """API를 사용하여 쿼리를 실행하고 스트리밍으로 결과를 처리합니다."""
-    start_time = time.time()
-    first_token_time = None
-    response_text = ""
-    generated_tokens = 0
-    generation_start_time = None
+def run_api_query(api_type: str, api_url: str, model: str, prompt: str, system_prompt: str,
+                  sample_interval: float = DEFAULT_SAMPLE_INTERVAL, request_options: dict = None, history: list = None) -> dict:
+    """API를 사용하여 쿼리를 실행하고 스트리밍으로 결과를 처리합니다.
+
+    측정 구간은 HTTP 요청 전송 직전부터 마지막 청크 수신까지이며 단조 시계(perf_counter_ns)를 사용합니다.
+    GPU/RAM 스냅샷, 클라이언트 생성, 토큰화 등 하네스 자체 비용은 구간 밖에서 수행하고
+    harness_overhead_sec 로 따로 기록합니다.
+    연결은 get_endpoint_pool() 로 실행 전체에서 재사용하며, 재사용 여부를 connection_reused 로 기록합니다.
+    sample_interval 이 주어지면 요청 동안 ResourceSampler 로 GPU/RAM 시계열을 수집합니다 (None 이면 비활성).
+    request_options 는 백엔드 공통 요청 설정입니다 (num_ctx: Ollama 컨텍스트 창, fill_tokens: 프롬프트를 채울 목표 토큰 수,
+    max_tokens: 응답 길이 상한, per_prompt: 프롬프트별로 덮어쓸 설정).
+    history 가 주어지면 (빈 목록 포함) 이전 대화를 함께 보내는 멀티턴 요청으로, Ollama 는 /api/chat 을 사용합니다.
+    """
+    call_start_ns = time.perf_counter_ns()
+    pool = get_endpoint_pool(api_url)
+    sampler = None
+    accumulator = StreamAccumulator()
     final_metrics = {} # API specific final metrics
-    gpu_stats_start = get_gpu_stats() # Get GPU stats before generation
-    ram_stats_start = get_ram_stats() # Get RAM stats before generation
+    usage = None # Server-reported token counts (OpenAI compatible APIs)
+    connection_reused = None
 
     try:
+        # Inside the try: a tokenizer that fails to load (corrupt tokenizer.json, no network for tiktoken) fails this request only
+        tokenizer = get_tokenizer(model) # Cached after the first call for this model
+        request_options = _prompt_request_options(prompt, request_options)
+        prompt, fill_stats = _prepare_prompt(tokenizer, prompt, request_options)
+        gpu_stats_start = get_gpu_stats() # Get GPU stats before generation
+        ram_stats_start = get_ram_stats() # Get RAM stats before generation
+        sampler = ResourceSampler(sample_interval) if sample_interval else None
+        if sampler:
+            sampler.start()
+
         if api_type == 'ollama':
             # --- Ollama API Call ---
-            data = {
-                "prompt": prompt,
-                "model": model,
-                "stream": True,
-                "system": system_prompt,
-                "raw": False # Assuming we want templating
-            }
-            ollama_api_endpoint = f"{api_url}/api/generate" # Construct endpoint URL
+            if history is None:
+                data = _build_ollama_payload(model, prompt, system_prompt, request_options)
+                ollama_api_endpoint = f"{api_url}/api/generate" # Construct endpoint URL
+            else:
+                data = _build_ollama_chat_payload(model, prompt, system_prompt, history, request_options)
+                ollama_api_endpoint = f"{api_url}/api/chat" # Whole conversation is re-sent on every turn
 
-            with requests.post(ollama_api_endpoint, json=data, stream=True) as response:
+            start_ns = time.perf_counter_ns()
+            with pool.session.post(ollama_api_endpoint, json=data, stream=True) as response:
+                connection_reused = pool.tracker.observe_requests_response(response)
                 response.raise_for_status()
                 for line in response.iter_lines():
                     if line:
                         try:
-                            chunk = json.loads(line.decode('utf-8'))
-                            if 'response' in chunk and chunk['response'] and first_token_time is None:
-                                first_token_time = time.time()
-                                generation_start_time = first_token_time
-                            if 'response' in chunk:
-                                token_text = chunk['response']
-                                response_text += token_text
-                                generated_tokens += len(encoding.encode(token_text))
+                            chunk = json.loads(line)
+                            token_text = chunk.get('response') or (chunk.get('message') or {}).get('content') # generate / chat
+                            if token_text:
+                                accumulator.add(token_text)
                             if chunk.get('done', False):
                                 final_metrics = chunk # Store Ollama specific metrics
                                 break
@@ -107,78 +619,67 @@ def run_api_query(api_type: str, api_url: str, model: str, prompt: str, system_p
             # --- OpenAI Compatible API Call (TGI / vLLM) ---
             # Note: Specific parameters might differ slightly between TGI and vLLM
             # Use the provided api_url which should point to the correct base (e.g., http://host:port)
-            client = openai.OpenAI(base_url=f"{api_url}/v1", api_key="dummy") # Use dummy key for local servers
+            client = pool.openai_client
 
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            messages.append({"role": "user", "content": prompt})
+            messages = _build_openai_messages(prompt, system_prompt, history)
 
             # Use the model name passed from the batch script
             # For vLLM, this should be the Hugging Face model ID (e.g., "Qwen/Qwen2.5-Coder-32B-Instruct")
             # For TGI, it was also the Hugging Face model ID
+            start_ns = time.perf_counter_ns()
             stream = client.chat.completions.create(
                 model=model, 
                 messages=messages,
                 stream=True,
-                # Add other parameters if needed (e.g., max_tokens, temperature)
-                # max_tokens=1024, # Example
+                **_openai_request_params(api_type, request_options),
+                # Add other parameters if needed (e.g., temperature)
             )
+            connection_reused = pool.tracker.observe_httpx_response(stream.response)
 
             for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage # Final chunk when include_usage is set
                 if not chunk.choices: continue
                 delta = chunk.choices[0].delta
 
                 if delta.content:
-                    if first_token_time is None:
-                        first_token_time = time.time()
-                        generation_start_time = first_token_time
-                    token_text = delta.content
-                    response_text += token_text
-                    generated_tokens += len(encoding.encode(token_text))
+                    accumulator.add(delta.content)
 
-            # OpenAI compatible APIs (TGI, vLLM) don't typically provide detailed final metrics like Ollama in the stream
-            # We will rely on calculated metrics
+            # OpenAI compatible APIs (TGI, vLLM) don't provide detailed final metrics like Ollama in the stream
+            # We rely on calculated metrics, plus the usage token counts when the server sends them
 
         else:
             raise ValueError(f"Unsupported API type: {api_type}")
 
-        end_time = time.time()
+        end_ns = time.perf_counter_ns()
+        resource_timeline = sampler.stop() if sampler else None
         gpu_stats_end = get_gpu_stats() # Get GPU stats after generation
         ram_stats_end = get_ram_stats() # Get RAM stats after generation
 
-        # --- Calculate Metrics ---
-        total_time = end_time - start_time
-        time_to_first = first_token_time - start_time if first_token_time else None
-        generation_time = end_time - generation_start_time if generation_start_time else None
-        tokens_per_second_calculated = generated_tokens / generation_time if generation_time and generation_time > 0 else 0
-
-        # Prepare metrics dictionary - more generic names
-        metrics_output = {
-            'total_time': total_time,
-            'time_to_first_token': time_to_first,
-            'generated_tokens': generated_tokens,
-            'generation_time': generation_time,
-            'tokens_per_second_calculated': tokens_per_second_calculated,
+        # --- Calculate Metrics (tokenization happens here, outside the timed stream loop) ---
+        response_text, tokenizer_tokens = accumulator.finish(tokenizer)
+        token_metrics = _token_count_metrics(tokenizer, tokenizer_tokens, *_usage_token_counts(api_type, final_metrics, usage))
+        generated_tokens = token_metrics['generated_tokens']
+        metrics_output = _calculate_stream_metrics(start_ns, accumulator.first_token_ns, end_ns, generated_tokens)
+        metrics_output.update(token_metrics)
+        metrics_output.update(fill_stats)
+        metrics_output.update(_phase_metrics(metrics_output, final_metrics, tokenizer, prompt, system_prompt, fill_stats, history))
+        metrics_output.update(accumulator.timeline_metrics())
+        metrics_output.update({
             'gpu_stats_start': gpu_stats_start,
             'gpu_stats_end': gpu_stats_end,
             'ram_stats_start': ram_stats_start, # Added RAM stats
-            'ram_stats_end': ram_stats_end      # Added RAM stats
-        }
+            'ram_stats_end': ram_stats_end,     # Added RAM stats
+            'resource_timeline': resource_timeline, # Background-sampled GPU/RAM peak/mean/series
+            'connection_reused': connection_reused  # False = new TCP connection (cold), True = pooled keep-alive (warm)
+        })
 
         # Add API-specific metrics if available (primarily for Ollama)
         if api_type == 'ollama' and final_metrics:
-            ollama_eval_count = final_metrics.get('eval_count', generated_tokens)
-            ollama_eval_duration_ns = final_metrics.get('eval_duration', 0)
-            ollama_tps = (ollama_eval_count / (ollama_eval_duration_ns / 1e9)) if ollama_eval_duration_ns > 0 else tokens_per_second_calculated
-            metrics_output.update({
-                'api_eval_count': ollama_eval_count, # Renamed
-                'api_eval_duration_sec': ollama_eval_duration_ns / 1e9 if ollama_eval_duration_ns else None, # Renamed
-                'api_tokens_per_second': ollama_tps, # Renamed
-                'api_load_duration_sec': final_metrics.get('load_duration', 0) / 1e9 if final_metrics.get('load_duration') else None, # Renamed
-                'api_prompt_eval_count': final_metrics.get('prompt_eval_count'), # Renamed
-                'api_prompt_eval_duration_sec': final_metrics.get('prompt_eval_duration', 0) / 1e9 if final_metrics.get('prompt_eval_duration') else None # Renamed
-            })
+            metrics_output.update(_ollama_api_metrics(final_metrics, generated_tokens, metrics_output['tokens_per_second_calculated']))
+
+        # 하네스 자체 비용 = 함수 전체 소요 시간 - HTTP 측정 구간
+        metrics_output['harness_overhead_sec'] = ((time.perf_counter_ns() - call_start_ns) - (end_ns - start_ns)) / 1e9
 
         return {
             'success': True,
@@ -186,7 +687,7 @@ def run_api_query(api_type: str, api_url: str, model: str, prompt: str, system_p
             'metrics': metrics_output
         }
 
-    except (requests.exceptions.RequestException, openai.APIError) as e: # Catch both requests and openai errors
+    except _api_error_types(api_type) as e: # requests errors for Ollama, openai errors for TGI/vLLM
         return {
             'success': False,
             'error': f"API error: {e}" # Generic API error message
@@ -196,19 +697,1183 @@ def run_api_query(api_type: str, api_url: str, model: str, prompt: str, system_p
             'success': False,
             'error': f"General error: {str(e)}"
         }
+    finally:
+        if sampler:
+            sampler.stop() # No-op if already stopped; makes sure the thread ends on errors
 
-def main():
+# --- Concurrent load engine (asyncio) ---
+
+def _create_async_client(api_type: str, api_url: str, concurrency: int = None):
+    """동시 부하 테스트용 비동기 클라이언트를 생성합니다 (연결 수를 동시성에 맞춤, None 이면 무제한)."""
+    import httpx # Async streaming client for concurrent load tests
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(None, connect=30.0) # Long generations must not time out mid-stream
+    if api_type == 'ollama':
+        return httpx.AsyncClient(base_url=api_url, limits=limits, timeout=timeout)
+    elif api_type == 'tgi' or api_type == 'vllm':
+        import openai
+        http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return openai.AsyncOpenAI(base_url=f"{api_url}/v1", api_key="dummy", http_client=http_client, max_retries=0)
+    raise ValueError(f"Unsupported API type: {api_type}")
+
+async def _close_async_client(client):
+    """비동기 클라이언트를 종료합니다."""
+    if hasattr(client, 'aclose'): # httpx.AsyncClient
+        await client.aclose()
+    else: # openai.AsyncOpenAI
+        await client.close()
+
+async def run_api_query_async(api_type: str, client, model: str, prompt: str, system_prompt: str, batch_start_ns: int,
+                              tracker: ConnectionTracker = None, request_options: dict = None) -> dict:
+    """비동기 스트리밍으로 쿼리를 실행합니다. run_api_query 와 동일한 결과 구조와 측정 구간을 사용합니다."""
+    call_start_ns = time.perf_counter_ns()
+    accumulator = StreamAccumulator()
+    final_metrics = {}
+    usage = None
+    connection_reused = None
+
+    try:
+        tokenizer = get_tokenizer(model)
+        request_options = _prompt_request_options(prompt, request_options)
+        prompt, fill_stats = _prepare_prompt(tokenizer, prompt, request_options) # Cached when run_prompts pre-built it
+        if api_type == 'ollama':
+            data = _build_ollama_payload(model, prompt, system_prompt, request_options)
+            start_ns = time.perf_counter_ns()
+            async with client.stream('POST', '/api/generate', json=data) as response:
+                if tracker:
+                    connection_reused = tracker.observe_httpx_response(response)
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        print(f"JSON decode error in Ollama stream: {e} - Line: {line}", file=sys.stderr)
+                        continue
+                    token_text = chunk.get('response')
+                    if token_text:
+                        accumulator.add(token_text)
+                    if chunk.get('done', False):
+                        final_metrics = chunk
+                        break
+
+        elif api_type == 'tgi' or api_type == 'vllm':
+            messages = _build_openai_messages(prompt, system_prompt)
+            start_ns = time.perf_counter_ns()
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                **_openai_request_params(api_type, request_options),
+            )
+            if tracker:
+                connection_reused = tracker.observe_httpx_response(stream.response)
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices: continue
+                token_text = chunk.choices[0].delta.content
+                if token_text:
+                    accumulator.add(token_text)
+
+        else:
+            raise ValueError(f"Unsupported API type: {api_type}")
+
+        end_ns = time.perf_counter_ns()
+        response_text, tokenizer_tokens = accumulator.finish(tokenizer)
+        token_metrics = _token_count_metrics(tokenizer, tokenizer_tokens, *_usage_token_counts(api_type, final_metrics, usage))
+        generated_tokens = token_metrics['generated_tokens']
+        metrics_output = _calculate_stream_metrics(start_ns, accumulator.first_token_ns, end_ns, generated_tokens)
+        metrics_output.update(token_metrics)
+        metrics_output.update(fill_stats)
+        metrics_output.update(_phase_metrics(metrics_output, final_metrics, tokenizer, prompt, system_prompt, fill_stats))
+        metrics_output.update(accumulator.timeline_metrics())
+        # Offsets relative to the load batch start, so overlap between requests can be reconstructed
+        metrics_output['request_start_offset'] = (start_ns - batch_start_ns) / 1e9
+        metrics_output['request_end_offset'] = (end_ns - batch_start_ns) / 1e9
+        metrics_output['connection_reused'] = connection_reused
+        if api_type == 'ollama' and final_metrics:
+            metrics_output.update(_ollama_api_metrics(final_metrics, generated_tokens, metrics_output['tokens_per_second_calculated']))
+        metrics_output['harness_overhead_sec'] = ((time.perf_counter_ns() - call_start_ns) - (end_ns - start_ns)) / 1e9
+
+        return {
+            'success': True,
+            'response': response_text,
+            'metrics': metrics_output
+        }
+
+    except _api_error_types(api_type, async_client=True) as e:
+        return {
+            'success': False,
+            'error': f"API error: {e}"
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f"General error: {str(e)}"
+        }
+
+def summarize_load(prompt_results: list, wall_time: float) -> dict:
+    """동시 실행 결과에서 서버 전체 처리량(aggregate tokens/sec) 등 집계 메트릭을 계산합니다."""
+    successful = [r['result']['metrics'] for r in prompt_results if r['result']['success']]
+    total_tokens = sum(m['generated_tokens'] for m in successful)
+    total_prompt_tokens = sum(m.get('prompt_tokens') or 0 for m in successful)
+    ttfts = [m['time_to_first_token'] for m in successful if m['time_to_first_token'] is not None]
+    tps_values = [m['tokens_per_second_calculated'] for m in successful]
+    return {
+        'wall_time': wall_time,
+        'total_requests': len(prompt_results),
+        'successful_requests': len(successful),
+        'failed_requests': len(prompt_results) - len(successful),
+        'total_generated_tokens': total_tokens,
+        'total_prompt_tokens': total_prompt_tokens,
+        'aggregate_tokens_per_second': total_tokens / wall_time if wall_time > 0 else 0,
+        'aggregate_prompt_tokens_per_second': total_prompt_tokens / wall_time if wall_time > 0 else 0,
+        'requests_per_second': len(successful) / wall_time if wall_time > 0 else 0,
+        'mean_time_to_first_token': sum(ttfts) / len(ttfts) if ttfts else None,
+        'mean_tokens_per_second_per_request': sum(tps_values) / len(tps_values) if tps_values else None,
+    }
+
+async def run_concurrent_queries(api_type: str, api_url: str, model: str, jobs: list, system_prompt: str, concurrency: int,
+                                 on_result=None, request_options: dict = None) -> tuple:
+    """여러 스트리밍 요청을 하나의 이벤트 루프에서 최대 concurrency 개까지 동시에 실행합니다.
+
+    jobs 는 (scenario_id, prompt_index, prompt_text) 튜플 목록이며,
+    (test_results 형식의 프롬프트 결과 목록, 집계 메트릭) 을 반환합니다.
+    on_result 가 있으면 각 프롬프트 결과가 끝나는 즉시 호출합니다.
+    """
+    import asyncio
+    client = _create_async_client(api_type, api_url, concurrency)
+    tracker = ConnectionTracker()
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_start_ns = time.perf_counter_ns()
+
+    async def _worker(job):
+        scenario_id, prompt_index, prompt_text = job
+        async with semaphore:
+            result = await run_api_query_async(api_type, client, model, prompt_text, system_prompt, batch_start_ns, tracker, request_options)
+        prompt_result = {
+            'scenario_id': scenario_id,
+            'prompt_index': prompt_index,
+            'prompt': prompt_text,
+            'result': result
+        }
+        if on_result:
+            on_result(prompt_result)
+        return prompt_result
+
+    try:
+        prompt_results = await asyncio.gather(*(_worker(job) for job in jobs))
+    finally:
+        await _close_async_client(client)
+
+    summary = summarize_load(prompt_results, (time.perf_counter_ns() - batch_start_ns) / 1e9)
+    summary['concurrency'] = concurrency
+    return prompt_results, summary
+
+# --- Offline batch mode (one /v1/completions request with a prompt list) ---
+
+def _completion_prompt(prompt: str, system_prompt: str) -> str:
+    """/v1/completions 는 채팅 템플릿을 적용하지 않으므로 시스템 프롬프트를 평문으로 앞에 붙입니다."""
+    return f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+
+def run_batch_query(api_type: str, api_url: str, model: str, prompts: list, system_prompt: str, n: int = 1,
+                    request_options: dict = None) -> dict:
+    """prompts 를 OpenAI 호환 /v1/completions 요청 하나 (prompt 목록 + n) 로 보내고 항목별 스트리밍 타이밍을 기록합니다.
+
+    서버가 모든 항목을 한 번에 스케줄하므로 오프라인 일괄 작업 (문서 생성 등) 의 최선 처리량을 잽니다.
+    choices[].index = 프롬프트 순번 * n + 표본 순번 이며, 항목별 TTFT 와 지연 (요청 시작부터 그 항목의 마지막 청크까지) 을
+    run_api_query 와 같은 메트릭 이름으로 기록합니다. 항목별 생성 토큰 수는 모델 토크나이저로 세고 (usage 는 요청 전체 합계),
+    배치 전체의 처리량은 'batch' 에 기록합니다. Ollama 는 목록 프롬프트를 지원하지 않습니다.
+    """
+    if api_type not in ('vllm', 'tgi'):
+        return {'success': False, 'error': f"Batch mode needs an OpenAI compatible /v1/completions endpoint (not {api_type})"}
+    pool = get_endpoint_pool(api_url)
+    accumulators = [StreamAccumulator() for _ in range(len(prompts) * n)]
+    usage = None
+    try:
+        tokenizer = get_tokenizer(model)
+        sent_prompts, fill_stats = [], []
+        for prompt in prompts:
+            sent, stats = _prepare_prompt(tokenizer, prompt, _prompt_request_options(prompt, request_options))
+            sent_prompts.append(_completion_prompt(sent, system_prompt))
+            fill_stats.append(stats)
+        client = pool.openai_client # Created outside the measured window
+        start_ns = time.perf_counter_ns()
+        stream = client.completions.create(
+            model=model,
+            prompt=sent_prompts,
+            n=n,
+            stream=True,
+            **_openai_request_params(api_type, request_options),
+        )
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            for choice in chunk.choices or ():
+                if choice.text:
+                    accumulators[choice.index].add(choice.text)
+        end_ns = time.perf_counter_ns()
+    except _api_error_types(api_type) as e:
+        return {'success': False, 'error': f"API error: {e}"}
+    except Exception as e:
+        return {'success': False, 'error': f"General error: {str(e)}"}
+
+    items = []
+    for index, accumulator in enumerate(accumulators):
+        position, sample_index = divmod(index, n)
+        response_text, tokenizer_tokens = accumulator.finish(tokenizer)
+        item_end_ns = accumulator.arrivals[-1] if accumulator.arrivals else end_ns
+        metrics = _calculate_stream_metrics(start_ns, accumulator.first_token_ns, item_end_ns, tokenizer_tokens)
+        metrics.update(_token_count_metrics(tokenizer, tokenizer_tokens))
+        metrics.update(fill_stats[position])
+        metrics.update(accumulator.timeline_metrics())
+        metrics.update({'batch_size': len(prompts), 'batch_n': n, 'batch_position': position, 'sample_index': sample_index})
+        items.append({'position': position, 'sample_index': sample_index, 'response': response_text, 'metrics': metrics})
+    wall_time = (end_ns - start_ns) / 1e9
+    generated_tokens = usage.completion_tokens if usage else sum(item['metrics']['generated_tokens'] for item in items)
+    return {
+        'success': True,
+        'items': items,
+        'batch': {
+            'prompts': len(prompts),
+            'n': n,
+            'wall_time': wall_time,
+            'generated_tokens': generated_tokens,
+            'generated_tokens_source': 'server_usage' if usage else f"tokenizer:{tokenizer.name}",
+            'prompt_tokens': usage.prompt_tokens if usage else None,
+            'aggregate_tokens_per_second': generated_tokens / wall_time if wall_time > 0 else 0,
+        }
+    }
+
+def summarize_batches(batches: list, prompt_results: list, batch_size: int, n: int) -> dict:
+    """배치 요청들의 집계: 전체 생성 토큰 ÷ 배치 요청 시간의 합 (aggregate tokens/sec) 과 항목별 지연/TTFT 백분위수."""
+    wall_time = sum(b['wall_time'] for b in batches)
+    generated_tokens = sum(b['generated_tokens'] for b in batches)
+    successful = [r['result']['metrics'] for r in prompt_results if r['result']['success']]
+    summary = {
+        'batch_size': batch_size,
+        'n': n,
+        'batch_requests': len(batches),
+        'total_items': len(prompt_results),
+        'successful_items': len(successful),
+        'wall_time': wall_time,
+        'total_generated_tokens': generated_tokens,
+        'aggregate_tokens_per_second': generated_tokens / wall_time if wall_time > 0 else 0,
+        'batches': batches,
+    }
+    summary.update(latency_percentiles([m['total_time'] for m in successful], 'item_latency'))
+    summary.update(latency_percentiles([m['time_to_first_token'] for m in successful if m['time_to_first_token'] is not None], 'ttft'))
+    return summary
+
+# --- Open-loop arrival mode ---
+
+def _mean(values: list):
+    """평균을 계산합니다. 값이 없으면 None."""
+    return sum(values) / len(values) if values else None
+
+def _percentile(values: list, q: float):
+    """선형 보간 백분위수를 계산합니다 (q: 0-100). 값이 없으면 None."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def latency_percentiles(values: list, prefix: str, quantiles=(50, 90, 99)) -> dict:
+    """지연 시간 목록의 p50/p90/p99 를 '{prefix}_p50' 형태의 키로 반환합니다."""
+    return {f"{prefix}_p{q}": _percentile(values, q) for q in quantiles}
+
+def arrival_offsets(rate: float, count: int, process: str, rng: random.Random) -> list:
+    """목표 요청률(req/s)에 맞춘 도착 시각 오프셋(초)을 생성합니다 (poisson 또는 constant)."""
+    offsets = []
+    current = 0.0
+    for _ in range(count):
+        offsets.append(current)
+        if process == 'poisson':
+            current += rng.expovariate(rate)
+        else:
+            current += 1.0 / rate
+    return offsets
+
+async def run_open_loop(api_type: str, api_url: str, model: str, jobs: list, system_prompt: str, rate: float,
+                        num_requests: int, arrival_process: str = 'poisson', max_in_flight: int = None,
+                        request_timeout: float = None, late_threshold: float = 0.05, seed: int = None, on_result=None,
+                        request_options: dict = None) -> tuple:
+    """응답 완료를 기다리지 않고 목표 요청률로 요청을 발사하는 open-loop 부하를 실행합니다.
+
+    도착 시각은 이전 요청의 완료와 무관하게 미리 정해지므로 서버의 대기열 지연이 TTFT/E2E 에 그대로 드러납니다.
+    max_in_flight 를 넘는 도착과 request_timeout 을 넘긴 요청은 dropped, 예정 시각보다
+    late_threshold 초 이상 늦게 발사된 요청은 late 로 집계합니다. in_flight 는 태스크를 만들 때 올리므로
+    발사가 밀려 await 없이 여러 요청을 연달아 만들 때도 max_in_flight 검사가 적용됩니다.
+    achieved_rate 는 실제로 발사한 요청의 발사 간격 기준 요청률 (응답 시간 제외) 입니다.
+    on_result 가 있으면 각 프롬프트 결과(dropped 포함)가 끝나는 즉시 호출합니다.
+    """
+    import asyncio
+    rng = random.Random(seed)
+    offsets = arrival_offsets(rate, num_requests, arrival_process, rng)
+    client = _create_async_client(api_type, api_url, max_in_flight)
+    tracker = ConnectionTracker()
+    in_flight = 0
+    batch_start_ns = time.perf_counter_ns()
+
+    async def _fire(job, scheduled_offset, dispatch_lag):
+        nonlocal in_flight
+        scenario_id, prompt_index, prompt_text = job
+        try:
+            result = await asyncio.wait_for(
+                run_api_query_async(api_type, client, model, prompt_text, system_prompt, batch_start_ns, tracker, request_options),
+                timeout=request_timeout
+            )
+        except asyncio.TimeoutError:
+            result = {'success': False, 'dropped': True, 'error': f"Dropped: exceeded request timeout of {request_timeout}s"}
+        finally:
+            in_flight -= 1
+        result['scheduled_offset'] = scheduled_offset
+        result['dispatch_lag'] = dispatch_lag
+        prompt_result = {
+            'scenario_id': scenario_id,
+            'prompt_index': prompt_index,
+            'prompt': prompt_text,
+            'offered_rate': rate,
+            'result': result
+        }
+        if on_result:
+            on_result(prompt_result)
+        return prompt_result
+
+    tasks = []
+    prompt_results = []
+    dispatch_times = []
+    try:
+        for k, scheduled_offset in enumerate(offsets):
+            delay = scheduled_offset - (time.perf_counter_ns() - batch_start_ns) / 1e9
+            if delay > 0:
+                await asyncio.sleep(delay)
+            dispatch_lag = (time.perf_counter_ns() - batch_start_ns) / 1e9 - scheduled_offset
+            job = jobs[k % len(jobs)]
+            if max_in_flight is not None and in_flight >= max_in_flight:
+                prompt_results.append({
+                    'scenario_id': job[0],
+                    'prompt_index': job[1],
+                    'prompt': job[2],
+                    'offered_rate': rate,
+                    'result': {'success': False, 'dropped': True, 'error': f"Dropped: {in_flight} requests already in flight",
+                               'scheduled_offset': scheduled_offset, 'dispatch_lag': dispatch_lag}
+                })
+                if on_result:
+                    on_result(prompt_results[-1])
+                continue
+            in_flight += 1 # Counted here: when dispatch is behind schedule no await runs before the next check
+            dispatch_times.append(scheduled_offset + dispatch_lag)
+            tasks.append(asyncio.create_task(_fire(job, scheduled_offset, dispatch_lag)))
+        prompt_results.extend(await asyncio.gather(*tasks))
+    finally:
+        await _close_async_client(client)
+
+    wall_time = (time.perf_counter_ns() - batch_start_ns) / 1e9
+    prompt_results.sort(key=lambda r: r['result']['scheduled_offset'])
+    successful = [r['result']['metrics'] for r in prompt_results if r['result']['success']]
+    dropped = sum(1 for r in prompt_results if r['result'].get('dropped'))
+    summary = summarize_load(prompt_results, wall_time)
+    summary.update({
+        'offered_rate': rate,
+        'arrival_process': arrival_process,
+        'achieved_rate': (len(dispatch_times) - 1) / (dispatch_times[-1] - dispatch_times[0])
+                         if len(dispatch_times) > 1 and dispatch_times[-1] > dispatch_times[0] else None,
+        'dropped_requests': dropped,
+        'failed_requests': summary['failed_requests'] - dropped,
+        'late_requests': sum(1 for r in prompt_results if r['result']['dispatch_lag'] > late_threshold),
+        'late_threshold': late_threshold,
+    })
+    summary.update(latency_percentiles([m['time_to_first_token'] for m in successful if m['time_to_first_token'] is not None], 'ttft'))
+    summary.update(latency_percentiles([m['total_time'] for m in successful], 'e2e'))
+    return prompt_results, summary
+
+# --- Saturation search (max throughput under a TTFT SLO) ---
+
+def _cycle_jobs(jobs: list, count: int) -> list:
+    """작업 목록을 count 개가 될 때까지 순환 반복합니다."""
+    return [jobs[k % len(jobs)] for k in range(count)]
+
+def find_max_sustainable_level(measure, start, upper_bound, integer: bool = True, resolution: float = 1.0) -> tuple:
+    """SLO 를 만족하는 최대 부하 수준을 ramp-up(2배씩 증가) 후 이분 탐색으로 찾습니다.
+
+    measure(level) 은 'meets_slo' 키를 포함한 측정 지점 dict 를 반환해야 합니다.
+    (최대 만족 수준 또는 None, 측정한 곡선 지점 목록) 을 반환합니다.
+    """
+    measured = {}
+
+    def probe(level):
+        if level not in measured:
+            measured[level] = measure(level)
+        return measured[level]['meets_slo']
+
+    good, bad = None, None
+    level = start
+    while True:
+        if probe(level):
+            good = level
+            if level >= upper_bound:
+                break
+            level = min(level * 2, upper_bound)
+        else:
+            bad = level
+            break
+
+    if good is not None and bad is not None:
+        while bad - good > resolution:
+            mid = (good + bad) // 2 if integer else (good + bad) / 2
+            if mid == good:
+                break
+            if probe(mid):
+                good = mid
+            else:
+                bad = mid
+
+    curve = [measured[k] for k in sorted(measured)]
+    return good, curve
+
+def run_saturation_search(api_type: str, api_url: str, model: str, jobs: list, system_prompt: str, slo_ttft_p95: float,
+                          dimension: str = 'concurrency', max_level: float = 64, requests_per_level: int = None,
+                          rate_resolution: float = 0.25, seed: int = None, on_result=None, request_options: dict = None) -> tuple:
+    """TTFT p95 가 slo_ttft_p95 이하로 유지되는 최대 동시성(또는 요청률)과 그때의 처리량을 찾습니다.
+
+    on_result 가 있으면 각 부하 수준의 측정이 끝날 때마다 (load_level 이 붙은) 프롬프트 결과마다 호출합니다.
+    """
+    import asyncio
+    prompt_results = []
+
+    def measure(level):
+        if dimension == 'concurrency':
+            count = max(requests_per_level or len(jobs), 2 * level)
+            print(f"  Saturation probe: concurrency {level} ({count} requests)", file=sys.stderr)
+            level_results, summary = asyncio.run(run_concurrent_queries(
+                api_type, api_url, model, _cycle_jobs(jobs, count), system_prompt, level, request_options=request_options))
+        else:
+            count = requests_per_level or len(jobs)
+            print(f"  Saturation probe: {level:.2f} req/s ({count} requests)", file=sys.stderr)
+            level_results, summary = asyncio.run(run_open_loop(
+                api_type, api_url, model, jobs, system_prompt, level, count, seed=seed, request_options=request_options))
+        for r in level_results:
+            r['load_level'] = level
+            if on_result:
+                on_result(r)
+        prompt_results.extend(level_results)
+
+        metrics = [r['result']['metrics'] for r in level_results if r['result']['success']]
+        ttfts = [m['time_to_first_token'] for m in metrics if m['time_to_first_token'] is not None]
+        point = {
+            'level': level,
+            'ttft_p95': _percentile(ttfts, 95),
+            'aggregate_tokens_per_second': summary['aggregate_tokens_per_second'],
+            'requests_per_second': summary['requests_per_second'],
+            'successful_requests': summary['successful_requests'],
+            'failed_requests': summary['total_requests'] - summary['successful_requests'],
+        }
+        point['meets_slo'] = point['ttft_p95'] is not None and point['ttft_p95'] <= slo_ttft_p95 and point['failed_requests'] == 0
+        print(f"    TTFT p95: {point['ttft_p95'] or 0:.3f}s, {point['aggregate_tokens_per_second']:.2f} tokens/s -> "
+              f"{'OK' if point['meets_slo'] else 'SLO violated'}", file=sys.stderr)
+        return point
+
+    if dimension == 'concurrency':
+        best_level, curve = find_max_sustainable_level(measure, 1, int(max_level), integer=True, resolution=1)
+    else:
+        start = min(0.5, max_level)
+        best_level, curve = find_max_sustainable_level(measure, start, float(max_level), integer=False, resolution=rate_resolution)
+
+    best_point = next((p for p in curve if p['level'] == best_level), None)
+    summary = {
+        'dimension': dimension,
+        'slo_ttft_p95': slo_ttft_p95,
+        'max_sustainable_level': best_level,
+        'max_sustainable_throughput': best_point['aggregate_tokens_per_second'] if best_point else None,
+        'max_sustainable_request_rate': best_point['requests_per_second'] if best_point else None,
+        'search_ceiling_reached': best_level is not None and best_level >= max_level,
+        'curve': curve,
+    }
+    return prompt_results, summary
+
+# --- Multi-turn sessions (growing conversation history) ---
+
+def _least_squares_slope(points: list):
+    """(x, y) 점들의 최소제곱 기울기를 반환합니다 (점이 2개 미만이거나 x 가 모두 같으면 None)."""
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+def summarize_session(scenario_id: str, turn_results: list) -> dict:
+    """한 대화 세션의 턴별 TTFT 증가를 요약합니다.
+
+    ttft_ms_per_1k_conversation_tokens 는 대화 토큰 수에 대한 TTFT 의 기울기입니다. prefix cache 가 동작하면 매 턴
+    새로 붙은 토큰만 prefill 하므로 대화가 길어져도 기울기가 0 에 가깝고, 동작하지 않으면 전체 대화를 다시 prefill 하므로
+    대략 1000 / prefill 처리량 (ms) 에 가까워집니다.
+    """
+    metrics = [(r['turn'], r['result']['metrics']) for r in turn_results if r['result']['success']]
+    ttfts = [(turn, m['time_to_first_token'], m['conversation_tokens']) for turn, m in metrics if m['time_to_first_token'] is not None]
+    slope = _least_squares_slope([(tokens, ttft) for _, ttft, tokens in ttfts])
+    return {
+        'scenario_id': scenario_id,
+        'turns': len(turn_results),
+        'successful_turns': len(metrics),
+        'ttft_first': ttfts[0][1] if ttfts else None,
+        'ttft_last': ttfts[-1][1] if ttfts else None,
+        'ttft_growth': ttfts[-1][1] / ttfts[0][1] if len(ttfts) > 1 and ttfts[0][1] else None,
+        'conversation_tokens_first': ttfts[0][2] if ttfts else None,
+        'conversation_tokens_last': ttfts[-1][2] if ttfts else None,
+        'ttft_ms_per_1k_conversation_tokens': slope * 1e6 if slope is not None else None,
+        'ttft_by_turn': [ttft for _, ttft, _ in ttfts],
+    }
+
+def run_session(args: argparse.Namespace, api_url: str, test_case, system_prompt: str, on_result=None,
+                request_options: dict = None) -> list:
+    """시나리오의 프롬프트들을 하나의 대화로 이어서 실행하고 턴별 프롬프트 결과 목록을 반환합니다.
+
+    매 턴마다 이전 user/assistant 메시지 전체를 다시 보냅니다 (Caret 의 실제 요청 형태). 프롬프트 채움은 첫 턴에만 적용하며,
+    턴이 실패하면 이후 대화가 달라지므로 세션을 중단합니다.
+    """
+    tokenizer = get_tokenizer(args.model)
+    prompts = test_case.prompts[:args.limit_prompts] if args.limit_prompts is not None else test_case.prompts
+    first_turn_options = request_options or {}
+    later_turn_options = {k: v for k, v in first_turn_options.items() if k != 'fill_tokens'}
+    history = []
+    turn_results = []
+    for turn, prompt_text in enumerate(prompts):
+        options = first_turn_options if turn == 0 else later_turn_options
+        print(f"  Turn {turn + 1}/{len(prompts)} ({len(history)} history messages)...", file=sys.stderr)
+        result = run_api_query(args.api_type, api_url, args.model, prompt_text, system_prompt,
+                               args.sample_interval or None, options, history)
+        prompt_result = {
+            'scenario_id': test_case.id,
+            'prompt_index': turn,
+            'turn': turn,
+            'prompt': prompt_text,
+            'result': result
+        }
+        turn_results.append(prompt_result)
+        if on_result:
+            on_result(prompt_result)
+        _print_prompt_summary(f"Turn {turn + 1}", result)
+        if not result['success']:
+            print(f"  Stopping session {test_case.id}: turn {turn + 1} failed.", file=sys.stderr)
+            break
+        sent_prompt, _ = _prepare_prompt(tokenizer, prompt_text, options) # The text actually sent (cached)
+        history += [{"role": "user", "content": sent_prompt}, {"role": "assistant", "content": result['response']}]
+    return turn_results
+
+# --- Prefix cache probe ---
+
+PROBE_SCENARIO_ID = 'prefix-cache-probe'
+PROBE_ROLES = ('cold', 'warm', 'control')
+
+def fetch_server_metrics(api_url: str, match: str) -> dict:
+    """vLLM /metrics 에서 이름에 match 가 들어간 시계열을 {이름(레이블 포함): 값} 으로 반환합니다 (없거나 조회 실패 시 빈 dict)."""
+    try:
+        response = get_endpoint_pool(api_url).session.get(f"{api_url}/metrics", timeout=10)
+        response.raise_for_status()
+    except Exception:
+        return {}
+    counters = {}
+    for line in response.text.splitlines():
+        if line.startswith('#') or match not in line:
+            continue
+        name, _, value = line.rpartition(' ')
+        try:
+            counters[name] = float(value)
+        except ValueError:
+            continue
+    return counters
+
+def fetch_prefix_cache_counters(api_url: str) -> dict:
+    """vLLM /metrics 의 prefix cache 관련 시계열을 반환합니다."""
+    return fetch_server_metrics(api_url, 'prefix_cache')
+
+def summarize_prefix_probe(prompt_results: list, prefix_tokens: int, counters_before: dict, counters_after: dict) -> dict:
+    """역할(cold/warm/control)별 TTFT 와 prefix 재사용으로 줄어든 TTFT 를 요약합니다."""
+    ttfts = {role: [] for role in PROBE_ROLES}
+    prompt_tokens = {role: [] for role in PROBE_ROLES}
+    for r in prompt_results:
+        m = r['result'].get('metrics') if r['result']['success'] else None
+        if m and m['time_to_first_token'] is not None:
+            ttfts[r['probe_role']].append(m['time_to_first_token'])
+            prompt_tokens[r['probe_role']].append(m['prompt_tokens'])
+    summary = {'prefix_tokens': prefix_tokens, 'pairs': len(prompt_results) // len(PROBE_ROLES)}
+    for role in PROBE_ROLES:
+        summary[f'{role}_ttft_mean'] = _mean(ttfts[role])
+        summary[f'{role}_prompt_tokens_mean'] = _mean(prompt_tokens[role]) # Ollama reports only the tokens it evaluated
+    warm, control = summary['warm_ttft_mean'], summary['control_ttft_mean']
+    summary['ttft_reduction_sec'] = control - warm if warm is not None and control is not None else None
+    summary['ttft_reduction_pct'] = summary['ttft_reduction_sec'] / control * 100 if summary['ttft_reduction_sec'] is not None and control else None
+    summary['server_prefix_cache_counters'] = {name: value - counters_before.get(name, 0.0) for name, value in counters_after.items()
+                                               if value != counters_before.get(name, 0.0)}
+    return summary
+
+def run_prefix_cache_probe(args: argparse.Namespace, api_url: str, test_cases: list, system_prompt: str, prefix_tokens: int,
+                           pairs: int, request_options: dict = None, on_result=None) -> tuple:
+    """공유 prefix 재사용으로 줄어드는 TTFT 를 측정하고 (프롬프트 결과 목록, 요약) 을 반환합니다.
+
+    쌍마다 새 prefix P 로 cold 요청 (P + 질문 A), 같은 P 로 warm 요청 (P + 질문 B), 같은 길이의 다른 새 prefix Q 로
+    control 요청 (Q + 질문 B) 을 순서대로 보냅니다. prefix 맨 앞에 실행마다 다른 nonce 를 넣어 이전 실행에서 캐시된 내용이
+    cold/control 에 쓰이지 않게 합니다. control 은 warm 과 같은 '연속 요청' 조건의 캐시 없는 기준이므로
+    prefix 재사용 효과는 control - warm 으로 계산합니다.
+    """
+    from prompt_builder import FILL_HEADER, TASK_HEADER, get_prompt_builder
+    builder = get_prompt_builder(get_tokenizer(args.model))
+    questions = [prompt for test_case in test_cases for prompt in test_case.prompts]
+    nonce = f"{time.time_ns():x}"
+    counters_before = fetch_prefix_cache_counters(api_url) if args.api_type == 'vllm' else {}
+    prompt_results = []
+    for pair in range(pairs):
+        question_a, question_b = questions[(2 * pair) % len(questions)], questions[(2 * pair + 1) % len(questions)]
+        shared_prefix = f"// Session {nonce}-{pair}\n" + builder.filler_text(prefix_tokens, f"{nonce}-{pair}-shared")
+        control_prefix = f"// Control {nonce}-{pair}\n" + builder.filler_text(prefix_tokens, f"{nonce}-{pair}-control")
+        print(f"  Probe pair {pair + 1}/{pairs} ({prefix_tokens} prefix tokens)", file=sys.stderr)
+        for role, prefix, question in (('cold', shared_prefix, question_a), ('warm', shared_prefix, question_b), ('control', control_prefix, question_b)):
+            result = run_api_query(args.api_type, api_url, args.model, FILL_HEADER + prefix + TASK_HEADER + question, system_prompt,
+                                   args.sample_interval or None, request_options)
+            prompt_result = {
+                'scenario_id': PROBE_SCENARIO_ID,
+                'prompt_index': len(prompt_results),
+                'probe_pair': pair,
+                'probe_role': role,
+                'prompt': question, # The generated prefix is not stored
+                'result': result
+            }
+            prompt_results.append(prompt_result)
+            if on_result:
+                on_result(prompt_result)
+            _print_prompt_summary(role, result)
+    counters_after = fetch_prefix_cache_counters(api_url) if args.api_type == 'vllm' else {}
+    return prompt_results, summarize_prefix_probe(prompt_results, prefix_tokens, counters_before, counters_after)
+
+# --- Client-abort cancellation benchmark ---
+
+CANCEL_SCENARIO_ID = 'cancellation'
+FOLLOWUP_PROMPT = "Reply with the single word OK."
+FOLLOWUP_MAX_TOKENS = 8
+CANCEL_POLL_INTERVAL = 0.02 # Seconds between /metrics or /api/ps polls while waiting for the aborted request to release
+
+def fetch_requests_running(api_url: str):
+    """vLLM /metrics 의 num_requests_running 합계를 반환합니다 (없으면 None)."""
+    running = fetch_server_metrics(api_url, 'num_requests_running')
+    return sum(running.values()) if running else None
+
+def fetch_ollama_models(api_url: str):
+    """Ollama /api/ps 의 메모리에 올라와 있는 모델 목록을 반환합니다 (조회 실패 시 None)."""
+    try:
+        response = get_endpoint_pool(api_url).session.get(f"{api_url}/api/ps", timeout=10)
+        response.raise_for_status()
+        return response.json().get('models') or []
+    except Exception:
+        return None
+
+def _ollama_model_entry(models: list, model: str):
+    return next((m for m in models or [] if m.get('name') == model or m.get('model') == model), None)
+
+def fetch_ollama_expiry(api_url: str, model: str):
+    """Ollama /api/ps 에서 모델의 expires_at 을 반환합니다 (모델이 없거나 조회 실패 시 None).
+
+    Ollama 는 모델의 마지막 요청이 끝날 때 expires_at 을 (그 시각 + keep_alive) 로 다시 정하므로,
+    값이 바뀐 시점이 진행 중이던 요청이 끝난 시점입니다.
+    """
+    return (_ollama_model_entry(fetch_ollama_models(api_url), model) or {}).get('expires_at')
+
+def run_cancelled_query(api_type: str, api_url: str, model: str, prompt: str, system_prompt: str,
+                        abort_after_tokens: int = None, abort_after_sec: float = None, request_options: dict = None) -> dict:
+    """스트리밍 요청을 보내고 청크 abort_after_tokens 개 또는 abort_after_sec 초가 지나면 연결을 끊습니다 (Caret 의 취소 버튼과 같이).
+
+    조건은 청크가 도착할 때마다 확인합니다. 응답이 그 전에 끝나면 aborted=False 입니다.
+    abort_ns 는 연결을 닫은 직후의 perf_counter_ns 로, 서버가 슬롯을 놓기까지의 시간 측정 기준입니다.
+    """
+    pool = get_endpoint_pool(api_url)
+    chunks, first_token_ns, aborted = 0, None, False
+
+    def should_abort(now_ns):
+        return (abort_after_tokens is not None and chunks >= abort_after_tokens) or \
+               (abort_after_sec is not None and (now_ns - start_ns) / 1e9 >= abort_after_sec)
+
+    try:
+        tokenizer = get_tokenizer(model)
+        prompt, _ = _prepare_prompt(tokenizer, prompt, request_options)
+        if api_type == 'ollama':
+            data = _build_ollama_payload(model, prompt, system_prompt, request_options)
+            start_ns = time.perf_counter_ns()
+            with pool.session.post(f"{api_url}/api/generate", json=data, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('response'):
+                        chunks += 1
+                        first_token_ns = first_token_ns or time.perf_counter_ns()
+                    if chunk.get('done', False):
+                        break
+                    if should_abort(time.perf_counter_ns()):
+                        aborted = True
+                        break # Leaving the with block closes the unread response, dropping the connection
+        else:
+            client = pool.openai_client
+            start_ns = time.perf_counter_ns()
+            stream = client.chat.completions.create(model=model, messages=_build_openai_messages(prompt, system_prompt), stream=True,
+                                                    **_openai_request_params(api_type, request_options))
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        chunks += 1
+                        first_token_ns = first_token_ns or time.perf_counter_ns()
+                    if should_abort(time.perf_counter_ns()):
+                        aborted = True
+                        break
+            finally:
+                stream.close()
+        abort_ns = time.perf_counter_ns()
+    except _api_error_types(api_type) as e:
+        return {'success': False, 'error': f"API error: {e}"}
+    except Exception as e:
+        return {'success': False, 'error': f"General error: {str(e)}"}
+    return {
+        'success': True,
+        'aborted': aborted,
+        'chunks_received': chunks,
+        'time_to_first_token': (first_token_ns - start_ns) / 1e9 if first_token_ns else None,
+        'time_to_abort': (abort_ns - start_ns) / 1e9,
+        'abort_ns': abort_ns,
+    }
+
+def wait_for_release(api_type: str, api_url: str, model: str, abort_ns: int, baseline, timeout: float) -> tuple:
+    """중단한 요청을 서버가 놓을 때까지 폴링하고 (중단 후 경과 초 또는 None, 출처) 를 반환합니다.
+
+    vLLM 은 /metrics 의 num_requests_running 이 중단 전 값(baseline) 으로 돌아올 때, Ollama 는 /api/ps 의 expires_at 이
+    중단 전 값(baseline) 에서 바뀔 때를 해제 시점으로 봅니다. 그 밖의 백엔드나 timeout 안에 해제되지 않으면 None 입니다.
+    """
+    if api_type == 'vllm' and baseline is not None:
+        probe, released, source = (lambda: fetch_requests_running(api_url)), (lambda value: value is not None and value <= baseline), 'vllm_metrics'
+    elif api_type == 'ollama' and baseline is not None:
+        probe, released, source = (lambda: fetch_ollama_expiry(api_url, model)), (lambda value: value is not None and value != baseline), 'ollama_ps'
+    else:
+        return None, None
+    deadline = abort_ns + int(timeout * 1e9)
+    while time.perf_counter_ns() < deadline:
+        if released(probe()):
+            return (time.perf_counter_ns() - abort_ns) / 1e9, source
+        time.sleep(CANCEL_POLL_INTERVAL)
+    return None, source
+
+def _release_baseline(api_type: str, api_url: str, model: str):
+    if api_type == 'vllm':
+        return fetch_requests_running(api_url)
+    if api_type == 'ollama':
+        return fetch_ollama_expiry(api_url, model)
+    return None
+
+def summarize_cancellation(trials: list, abort_after_tokens: int, abort_after_sec: float) -> dict:
+    """시행별 해제 시간/후속 요청 TTFT 를 평균하고 낭비된 decode 시간을 요약합니다.
+
+    wasted_decode_sec 는 서버가 보고한 해제 시간 (vLLM /metrics, Ollama /api/ps) 을 우선하고, 없으면 (TGI 등)
+    후속 요청의 TTFT 가 유휴 상태보다 늘어난 만큼 (음수는 0) 을 사용합니다.
+    """
+    release = [t['release_sec'] for t in trials if t.get('release_sec') is not None]
+    penalty = [t['followup_ttft_penalty'] for t in trials if t.get('followup_ttft_penalty') is not None]
+    sources = sorted({t['release_source'] for t in trials if t.get('release_source')})
+    summary = {
+        'abort_after_tokens': abort_after_tokens,
+        'abort_after_sec': abort_after_sec,
+        'trials': len(trials),
+        'aborted_trials': sum(1 for t in trials if t.get('aborted')),
+        'time_to_abort_mean': _mean([t['time_to_abort'] for t in trials if t.get('time_to_abort') is not None]),
+        'release_sec_mean': _mean(release),
+        'release_source': sources[0] if sources else None,
+        'idle_ttft_mean': _mean([t['idle_ttft'] for t in trials if t.get('idle_ttft') is not None]),
+        'followup_ttft_mean': _mean([t['followup_ttft'] for t in trials if t.get('followup_ttft') is not None]),
+        'followup_ttft_penalty_mean': _mean(penalty),
+        'trial_details': trials,
+    }
+    if release:
+        summary['wasted_decode_sec'], summary['wasted_decode_source'] = summary['release_sec_mean'], summary['release_source']
+    elif penalty:
+        summary['wasted_decode_sec'], summary['wasted_decode_source'] = max(0.0, summary['followup_ttft_penalty_mean']), 'followup_ttft'
+    else:
+        summary['wasted_decode_sec'], summary['wasted_decode_source'] = None, None
+    return summary
+
+def run_cancellation_test(args: argparse.Namespace, api_url: str, test_cases: list, system_prompt: str,
+                          request_options: dict = None, on_result=None) -> tuple:
+    """클라이언트 중단 후 서버가 슬롯을 계속 점유하는 시간을 측정하고 (프롬프트 결과 목록, 요약) 을 반환합니다.
+
+    시행마다 (1) 유휴 상태에서 짧은 후속 프롬프트의 TTFT 를 재고, (2) 긴 응답 요청을 중단한 뒤 서버가 놓을 때까지 폴링하고,
+    (3) 다시 긴 요청을 중단한 직후 같은 후속 프롬프트를 보내 TTFT 를 잽니다. (2) 와 (3) 을 나눈 이유는 폴링 중인
+    후속 요청이 서버의 실행 중 요청 수와 expires_at 을 함께 바꾸기 때문입니다.
+    중단된 요청 자체는 완전한 응답이 아니므로 test_results 에는 유휴/후속 요청만 cancel_role 과 함께 기록합니다.
+    """
+    followup_options = {k: v for k, v in (request_options or {}).items() if k not in ('fill_tokens', 'per_prompt')}
+    followup_options['max_tokens'] = FOLLOWUP_MAX_TOKENS
+    cancel_options = dict(request_options or {}, max_tokens=args.cancel_max_tokens) # Long enough that the abort cuts real work
+    prompts = [prompt for test_case in test_cases for prompt in test_case.prompts]
+    prompt_results, trials = [], []
+
+    def record(role, trial, result):
+        prompt_result = {'scenario_id': CANCEL_SCENARIO_ID, 'prompt_index': len(prompt_results), 'cancel_trial': trial,
+                         'cancel_role': role, 'prompt': FOLLOWUP_PROMPT, 'result': result}
+        prompt_results.append(prompt_result)
+        if on_result:
+            on_result(prompt_result)
+        _print_prompt_summary(role, result)
+        return result['metrics']['time_to_first_token'] if result['success'] else None
+
+    for trial in range(args.cancel_trials):
+        prompt = prompts[trial % len(prompts)]
+        print(f"  Cancellation trial {trial + 1}/{args.cancel_trials}", file=sys.stderr)
+        details = {'trial': trial}
+        details['idle_ttft'] = record('idle', trial, run_api_query(args.api_type, api_url, args.model, FOLLOWUP_PROMPT, system_prompt,
+                                                                   None, followup_options))
+        # (2) Abort, then poll until the server releases the request
+        baseline = _release_baseline(args.api_type, api_url, args.model)
+        cancelled = run_cancelled_query(args.api_type, api_url, args.model, prompt, system_prompt,
+                                        args.cancel_after_tokens, args.cancel_after_seconds, cancel_options)
+        if not cancelled['success']:
+            print(f"    aborted request: FAILED - {cancelled['error']}", file=sys.stderr)
+            details['error'] = cancelled['error']
+            trials.append(details)
+            continue
+        details.update({k: cancelled[k] for k in ('aborted', 'chunks_received', 'time_to_abort')})
+        details['release_sec'], details['release_source'] = wait_for_release(args.api_type, api_url, args.model, cancelled['abort_ns'],
+                                                                             baseline, args.cancel_settle_timeout)
+        # (3) Abort again and send the follow-up immediately
+        baseline = _release_baseline(args.api_type, api_url, args.model)
+        cancelled = run_cancelled_query(args.api_type, api_url, args.model, prompt, system_prompt,
+                                        args.cancel_after_tokens, args.cancel_after_seconds, cancel_options)
+        details['followup_ttft'] = record('followup', trial, run_api_query(args.api_type, api_url, args.model, FOLLOWUP_PROMPT, system_prompt,
+                                                                           None, followup_options))
+        if details['followup_ttft'] is not None and details['idle_ttft'] is not None:
+            details['followup_ttft_penalty'] = details['followup_ttft'] - details['idle_ttft']
+        release_text = f"{details['release_sec']:.3f}s ({details['release_source']})" if details['release_sec'] is not None else 'not observable'
+        print(f"    aborted after {details['chunks_received']} chunks / {details['time_to_abort']:.3f}s, released after {release_text}", file=sys.stderr)
+        # Let the second aborted request finish on servers that keep decoding, so the next idle baseline is idle
+        if cancelled['success']:
+            wait_for_release(args.api_type, api_url, args.model, cancelled['abort_ns'], baseline, args.cancel_settle_timeout)
+        trials.append(details)
+    return prompt_results, summarize_cancellation(trials, args.cancel_after_tokens, args.cancel_after_seconds)
+
+COLD_START_SCENARIO_ID = 'cold-start'
+OLLAMA_UNLOAD_TIMEOUT = 30.0 # Seconds to wait for /api/ps to drop a model after a keep_alive 0 request
+
+def health_url(api_type: str, api_url: str) -> str:
+    """서버 준비 확인 URL (vLLM/TGI 는 /health, Ollama 는 "Ollama is running" 을 반환하는 /)."""
+    return f"{api_url}/" if api_type == 'ollama' else f"{api_url}/health"
+
+def wait_for_ready(url: str, timeout: float, interval: float, alive=None, elapsed_before: float = 0.0) -> dict:
+    """url 이 200 을 반환할 때까지 interval 간격으로 폴링하고 준비 시간과 그동안 디스크에서 읽은 바이트를 반환합니다.
+
+    elapsed_before 는 서버를 띄운 뒤 폴링을 시작하기 전까지 이미 지난 시간으로 time_to_ready_sec 에 더합니다.
+    측정 오차는 폴링 간격 + 요청 한 번의 시간 이내입니다. alive() 가 False 를 반환하면 (서버 프로세스 종료) 바로 멈춥니다.
+    """
+    import requests
+    disk_before = get_disk_read_bytes()
+    start = time.perf_counter()
+    polls, ready = 0, False
+    while True:
+        polls += 1
+        try:
+            ready = requests.get(url, timeout=max(interval, 1.0)).status_code == 200
+        except requests.RequestException: # Refused or reset while the server is still starting
+            ready = False
+        elapsed = time.perf_counter() - start
+        if ready or elapsed >= timeout or (alive is not None and not alive()):
+            break
+        time.sleep(interval)
+    return {
+        'ready': ready,
+        'time_to_ready_sec': elapsed_before + elapsed if ready else None,
+        'ready_polls': polls,
+        'ready_poll_interval': interval,
+        'ready_disk_read_bytes': _disk_read_since(disk_before),
+    }
+
+def unload_ollama_model(api_url: str, model: str, timeout: float = OLLAMA_UNLOAD_TIMEOUT) -> bool:
+    """keep_alive 0 의 빈 요청으로 모델을 내리고 /api/ps 에서 사라질 때까지 기다립니다 (사라지면 True)."""
+    try:
+        response = get_endpoint_pool(api_url).session.post(f"{api_url}/api/generate", json={'model': model, 'keep_alive': 0}, timeout=timeout)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Warning: Could not unload {model}: {e}", file=sys.stderr)
+        return False
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        models = fetch_ollama_models(api_url)
+        if models is not None and _ollama_model_entry(models, model) is None:
+            return True
+        time.sleep(CANCEL_POLL_INTERVAL)
+    return False
+
+def load_ollama_model(api_url: str, model: str, keep_alive=None, num_ctx: int = None, timeout: float = None) -> float:
+    """프롬프트 없는 요청으로 모델을 미리 올리고 걸린 시간 (초) 을 반환합니다 (실패하면 None).
+
+    Ollama 는 num_ctx 가 다르면 모델을 다시 올리므로 측정 요청과 같은 num_ctx 로 올려야 합니다.
+    """
+    payload = {'model': model}
+    if keep_alive is not None:
+        payload['keep_alive'] = keep_alive
+    if num_ctx:
+        payload['options'] = {'num_ctx': num_ctx}
+    start = time.perf_counter()
+    try:
+        response = get_endpoint_pool(api_url).session.post(f"{api_url}/api/generate", json=payload, timeout=timeout)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Warning: Could not load {model}: {e}", file=sys.stderr)
+        return None
+    return time.perf_counter() - start
+
+def parse_keep_alive(value: str):
+    """--keep-alive-values 항목을 Ollama keep_alive 값으로 바꿉니다 (숫자는 초, -1 은 무기한, '5m' 같은 기간 문자열은 그대로)."""
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+def keep_alive_seconds(value) -> float:
+    """Ollama keep_alive 값 (초 단위 숫자, '5m'/'1h30m' 같은 기간 문자열) 을 초로 바꿉니다 (음수는 무기한이므로 inf).
+
+    잘못된 값은 Ollama 처럼 거부합니다 (ValueError). mock_server.py 도 같은 함수를 사용합니다.
+    """
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        parts = re.findall(r'(-?[\d.]+)(ms|s|m|h)', str(value))
+        if not parts:
+            raise ValueError(f"Invalid keep_alive duration: {value!r}")
+        seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    return float('inf') if seconds < 0 else seconds
+
+def run_cold_start_test(args: argparse.Namespace, api_url: str, test_cases: list, system_prompt: str,
+                        request_options: dict = None, on_result=None) -> tuple:
+    """서버 준비 시간, 준비 직후 첫 요청 지연, (Ollama) keep_alive 별 모델 로드 비용을 재고 (프롬프트 결과 목록, 요약) 을 반환합니다.
+
+    initial 테스트는 모델 로드가 첫 요청 지연에 섞이므로 여기서는 단계를 나눠 잽니다.
+    1. 준비 시간: --server-start-time (서버를 띄운 시각) 또는 이 모드의 시작부터 헬스 체크가 200 을 반환할 때까지
+    2. 첫 요청: 준비 직후 요청 하나와, 같은 프롬프트의 warm 요청 (--warm-requests) 의 TTFT 차이
+    3. Ollama: --keep-alive-values 마다 모델을 내린 뒤 그 keep_alive 로 cold 요청을 보내고, --keep-alive-gap 초 뒤 후속 요청의
+       load_duration 과 /api/ps 로 모델이 메모리에 남아 있었는지 기록
+    구간마다 디스크 읽기 바이트 (psutil, 시스템 전체) 를 기록하므로 서버가 같은 장비에 있을 때만 의미가 있습니다.
+    """
+    prompt = test_cases[0].prompts[0]
+    prompt_results = []
+
+    def measure(role, options, **extra):
+        disk_before = get_disk_read_bytes()
+        result = run_api_query(args.api_type, api_url, args.model, prompt, system_prompt, None, options)
+        if result['success']:
+            result['metrics']['disk_read_bytes'] = _disk_read_since(disk_before)
+        prompt_result = {'scenario_id': COLD_START_SCENARIO_ID, 'prompt_index': len(prompt_results), 'cold_role': role,
+                         'prompt': prompt, 'result': result}
+        prompt_result.update(extra)
+        prompt_results.append(prompt_result)
+        if on_result:
+            on_result(prompt_result)
+        _print_prompt_summary(role, result)
+        return result['metrics'] if result['success'] else {}
+
+    # Wall clock on purpose: --server-start-time comes from another process (e.g. `date +%s.%N` before docker run)
+    elapsed_before = max(0.0, time.time() - args.server_start_time) if args.server_start_time else 0.0
+    url = health_url(args.api_type, api_url)
+    print(f"  Waiting for {url} (polling every {args.ready_poll_interval}s)", file=sys.stderr)
+    summary = wait_for_ready(url, args.ready_timeout, args.ready_poll_interval, elapsed_before=elapsed_before)
+    summary.update(health_url=url, ready_reference='server_start_time' if args.server_start_time else 'mode_start')
+    if not summary['ready']:
+        print(f"  Server not ready after {args.ready_timeout}s", file=sys.stderr)
+        return prompt_results, summary
+
+    first = measure('first', request_options)
+    warm_ttfts = [m['time_to_first_token'] for m in (measure('warm', request_options) for _ in range(args.warm_requests)) if m]
+    summary.update({
+        'first_ttft': first.get('time_to_first_token'),
+        'first_total_time': first.get('total_time'),
+        'first_load_sec': first.get('api_load_duration_sec'), # Ollama only
+        'first_disk_read_bytes': first.get('disk_read_bytes'),
+        'warm_ttft_mean': _mean(warm_ttfts),
+    })
+    if summary['first_ttft'] is not None and summary['warm_ttft_mean'] is not None:
+        summary['first_request_penalty_sec'] = summary['first_ttft'] - summary['warm_ttft_mean']
+
+    if args.api_type == 'ollama':
+        rows = []
+        for keep_alive in args.keep_alive_values:
+            print(f"  keep_alive {keep_alive!r}: unloading {args.model}, then cold request and a follow-up after {args.keep_alive_gap}s", file=sys.stderr)
+            options = dict(request_options or {}, keep_alive=keep_alive)
+            unloaded = unload_ollama_model(api_url, args.model)
+            cold = measure('cold', options, keep_alive=keep_alive)
+            time.sleep(args.keep_alive_gap)
+            still_loaded = _ollama_model_entry(fetch_ollama_models(api_url), args.model) is not None
+            followup = measure('followup', options, keep_alive=keep_alive)
+            rows.append({
+                'keep_alive': keep_alive,
+                'unloaded_before_cold': unloaded,
+                'cold_load_sec': cold.get('api_load_duration_sec'),
+                'cold_ttft': cold.get('time_to_first_token'),
+                'cold_disk_read_bytes': cold.get('disk_read_bytes'),
+                'gap_sec': args.keep_alive_gap,
+                'loaded_after_gap': still_loaded,
+                'followup_load_sec': followup.get('api_load_duration_sec'),
+                'followup_ttft': followup.get('time_to_first_token'),
+                'followup_disk_read_bytes': followup.get('disk_read_bytes'),
+            })
+        summary['keep_alive'] = rows
+    return prompt_results, summary
+
+def collect_prompt_jobs(test_cases: list, limit_prompts: int = None) -> list:
+    """시나리오 목록을 (scenario_id, prompt_index, prompt_text) 작업 목록으로 펼칩니다."""
+    jobs = []
+    for test_case in test_cases:
+        prompts_to_run = test_case.prompts
+        if limit_prompts is not None:
+            prompts_to_run = prompts_to_run[:limit_prompts]
+        jobs.extend((test_case.id, i, prompt_text) for i, prompt_text in enumerate(prompts_to_run))
+    return jobs
+
+def _print_prompt_summary(label: str, test_result_data: dict):
+    """프롬프트 단위 결과를 stderr 로 출력합니다."""
+    if test_result_data['success']:
+        metrics = test_result_data['metrics']
+        tps_to_print = metrics.get('tokens_per_second_calculated', 0)
+        api_tps = metrics.get('api_tokens_per_second')
+        tps_source = "calculated" if api_tps is None else "API"
+        if api_tps is not None:
+            tps_to_print = api_tps
+        ttft = metrics.get('time_to_first_token')
+        ttft_text = f"{ttft:.4f}s" if ttft is not None else "N/A"
+        prefill_tps = metrics.get('prefill_tokens_per_second')
+        prefill_text = f", prefill: {metrics.get('prompt_tokens')} tokens at {prefill_tps:.1f} tokens/s" if prefill_tps else ""
+        print(f"    {label}: TTFT: {ttft_text}, TPS ({tps_source}): {tps_to_print:.2f}{prefill_text}", file=sys.stderr)
+    else:
+        print(f"    {label}: FAILED - {test_result_data.get('error')}", file=sys.stderr)
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """run_test.py 명령행 인자 파서를 생성합니다 (batch_session.py 에서도 재사용)."""
     parser = argparse.ArgumentParser(description='Run sLLM performance tests')
     parser.add_argument('--api-type', default='ollama', choices=['ollama', 'tgi', 'vllm'], help='Type of API endpoint') # Added vllm
     parser.add_argument('--api-url', help=f'Base URL for the API endpoint (e.g., {DEFAULT_OLLAMA_URL} for Ollama, {DEFAULT_VLLM_URL} for vLLM)') # Updated help text
     parser.add_argument('--model', required=True, help='Model name (specific to the API type)')
-    parser.add_argument('--context', type=int, required=False, help='Context length (informational, not used by script logic)')
+    parser.add_argument('--context', type=int, required=False, help='Context window in tokens: sets Ollama num_ctx and pads each prompt with repository code up to context - --output-reserve tokens')
+    parser.add_argument('--output-reserve', type=int, default=DEFAULT_OUTPUT_RESERVE, help='Tokens of --context kept free for the response when padding prompts')
+    parser.add_argument('--fill-tokens', type=int, default=None, help='Pad each prompt to this many tokens (overrides the --context based target)')
+    parser.add_argument('--no-fill', action='store_true', help='Send the scenario prompts unpadded (--context then only sets Ollama num_ctx)')
+    parser.add_argument('--workload-profile', default=None, help='Profile JSON from workload_profile.py: each prompt is padded to an input length and capped at an output length sampled from real Caret requests')
+    parser.add_argument('--system-prompt-file', default=None, help='System prompt text to send instead of the one-line default (e.g. the Caret agent prompt dumped by system-prompt-token-measurement.js)')
+    parser.add_argument('--sampling', action='append', default=[], metavar='KEY=VALUE',
+                        help='Sampling parameter sent with every request, e.g. temperature=0 or top_k=20 (repeatable; values are parsed as JSON)')
     parser.add_argument('--test-type', required=True, choices=['initial', 'continuous'], help='Test type')
     parser.add_argument('--limit-scenarios', type=int, default=None, help='Limit the number of scenarios to run')
     parser.add_argument('--limit-prompts', type=int, default=None, help='Limit the number of prompts per scenario')
-    args = parser.parse_args()
+    parser.add_argument('--multi-turn', action='store_true', help="Run each scenario's prompts as one conversation, re-sending the accumulated history every turn")
+    parser.add_argument('--prefix-cache-probe', action='store_true', help='Measure the TTFT saved by server prefix caching (cold / warm / no-shared-prefix control requests)')
+    parser.add_argument('--probe-pairs', type=int, default=3, help='Cold/warm/control request triples sent by --prefix-cache-probe')
+    parser.add_argument('--probe-prefix-tokens', type=int, default=None, help='Shared prefix length for --prefix-cache-probe (default: the --context/--fill-tokens target, else 4096)')
+    parser.add_argument('--probe-max-tokens', type=int, default=32, help='Response length cap for --prefix-cache-probe requests (only TTFT is compared)')
+    parser.add_argument('--output-tokens', type=int, default=None, help='Pin every response to this many tokens (vLLM: max_tokens + ignore_eos/min_tokens, Ollama/TGI: a cap only)')
+    parser.add_argument('--output-lengths', nargs='?', const=DEFAULT_OUTPUT_LENGTHS, default=None,
+                        help=f'Sweep pinned response lengths, running every prompt at each (comma-separated, default {DEFAULT_OUTPUT_LENGTHS})')
+    parser.add_argument('--cancel-test', action='store_true', help='Abort streams early (like the Caret cancel button) and measure how long the server keeps decoding')
+    parser.add_argument('--cancel-after-tokens', type=int, default=None, help='Abort each stream after this many chunks (default 32 unless --cancel-after-seconds is given)')
+    parser.add_argument('--cancel-after-seconds', type=float, default=None, help='Abort each stream after this many seconds')
+    parser.add_argument('--cancel-trials', type=int, default=3, help='Abort/follow-up trials in --cancel-test')
+    parser.add_argument('--cancel-max-tokens', type=int, default=2048, help='Response length requested before the abort (the work left over after it)')
+    parser.add_argument('--cancel-settle-timeout', type=float, default=60.0, help='Seconds to wait for the server to release an aborted request')
+    parser.add_argument('--cold-start', action='store_true', help='Measure time-to-ready, first-request latency after ready and (Ollama) model load cost per keep_alive value')
+    parser.add_argument('--server-start-time', type=float, default=None, help='Epoch seconds when the server was started (e.g. `date +%%s.%%N` before docker run); time-to-ready counts from here instead of from the mode start')
+    parser.add_argument('--ready-timeout', type=float, default=600.0, help='Seconds to wait for the server health check in --cold-start')
+    parser.add_argument('--ready-poll-interval', type=float, default=0.25, help='Seconds between health checks in --cold-start (the time-to-ready resolution)')
+    parser.add_argument('--warm-requests', type=int, default=3, help='Requests sent after the first one in --cold-start to get the warm TTFT')
+    parser.add_argument('--keep-alive-values', default='0,5m', help='Ollama keep_alive values compared by --cold-start (comma-separated seconds or durations such as 30s, 5m, -1)')
+    parser.add_argument('--keep-alive', type=parse_keep_alive, default=None, help='Ollama keep_alive sent with every request (e.g. -1 pins the model in memory for the whole run, 0 unloads it after each request)')
+    parser.add_argument('--keep-alive-gap', type=float, default=5.0, help='Idle seconds before the follow-up request of each --keep-alive-values trial')
+    parser.add_argument('--batch-size', type=int, default=None, help='Offline batch mode: send up to this many prompts of a scenario as one /v1/completions request (vLLM/TGI)')
+    parser.add_argument('--batch-n', type=int, default=1, help='Completions sampled per prompt in batch mode (OpenAI n)')
+    parser.add_argument('--concurrency', type=int, default=1, help='Number of streaming requests kept in flight at once (1 = sequential, one prompt at a time)')
+    parser.add_argument('--arrival-rates', type=str, default=None, help='Open-loop mode: comma-separated offered request rates in req/s (e.g. 0.5,1,2,4)')
+    parser.add_argument('--arrival-process', default='poisson', choices=['poisson', 'constant'], help='Inter-arrival distribution for open-loop mode')
+    parser.add_argument('--open-loop-requests', type=int, default=None, help='Requests fired per offered rate (default: one per selected prompt)')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='Open-loop mode: drop arrivals while this many requests are outstanding')
+    parser.add_argument('--request-timeout', type=float, default=None, help='Open-loop mode: drop requests that take longer than this many seconds')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for arrival schedules')
+    parser.add_argument('--sample-interval', type=float, default=DEFAULT_SAMPLE_INTERVAL, help='Background GPU/RAM sampling interval in seconds (0 disables)')
+    parser.add_argument('--output-jsonl', default=None, help='Stream each prompt result to this JSONL file as soon as it completes (fsynced per record)')
+    parser.add_argument('--resume', action='store_true', help='With --output-jsonl: append to the file and skip (scenario, prompt_index) pairs that already succeeded')
+    parser.add_argument('--tokenizer', default=None, help='Path to the tokenizer.json for --model (default: resolved by tokenizer_registry.py)')
+    parser.add_argument('--tokenizer-dir', default=None, help='Extra directory searched first for <model>.tokenizer.json or <model>/tokenizer.json')
+    parser.add_argument('--find-saturation', action='store_true', help='Search for the highest load level that keeps TTFT p95 under --slo-ttft-p95')
+    parser.add_argument('--slo-ttft-p95', type=float, default=None, help='TTFT p95 budget in seconds for --find-saturation')
+    parser.add_argument('--saturation-dimension', default='concurrency', choices=['concurrency', 'rate'], help='Load dimension searched by --find-saturation')
+    parser.add_argument('--saturation-max-level', type=float, default=64, help='Upper bound of the saturation search (concurrency or req/s)')
+    parser.add_argument('--saturation-requests', type=int, default=None, help='Requests measured per load level (default: one per selected prompt, at least 2x concurrency)')
+    return parser
 
-    # Determine API URL
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """인자를 파싱하고 모드 간 조합을 검증합니다."""
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.arrival_rates and args.concurrency > 1:
+        parser.error('--arrival-rates (open-loop) and --concurrency (closed-loop) are mutually exclusive')
+    sampling = {}
+    for item in args.sampling:
+        key, sep, value = item.partition('=')
+        if not sep or not key:
+            parser.error(f'--sampling expects KEY=VALUE, got {item!r}')
+        try:
+            sampling[key] = json.loads(value)
+        except json.JSONDecodeError:
+            sampling[key] = value # Plain strings such as stop=END
+    args.sampling = sampling
+    if args.find_saturation and args.slo_ttft_p95 is None:
+        parser.error('--find-saturation requires --slo-ttft-p95')
+    if args.multi_turn and (args.concurrency > 1 or args.arrival_rates or args.find_saturation):
+        parser.error('--multi-turn runs conversations sequentially and cannot be combined with load modes')
+    if args.prefix_cache_probe and (args.multi_turn or args.concurrency > 1 or args.arrival_rates or args.find_saturation or args.resume):
+        parser.error('--prefix-cache-probe is a standalone sequential mode')
+    if args.output_lengths and (args.output_tokens or args.multi_turn or args.prefix_cache_probe or args.cancel_test or args.batch_size
+                                or args.concurrency > 1 or args.arrival_rates or args.find_saturation or args.resume or args.workload_profile):
+        parser.error('--output-lengths is a standalone sequential sweep')
+    if args.output_tokens and args.workload_profile:
+        parser.error('--output-tokens and --workload-profile both set the response length')
+    if args.cancel_test and (args.multi_turn or args.prefix_cache_probe or args.batch_size or args.concurrency > 1 or args.arrival_rates
+                             or args.find_saturation or args.resume):
+        parser.error('--cancel-test is a standalone sequential mode')
+    if args.cold_start and (args.multi_turn or args.prefix_cache_probe or args.cancel_test or args.batch_size or args.output_lengths
+                            or args.concurrency > 1 or args.arrival_rates or args.find_saturation or args.resume):
+        parser.error('--cold-start is a standalone sequential mode')
+    if args.keep_alive is not None and (args.api_type != 'ollama' or args.cold_start):
+        parser.error('--keep-alive is an Ollama option and --cold-start sets it per trial with --keep-alive-values')
+    args.keep_alive_values = [parse_keep_alive(v.strip()) for v in args.keep_alive_values.split(',') if v.strip()]
+    if args.cancel_test and args.cancel_after_tokens is None and args.cancel_after_seconds is None:
+        args.cancel_after_tokens = 32
+    if args.batch_size and (args.api_type == 'ollama' or args.multi_turn or args.prefix_cache_probe or args.concurrency > 1 or args.arrival_rates or args.find_saturation):
+        parser.error('--batch-size needs --api-type vllm or tgi and cannot be combined with other load modes')
+    if (args.batch_size is not None and args.batch_size < 1) or args.batch_n < 1:
+        parser.error('--batch-size and --batch-n must be at least 1')
+    if args.workload_profile and (args.multi_turn or args.prefix_cache_probe or args.no_fill or args.fill_tokens):
+        parser.error('--workload-profile sets the prompt lengths itself and cannot be combined with --multi-turn, --prefix-cache-probe, --no-fill or --fill-tokens')
+    if args.multi_turn and args.resume:
+        parser.error('--multi-turn sessions cannot be resumed (the conversation history would differ)')
+    if args.resume and not args.output_jsonl:
+        parser.error('--resume requires --output-jsonl')
+    if args.context and args.output_reserve >= args.context:
+        parser.error('--output-reserve must be smaller than --context')
+    if args.resume and (args.arrival_rates or args.find_saturation or args.batch_size):
+        parser.error('--resume is only supported for sequential and --concurrency runs (load sweeps must be rerun as a whole)')
+    return args
+
+def resolve_api_url(args: argparse.Namespace) -> str:
+    """--api-url 이 없으면 API 타입별 기본 URL 을 반환합니다."""
     api_url = args.api_url
     if not api_url:
         if args.api_type == 'ollama':
@@ -220,12 +1885,373 @@ def main():
         else:
             print(f"Error: Default URL not known for API type '{args.api_type}'. Please provide --api-url.", file=sys.stderr)
             sys.exit(1)
+    return api_url
+
+def fetch_max_model_len(api_url: str, model: str):
+    """vLLM /v1/models 가 보고하는 모델의 max_model_len 을 반환합니다 (없거나 조회 실패 시 None)."""
+    try:
+        response = get_endpoint_pool(api_url).session.get(f"{api_url}/v1/models", timeout=10)
+        response.raise_for_status()
+        entries = response.json().get('data', [])
+    except Exception:
+        return None
+    entry = next((e for e in entries if e.get('id') == model), entries[0] if len(entries) == 1 else None)
+    return (entry or {}).get('max_model_len')
+
+def resolve_fill_tokens(args: argparse.Namespace, api_url: str, tokenizer, system_prompt: str):
+    """프롬프트를 채울 목표 토큰 수를 정합니다 (채우지 않으면 None).
+
+    --fill-tokens 가 있으면 그 값을, 없으면 --context 에서 응답 여유(--output-reserve), 시스템 프롬프트, 채팅 템플릿 몫을 뺀 값을 사용합니다.
+    vLLM 은 컨텍스트 창이 서버 실행 시 (--max-model-len) 정해지므로, 서버 한도를 넘으면 한도에 맞춰 줄이고 경고합니다.
+    """
+    if args.no_fill:
+        return None
+    if args.fill_tokens:
+        return args.fill_tokens
+    if not args.context:
+        return None
+    context = args.context
+    if args.api_type == 'vllm':
+        max_model_len = fetch_max_model_len(api_url, args.model)
+        if max_model_len and max_model_len < context:
+            print(f"Warning: --context {context} exceeds the server's max_model_len {max_model_len}; padding to fit {max_model_len}. "
+                  f"Restart vLLM with a larger --max-model-len to test this context.", file=sys.stderr)
+            context = max_model_len
+    return max(0, context - args.output_reserve - tokenizer.count(system_prompt) - CHAT_TEMPLATE_ALLOWANCE) or None
+
+def sample_workload(args: argparse.Namespace, profile, test_cases: list, tokenizer, system_prompt: str, fill_cap: int = None) -> dict:
+    """선택된 프롬프트마다 프로파일에서 (입력, 출력) 토큰 수를 뽑아 request_options['per_prompt'] 형식으로 반환합니다.
 
-    # 시스템 프롬프트 정의
+    입력 토큰 수는 시스템 프롬프트와 채팅 템플릿 몫을 뺀 사용자 프롬프트 채움 목표가 되고 (--context 가 있으면 그 창에 맞게 줄임),
+    출력 토큰 수는 max_tokens 가 됩니다. --seed 가 같으면 같은 표본을 뽑습니다.
+    """
+    rng = random.Random(args.seed)
+    system_tokens = tokenizer.count(system_prompt) + CHAT_TEMPLATE_ALLOWANCE
+    per_prompt = {}
+    for _, _, prompt_text in collect_prompt_jobs(test_cases, args.limit_prompts):
+        if prompt_text in per_prompt:
+            continue
+        input_tokens, output_tokens = profile.sample(rng)
+        fill_tokens = input_tokens - system_tokens
+        if fill_cap:
+            fill_tokens = min(fill_tokens, fill_cap)
+        per_prompt[prompt_text] = {'max_tokens': output_tokens, 'sampled_input_tokens': input_tokens}
+        if fill_tokens > 0:
+            per_prompt[prompt_text]['fill_tokens'] = fill_tokens
+    return per_prompt
+
+def summarize_output_lengths(prompt_results: list) -> list:
+    """출력 길이 스윕 결과를 목표 길이별로 요약합니다 (생성 토큰 수, 목표 도달 비율, TTFT, decode 처리량)."""
+    summary = []
+    for target in sorted({r['output_length_target'] for r in prompt_results}):
+        results = [r['result'] for r in prompt_results if r['output_length_target'] == target]
+        metrics = [r['metrics'] for r in results if r['success']]
+        summary.append({
+            'output_tokens': target,
+            'requests': len(results),
+            'successful_requests': len(metrics),
+            'generated_tokens_mean': _mean([m['generated_tokens'] for m in metrics]),
+            'reached_target_pct': sum(1 for m in metrics if m['generated_tokens'] >= target) / len(metrics) * 100 if metrics else None,
+            'ttft_mean': _mean([m['time_to_first_token'] for m in metrics if m['time_to_first_token'] is not None]),
+            'decode_tokens_per_second_mean': _mean([m['decode_tokens_per_second'] for m in metrics if m.get('decode_tokens_per_second')]),
+            'itl_p99_mean': _mean([m['itl_p99'] for m in metrics if m.get('itl_p99') is not None]),
+        })
+    return summary
+
+def run_prompts(args: argparse.Namespace, api_url: str, test_cases: list, system_prompt: str, results: dict,
+                on_result=None, completed: set = frozenset(), request_options: dict = None) -> list:
+    """선택된 모드(포화점 탐색, open-loop, 동시 부하, 순차)로 프롬프트를 실행하고 프롬프트 결과 목록을 반환합니다.
+
+    모드별 집계(saturation, open_loop, load_test)는 results 에 추가합니다.
+    on_result 는 프롬프트 결과가 끝날 때마다 호출되며, completed 에 있는 (scenario_id, prompt_index) 는 건너뜁니다.
+    request_options 는 모든 요청에 전달됩니다.
+    """
+    all_prompt_results = [] # 개별 프롬프트 결과를 임시 저장
+    if ((request_options or {}).get('fill_tokens') or (request_options or {}).get('per_prompt')) and not args.prefix_cache_probe:
+        # 채운 프롬프트를 미리 만들어 캐시 (동시 부하 모드에서 이벤트 루프가 토큰화로 멈추지 않도록)
+        tokenizer = get_tokenizer(args.model)
+        for _, _, prompt_text in collect_prompt_jobs(test_cases, args.limit_prompts):
+            _prepare_prompt(tokenizer, prompt_text, _prompt_request_options(prompt_text, request_options))
+    if args.find_saturation:
+        # 포화점 탐색: TTFT p95 SLO 를 지키는 최대 동시성/요청률 탐색
+        jobs = collect_prompt_jobs(test_cases, args.limit_prompts)
+        print(f"\nSaturation search over {args.saturation_dimension} (TTFT p95 <= {args.slo_ttft_p95}s) via {args.api_type} for model {args.model}", file=sys.stderr)
+        all_prompt_results, saturation = run_saturation_search(
+            args.api_type,
+            api_url,
+            args.model,
+            jobs,
+            system_prompt,
+            args.slo_ttft_p95,
+            args.saturation_dimension,
+            args.saturation_max_level,
+            args.saturation_requests,
+            seed=args.seed,
+            on_result=on_result,
+            request_options=request_options
+        )
+        results['saturation'] = saturation
+        if saturation['max_sustainable_level'] is None:
+            print("  No load level met the SLO.", file=sys.stderr)
+        else:
+            print(f"  Max sustainable {args.saturation_dimension}: {saturation['max_sustainable_level']} "
+                  f"-> {saturation['max_sustainable_throughput']:.2f} tokens/s", file=sys.stderr)
+    elif args.arrival_rates:
+        # open-loop 모드: 요청률별로 정해진 도착 시각에 요청을 발사 (대기열 지연 측정)
+        import asyncio
+        jobs = collect_prompt_jobs(test_cases, args.limit_prompts)
+        num_requests = args.open_loop_requests or len(jobs)
+        results['open_loop'] = []
+        for rate in [float(r) for r in args.arrival_rates.split(',') if r.strip()]:
+            print(f"\nOpen-loop: {num_requests} requests at {rate} req/s ({args.arrival_process}) via {args.api_type} for model {args.model}", file=sys.stderr)
+            sampler = ResourceSampler(args.sample_interval) if args.sample_interval else None
+            if sampler:
+                sampler.start()
+            rate_results, rate_summary = asyncio.run(run_open_loop(
+                args.api_type,
+                api_url,
+                args.model,
+                jobs,
+                system_prompt,
+                rate,
+                num_requests,
+                args.arrival_process,
+                args.max_in_flight,
+                args.request_timeout,
+                seed=args.seed,
+                on_result=on_result,
+                request_options=request_options
+            ))
+            if sampler:
+                rate_summary['resource_timeline'] = sampler.stop()
+            all_prompt_results.extend(rate_results)
+            results['open_loop'].append(rate_summary)
+            ttft_p99 = rate_summary['ttft_p99']
+            print(f"  Dispatched {rate_summary['achieved_rate'] or 0:.2f} req/s, completed {rate_summary['requests_per_second']:.2f} req/s, TTFT p50/p99: "
+                  f"{rate_summary['ttft_p50'] or 0:.3f}s/{ttft_p99 or 0:.3f}s, "
+                  f"dropped: {rate_summary['dropped_requests']}, late: {rate_summary['late_requests']}", file=sys.stderr)
+    elif args.prefix_cache_probe:
+        # prefix cache 측정: 같은 긴 prefix 의 cold/warm 요청과 공유 prefix 가 없는 control 요청의 TTFT 비교
+        probe_options = {k: v for k, v in (request_options or {}).items() if k != 'fill_tokens'}
+        probe_options['max_tokens'] = args.probe_max_tokens
+        prefix_tokens = args.probe_prefix_tokens or (request_options or {}).get('fill_tokens') or DEFAULT_PROBE_PREFIX_TOKENS
+        print(f"\nPrefix cache probe via {args.api_type} for model {args.model}", file=sys.stderr)
+        all_prompt_results, probe = run_prefix_cache_probe(args, api_url, test_cases, system_prompt, prefix_tokens,
+                                                           args.probe_pairs, probe_options, on_result)
+        results['prefix_cache_probe'] = probe
+        if probe['ttft_reduction_sec'] is not None:
+            print(f"  TTFT cold/warm/control: {probe['cold_ttft_mean']:.3f}s/{probe['warm_ttft_mean']:.3f}s/{probe['control_ttft_mean']:.3f}s "
+                  f"-> prefix reuse saves {probe['ttft_reduction_sec'] * 1000:.1f} ms ({probe['ttft_reduction_pct']:.1f}%)", file=sys.stderr)
+    elif args.output_lengths:
+        # 출력 길이 스윕: 응답 길이를 고정해 같은 길이끼리 decode 처리량을 비교 (길이에 따른 감소 확인)
+        lengths = [int(n) for n in args.output_lengths.split(',') if n.strip()]
+        if args.api_type == 'ollama' and not args.context:
+            # Ollama 기본 컨텍스트 창에서는 긴 응답이 잘리거나 context shift 가 일어나므로 가장 긴 응답이 들어가는 창을 한 번만 지정
+            request_options = dict(request_options or {}, num_ctx=max(lengths) + args.output_reserve)
+        if (request_options or {}).get('fill_tokens') and max(lengths) > args.output_reserve:
+            print(f"Warning: Prompts are padded to leave {args.output_reserve} tokens for the response; "
+                  f"pass --output-reserve {max(lengths)} so the longest responses fit in --context.", file=sys.stderr)
+        jobs = collect_prompt_jobs(test_cases, args.limit_prompts)
+        for length in lengths:
+            print(f"\nOutput length {length}: {len(jobs)} prompts via {args.api_type} for model {args.model}", file=sys.stderr)
+            options = dict(request_options or {}, output_tokens=length)
+            for scenario_id, prompt_index, prompt_text in jobs:
+                result = run_api_query(args.api_type, api_url, args.model, prompt_text, system_prompt, args.sample_interval or None, options)
+                prompt_result = {
+                    'scenario_id': scenario_id,
+                    'prompt_index': prompt_index,
+                    'output_length_target': length,
+                    'prompt': prompt_text,
+                    'result': result
+                }
+                all_prompt_results.append(prompt_result)
+                if on_result:
+                    on_result(prompt_result)
+                _print_prompt_summary(f"{scenario_id} #{prompt_index + 1}", result)
+        results['output_length_sweep'] = summarize_output_lengths(all_prompt_results)
+        for row in results['output_length_sweep']:
+            if row['decode_tokens_per_second_mean'] is not None:
+                print(f"  {row['output_tokens']:>6} tokens: generated {row['generated_tokens_mean']:.0f} on average "
+                      f"({row['reached_target_pct']:.0f}% reached), decode {row['decode_tokens_per_second_mean']:.2f} tokens/s", file=sys.stderr)
+    elif args.cancel_test:
+        # 취소 측정: 스트림을 중간에 끊은 뒤 서버가 decode 를 계속하는 시간 (낭비된 decode 시간) 측정
+        print(f"\nCancellation test via {args.api_type} for model {args.model}", file=sys.stderr)
+        all_prompt_results, cancellation = run_cancellation_test(args, api_url, test_cases, system_prompt, request_options, on_result)
+        results['cancellation'] = cancellation
+        if cancellation['wasted_decode_sec'] is not None:
+            print(f"  Wasted decode after abort: {cancellation['wasted_decode_sec']:.3f}s ({cancellation['wasted_decode_source']})", file=sys.stderr)
+    elif args.cold_start:
+        # 콜드 스타트: 서버 준비 시간, 준비 직후 첫 요청, (Ollama) keep_alive 별 모델 로드 비용을 따로 측정
+        print(f"\nCold-start test via {args.api_type} for model {args.model}", file=sys.stderr)
+        all_prompt_results, cold_start = run_cold_start_test(args, api_url, test_cases, system_prompt, request_options, on_result)
+        results['cold_start'] = cold_start
+        if cold_start.get('first_request_penalty_sec') is not None:
+            print(f"  Ready after {cold_start['time_to_ready_sec']:.2f}s ({cold_start['ready_reference']}), first request TTFT "
+                  f"{cold_start['first_ttft']:.3f}s vs warm {cold_start['warm_ttft_mean']:.3f}s", file=sys.stderr)
+        for row in cold_start.get('keep_alive', []):
+            print(f"  keep_alive {row['keep_alive']!r}: cold load {row['cold_load_sec'] or 0:.2f}s, after {row['gap_sec']}s idle the model was "
+                  f"{'still loaded' if row['loaded_after_gap'] else 'unloaded'} (follow-up load {row['followup_load_sec'] or 0:.2f}s)", file=sys.stderr)
+    elif args.batch_size:
+        # 오프라인 배치 모드: 시나리오의 프롬프트를 batch_size 개씩 /v1/completions 요청 하나로 전송
+        batches = []
+        for test_case in test_cases:
+            prompts = test_case.prompts[:args.limit_prompts] if args.limit_prompts is not None else test_case.prompts
+            for first in range(0, len(prompts), args.batch_size):
+                chunk = prompts[first:first + args.batch_size]
+                print(f"\nRunning batch of {len(chunk)} prompts x n={args.batch_n}: {test_case.id} via {args.api_type} for model {args.model}", file=sys.stderr)
+                batch_result = run_batch_query(args.api_type, api_url, args.model, chunk, system_prompt, args.batch_n, request_options)
+                if batch_result['success']:
+                    batch = dict(batch_result['batch'], scenario_id=test_case.id, batch_index=len(batches))
+                    batches.append(batch)
+                    items = [(item['position'], item['sample_index'], {'success': True, 'response': item['response'], 'metrics': item['metrics']})
+                             for item in batch_result['items']]
+                    print(f"  {batch['generated_tokens']} tokens in {batch['wall_time']:.2f}s -> {batch['aggregate_tokens_per_second']:.2f} tokens/s", file=sys.stderr)
+                else:
+                    print(f"  Batch failed: {batch_result['error']}", file=sys.stderr)
+                    items = [(position, sample_index, {'success': False, 'error': batch_result['error']})
+                             for position in range(len(chunk)) for sample_index in range(args.batch_n)]
+                for position, sample_index, item_result in items:
+                    prompt_result = {
+                        'scenario_id': test_case.id,
+                        'prompt_index': first + position,
+                        'sample_index': sample_index,
+                        'prompt': chunk[position],
+                        'result': item_result
+                    }
+                    all_prompt_results.append(prompt_result)
+                    if on_result:
+                        on_result(prompt_result)
+        results['batch_test'] = summarize_batches(batches, all_prompt_results, args.batch_size, args.batch_n)
+        summary = results['batch_test']
+        if summary['item_latency_p50'] is not None:
+            print(f"  Aggregate: {summary['aggregate_tokens_per_second']:.2f} tokens/s, item latency p50/p99: "
+                  f"{summary['item_latency_p50']:.2f}s/{summary['item_latency_p99']:.2f}s", file=sys.stderr)
+    elif args.multi_turn:
+        # 멀티턴 세션 모드: 시나리오마다 하나의 대화로 이어서 실행 (매 턴 전체 이력 재전송)
+        results['multi_turn'] = {'sessions': []}
+        for test_case in test_cases:
+            print(f"\nRunning session: {test_case.id} via {args.api_type} for model {args.model}", file=sys.stderr)
+            turn_results = run_session(args, api_url, test_case, system_prompt, on_result, request_options)
+            all_prompt_results.extend(turn_results)
+            session = summarize_session(test_case.id, turn_results)
+            results['multi_turn']['sessions'].append(session)
+            slope = session['ttft_ms_per_1k_conversation_tokens']
+            print(f"  TTFT by turn: {', '.join(f'{t:.3f}s' for t in session['ttft_by_turn'])}"
+                  f"{f' ({slope:.1f} ms per 1k conversation tokens)' if slope is not None else ''}", file=sys.stderr)
+    elif args.concurrency > 1:
+        # 동시 부하 모드: 모든 프롬프트를 하나의 이벤트 루프에서 동시에 스트리밍
+        import asyncio
+        jobs = [job for job in collect_prompt_jobs(test_cases, args.limit_prompts) if (job[0], job[1]) not in completed]
+        print(f"\nRunning {len(jobs)} prompts via {args.api_type} for model {args.model} with concurrency {args.concurrency}", file=sys.stderr)
+        gpu_stats_start = get_gpu_stats()
+        ram_stats_start = get_ram_stats()
+        sampler = ResourceSampler(args.sample_interval) if args.sample_interval else None
+        if sampler:
+            sampler.start()
+        all_prompt_results, load_summary = asyncio.run(run_concurrent_queries(
+            args.api_type,
+            api_url,
+            args.model,
+            jobs,
+            system_prompt,
+            args.concurrency,
+            on_result,
+            request_options
+        ))
+        if sampler:
+            load_summary['resource_timeline'] = sampler.stop()
+        load_summary.update({
+            'gpu_stats_start': gpu_stats_start,
+            'gpu_stats_end': get_gpu_stats(),
+            'ram_stats_start': ram_stats_start,
+            'ram_stats_end': get_ram_stats()
+        })
+        results['load_test'] = load_summary
+
+        for prompt_result in all_prompt_results:
+            _print_prompt_summary(f"{prompt_result['scenario_id']} #{prompt_result['prompt_index']+1}", prompt_result['result'])
+        print(f"  Aggregate: {load_summary['aggregate_tokens_per_second']:.2f} tokens/s over {load_summary['wall_time']:.2f}s "
+              f"({load_summary['successful_requests']}/{load_summary['total_requests']} succeeded)", file=sys.stderr)
+    else:
+        for test_case in test_cases:
+            print(f"\nRunning scenario: {test_case.id} via {args.api_type} for model {args.model}", file=sys.stderr)
+            scenario_prompt_results = [] # 현재 시나리오의 프롬프트 결과 저장
+
+            prompts_to_run = test_case.prompts
+            # Apply prompt limit if provided
+            if args.limit_prompts is not None:
+                prompts_to_run = prompts_to_run[:args.limit_prompts]
+                print(f"  Limiting to first {args.limit_prompts} prompts for this scenario.", file=sys.stderr)
+
+            for i, prompt_text in enumerate(prompts_to_run):
+                if (test_case.id, i) in completed:
+                    print(f"  Skipping prompt {i+1}/{len(prompts_to_run)} (already completed)", file=sys.stderr)
+                    continue
+                print(f"  Running prompt {i+1}/{len(prompts_to_run)}...", file=sys.stderr)
+                test_result_data = run_api_query(
+                    args.api_type,
+                    api_url,
+                    args.model,
+                    prompt_text, # 개별 프롬프트 사용
+                    system_prompt,
+                    args.sample_interval or None,
+                    request_options
+                )
+
+                # 결과에 시나리오 ID와 프롬프트 인덱스 추가
+                prompt_result = {
+                    'scenario_id': test_case.id,
+                    'prompt_index': i,
+                    'prompt': prompt_text, # 어떤 프롬프트였는지 기록
+                    'result': test_result_data
+                }
+                scenario_prompt_results.append(prompt_result)
+                all_prompt_results.append(prompt_result) # 전체 결과에도 추가
+                if on_result:
+                    on_result(prompt_result)
+
+                # Print intermediate results for debugging/monitoring per prompt
+                _print_prompt_summary(f"Prompt {i+1}", test_result_data)
+
+            # 시나리오별 평균 메트릭 계산 (선택적 - 일단 개별 결과 저장)
+            # results['test_results'] 에 scenario_prompt_results 를 넣거나,
+            # 아니면 모든 개별 결과를 all_prompt_results 로 저장하고 나중에 처리
+            # 여기서는 모든 개별 결과를 저장하는 방식을 사용
+            # (evaluate_model_responses 에서 시나리오별 평균 점수를 계산하므로)
+
+    return all_prompt_results
+
+def run_test_suite(args: argparse.Namespace, evaluator: ResponseEvaluator = None) -> dict:
+    """파싱된 인자로 한 번의 테스트 실행(initial 또는 continuous)을 수행하고 결과 dict 를 반환합니다.
+
+    evaluator 를 넘기면 재사용합니다 (batch_session.py 처럼 한 프로세스에서 여러 번 실행할 때).
+    """
+    api_url = resolve_api_url(args)
+
+    # 토큰 수 계산에 사용할 모델 토크나이저 (서버가 usage 를 보고하지 않을 때 사용)
+    registry = get_registry()
+    if args.tokenizer_dir:
+        registry.add_search_dir(args.tokenizer_dir)
+    if args.tokenizer:
+        registry.register(args.model, args.tokenizer)
+    tokenizer = get_tokenizer(args.model) # TokenizerLoadError here stops the run before any request is sent
+
+    # 시스템 프롬프트 정의 (--system-prompt-file, 워크로드 프로파일에 포함된 Caret 시스템 프롬프트 순으로 사용)
     system_prompt = "You are a helpful AI assistant." # Simplified system prompt
+    profile = None
+    if args.workload_profile:
+        from workload_profile import WorkloadProfile
+        profile = WorkloadProfile.load(args.workload_profile)
+        system_prompt = profile.system_prompt or system_prompt
+    if args.system_prompt_file:
+        with open(args.system_prompt_file, 'r', encoding='utf-8') as f:
+            system_prompt = f.read()
+    if profile and system_prompt == "You are a helpful AI assistant.":
+        print("Warning: The workload profile has no system prompt; pass --system-prompt-file for Caret-scale requests.", file=sys.stderr)
     
     # 평가기 초기화
-    evaluator = ResponseEvaluator()
+    if evaluator is None:
+        evaluator = ResponseEvaluator()
     
     # 결과 저장을 위한 데이터 구조
     results = {
@@ -234,6 +2260,9 @@ def main():
         'model': args.model,
         'test_type': args.test_type,
         'timestamp': datetime.now().isoformat(),
+        'timing_clock': 'perf_counter_ns', # Monotonic; only the HTTP request is inside the measured window
+        'tokenizer': tokenizer.name,
+        'tokenizer_source': tokenizer.source,
         'test_results': []
     }
 
@@ -250,69 +2279,76 @@ def main():
         test_cases = test_cases[:args.limit_scenarios]
         print(f"Limiting to first {args.limit_scenarios} scenarios.", file=sys.stderr)
 
-    # 테스트 실행 - 각 시나리오의 모든 프롬프트에 대해 실행
-    all_prompt_results = [] # 개별 프롬프트 결과를 임시 저장
-    for test_case in test_cases:
-        print(f"\nRunning scenario: {test_case.id} via {args.api_type} for model {args.model}", file=sys.stderr)
-        scenario_prompt_results = [] # 현재 시나리오의 프롬프트 결과 저장
+    # 컨텍스트 길이 스윕: Ollama 는 num_ctx 로 창 크기를 지정하고, 프롬프트는 목표 토큰 수까지 코드로 채움
+    request_options = {}
+    if args.context and args.api_type == 'ollama':
+        request_options['num_ctx'] = args.context
+    if args.output_tokens:
+        request_options['output_tokens'] = args.output_tokens
+        results['output_tokens'] = args.output_tokens
+    if args.sampling:
+        request_options['sampling'] = args.sampling
+        results['sampling'] = args.sampling
+    if args.keep_alive is not None:
+        request_options['keep_alive'] = args.keep_alive
+        results['keep_alive'] = args.keep_alive
+    fill_tokens = resolve_fill_tokens(args, api_url, tokenizer, system_prompt)
+    if profile:
+        # 워크로드 프로파일: 프롬프트마다 뽑은 길이를 사용 (--context 의 채움 목표는 상한으로만 사용)
+        request_options['per_prompt'] = sample_workload(args, profile, test_cases, tokenizer, system_prompt, fill_tokens)
+        results['workload_profile'] = profile.describe()
+        results['workload_profile'].update({'seed': args.seed, 'system_prompt_tokens': tokenizer.count(system_prompt),
+                                            'samples': list(request_options['per_prompt'].values())})
+        print(f"Workload profile: {len(request_options['per_prompt'])} prompts sized from {len(profile.requests)} recorded Caret requests.", file=sys.stderr)
+    elif fill_tokens:
+        request_options['fill_tokens'] = fill_tokens
+        results['prompt_fill'] = {'target_tokens': fill_tokens, 'output_reserve': args.output_reserve, 'filler': 'repository source code'}
+        print(f"Padding prompts to {fill_tokens} tokens (context {args.context or 'N/A'}, reserve {args.output_reserve}).", file=sys.stderr)
 
-        prompts_to_run = test_case.prompts
-        # Apply prompt limit if provided
-        if args.limit_prompts is not None:
-            prompts_to_run = prompts_to_run[:args.limit_prompts]
-            print(f"  Limiting to first {args.limit_prompts} prompts for this scenario.", file=sys.stderr)
-
-        for i, prompt_text in enumerate(prompts_to_run):
-            print(f"  Running prompt {i+1}/{len(prompts_to_run)}...", file=sys.stderr)
-            test_result_data = run_api_query(
-                args.api_type,
-                api_url,
-                args.model,
-                prompt_text, # 개별 프롬프트 사용
-                system_prompt
-            )
+    # 스트리밍 JSONL 기록 (--output-jsonl): 중간에 중단되어도 끝난 프롬프트 결과는 남음
+    writer, on_result, prior_results, completed = None, None, [], set()
+    if args.output_jsonl:
+        if args.resume and os.path.exists(args.output_jsonl):
+            previous = read_jsonl_results(args.output_jsonl)
+            prior_results = [r for r in (previous or {}).get('test_results', []) if r['result'].get('success')]
+            completed = {(r['scenario_id'], r['prompt_index']) for r in prior_results}
+            print(f"Resuming {args.output_jsonl}: {len(completed)} prompts already completed.", file=sys.stderr)
+            results['resumed'] = True
+        writer = JsonlResultWriter(args.output_jsonl, append=args.resume)
+        writer.write('run', {k: v for k, v in results.items() if k != 'test_results'})
+        on_result = lambda prompt_result: writer.write('prompt_result', prompt_result)
 
-            # 결과에 시나리오 ID와 프롬프트 인덱스 추가
-            prompt_result = {
-                'scenario_id': test_case.id,
-                'prompt_index': i,
-                'prompt': prompt_text, # 어떤 프롬프트였는지 기록
-                'result': test_result_data
-            }
-            scenario_prompt_results.append(prompt_result)
-            all_prompt_results.append(prompt_result) # 전체 결과에도 추가
-
-            # Print intermediate results for debugging/monitoring per prompt
-            if test_result_data['success']:
-                 metrics = test_result_data['metrics']
-                 tps_to_print = metrics.get('tokens_per_second_calculated', 0)
-                 api_tps = metrics.get('api_tokens_per_second')
-                 tps_source = "calculated" if api_tps is None else "API"
-                 if api_tps is not None:
-                     tps_to_print = api_tps
-                 print(f"    Prompt {i+1}: TTFT: {metrics.get('time_to_first_token'):.4f}s, TPS ({tps_source}): {tps_to_print:.2f}", file=sys.stderr)
+    # 테스트 실행 - 각 시나리오의 모든 프롬프트에 대해 실행 (완료된 프롬프트는 즉시 JSONL 에 기록)
+    try:
+        # 최종 결과 구조에 모든 개별 프롬프트 결과 저장 (--resume 이면 이전에 성공한 결과 포함)
+        results['test_results'] = prior_results + run_prompts(args, api_url, test_cases, system_prompt, results, on_result, completed, request_options)
+        results['requests_end_time'] = time.time() # Before the quality evaluation; the server's keep_alive counts from here
+
+        # 정성적 평가 수행 (연속 테스트에서만, 모든 성공한 결과 대상. prefix cache/취소/출력 길이/콜드 스타트 측정은 응답 길이나 프롬프트 구성을 바꾸므로 제외)
+        if args.test_type == 'continuous' and results['test_results'] and not (args.prefix_cache_probe or args.cancel_test or args.output_lengths or args.cold_start):
+            successful_results = [res for res in results['test_results'] if res['result']['success']]
+            if successful_results:
+                quality_scores = evaluate_model_responses(successful_results, evaluator)
+                results['quality_evaluation'] = quality_scores
             else:
-                 print(f"    Prompt {i+1}: FAILED - {test_result_data.get('error')}", file=sys.stderr)
-
-        # 시나리오별 평균 메트릭 계산 (선택적 - 일단 개별 결과 저장)
-        # results['test_results'] 에 scenario_prompt_results 를 넣거나,
-        # 아니면 모든 개별 결과를 all_prompt_results 로 저장하고 나중에 처리
-        # 여기서는 모든 개별 결과를 저장하는 방식을 사용
-        # (evaluate_model_responses 에서 시나리오별 평균 점수를 계산하므로)
-
-    # 최종 결과 구조에 모든 개별 프롬프트 결과 저장
-    results['test_results'] = all_prompt_results
-
-    # 정성적 평가 수행 (연속 테스트에서만, 모든 성공한 결과 대상)
-    if args.test_type == 'continuous' and results['test_results']:
-         successful_results = [res for res in results['test_results'] if res['result']['success']]
-         if successful_results:
-             # evaluate_model_responses 가 prompt_index 를 사용하도록 수정 필요 (evaluator.py 에서 이미 반영 시도)
-             quality_scores = evaluate_model_responses(successful_results)
-             results['quality_evaluation'] = quality_scores
-         else:
-             print("No successful results to evaluate qualitatively.", file=sys.stderr)
+                print("No successful results to evaluate qualitatively.", file=sys.stderr)
 
+        if writer:
+            writer.write('summary', {k: v for k, v in results.items() if k != 'test_results'})
+    finally:
+        if writer:
+            writer.close() # Flush whatever finished, even if the run is aborted
+
+    return results
+
+def main():
+    args = parse_args()
+    try:
+        results = run_test_suite(args)
+    except TokenizerLoadError as e: # Nothing can be measured without a tokenizer; batch_session records it as a failed run
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    close_endpoint_pools()
 
     # 결과를 JSON으로 출력
     print(json.dumps(results, indent=2))
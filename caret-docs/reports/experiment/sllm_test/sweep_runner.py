@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+서버 설정 매트릭스 스윕 실행기.
+
+run_batch_test.sh 는 vLLM 명령줄 하나 (--quantization awq, --tensor-parallel-size 2, --dtype float16) 를 고정해 두어,
+AWQ 와 GPTQ-Int4 비교 같은 다른 조합은 스크립트를 손으로 고쳐 실행했습니다. 이 스크립트는 JSON 매트릭스의
+모델 × 서버 플래그 × 샘플링 파라미터 조합마다 런처로 서버를 띄우고, batch_session.py 와 같은 실행 (컨텍스트별 initial +
+continuous) 을 한 프로세스에서 수행한 뒤 서버를 내립니다. 같은 서버 설정의 샘플링 조합들은 서버 한 번으로 실행합니다.
+
+각 결과 JSON 에는 'sweep' 키로 전체 설정 (config_id, 모델, 서버 플래그, 샘플링, 런처와 실제 실행 명령) 이 기록되고
+파일 이름의 타임스탬프 뒤에 cfgNN 이 붙습니다. generate_report.py 는 플래그/샘플링 값을 server.<이름>, sampling.<이름>
+열로 펼치므로 --group-by 로 어떤 차원으로든 묶어 비교할 수 있습니다.
+
+매트릭스 형식 (sweep_matrix_example.json 참고):
+  - api_type, api_url        : run_test.py 와 같음 (api_url 을 생략하면 API 타입별 기본 URL)
+  - launcher                 : {"type": "docker-vllm" | "mock" | "external" | "<모듈>:<클래스>", 런처 옵션...}
+  - models                   : 모델 이름 또는 {"name": ..., "server_flags": {...}} (모델별 고정 플래그, 예: 양자화 방식)
+  - server_flags, sampling   : {이름: 값 또는 값 목록}. 목록은 스윕 축이고 단일 값은 고정값입니다 (목록 값 자체는 [[...]] 로 감쌈).
+                               서버 플래그는 --<이름> <값> 으로, true 는 --<이름> 만 붙이고 false/null 은 생략합니다.
+                               샘플링은 run_test.py --sampling <이름>=<값> 으로 전달합니다.
+  - contexts, continuous_runs, pause, run_test_args : batch_session.py 와 같음
+
+런처는 start(model, flags) 가 서버가 준비되면 True 를 반환하고 stop() 으로 정리하는 ServerLauncher 하위 클래스입니다.
+준비 확인은 ready_poll_interval (기본 0.5초) 간격으로 폴링하고, 서버 명령 실행부터 준비까지의 시간 (time_to_ready_sec) 과
+그동안 디스크에서 읽은 바이트를 sweep.launcher 에 기록합니다 (generate_report.py 의 콜드 스타트 절).
+  - docker-vllm : run_batch_test.sh 와 같은 docker run 으로 설정마다 vLLM 컨테이너를 새로 띄움 (HUGGING_FACE_HUB_TOKEN 은 환경 변수에서 전달)
+  - mock        : mock_server.py 를 하위 프로세스로 띄움 (서버 플래그 = mock_server.py 인자). GPU 없이 스윕 자체를 점검할 때 사용
+  - external    : 이미 떠 있는 서버 (Ollama 등) 를 그대로 사용. 서버 플래그는 기록용이므로 모델마다 조합이 하나여야 함
+
+python sweep_runner.py <matrix.json> [--dry-run] [--report [--group-by server.quantization ...]] [--timestamp <ts> --resume]
+"""
+import abc
+import argparse
+import importlib
+import itertools
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import batch_session
+import run_test
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_API_URLS = {'ollama': run_test.DEFAULT_OLLAMA_URL, 'tgi': run_test.DEFAULT_TGI_URL, 'vllm': run_test.DEFAULT_VLLM_URL}
+DEFAULT_VLLM_IMAGE = 'vllm/vllm-openai:v0.5.1'
+DEFAULT_DOCKER_ENV = {'VLLM_DISABLE_TORCH_COMPILE': '1', 'NCCL_P2P_DISABLE': '1'} # As in run_batch_test.sh
+
+
+def expand_axes(spec: dict) -> list:
+    """{이름: 값 또는 값 목록} 을 조합 dict 목록으로 펼칩니다 (spec 이 비어 있으면 [{}])."""
+    spec = spec or {}
+    axes = [value if isinstance(value, list) else [value] for value in spec.values()]
+    return [dict(zip(spec, combo)) for combo in itertools.product(*axes)]
+
+def flag_args(flags: dict) -> list:
+    """서버 플래그 dict 를 명령줄 인자 목록으로 바꿉니다 (true 는 값 없는 플래그, false/null 은 생략)."""
+    args = []
+    for name, value in flags.items():
+        if value is None or value is False:
+            continue
+        args.append(f'--{name}')
+        if value is not True:
+            args.append(str(value))
+    return args
+
+def sampling_args(sampling: dict) -> list:
+    """샘플링 dict 를 run_test.py 의 --sampling KEY=VALUE 인자 목록으로 바꿉니다."""
+    return [arg for name, value in sampling.items() for arg in ('--sampling', f'{name}={json.dumps(value)}')]
+
+def plan_configs(matrix: dict) -> list:
+    """매트릭스를 설정 목록으로 펼칩니다. 같은 (모델, 서버 플래그) 의 설정이 연속되므로 서버를 한 번만 띄우면 됩니다."""
+    configs = []
+    for entry in matrix['models']:
+        entry = entry if isinstance(entry, dict) else {'name': entry}
+        seen = set()
+        for server_flags in expand_axes(matrix.get('server_flags')):
+            server_flags.update(entry.get('server_flags') or {}) # Model-specific flags win over the matrix axes
+            key = json.dumps(server_flags, sort_keys=True)
+            if key in seen:
+                continue
+            seen.add(key)
+            for sampling in expand_axes(matrix.get('sampling')):
+                configs.append({'config_id': f"cfg{len(configs) + 1:02d}", 'model': entry['name'],
+                                'server_flags': server_flags, 'sampling': sampling})
+    return configs
+
+class ServerLauncher(abc.ABC):
+    """서버 수명 주기 런처의 기본 클래스.
+
+    options 는 매트릭스의 launcher 항목입니다 (ready_timeout: 준비 대기 초, ready_poll_interval: 폴링 간격, health_path: 준비 확인 경로).
+    command 와 readiness 에는 마지막으로 실행한 서버 명령과 준비 측정값을 남겨 결과의 sweep.launcher 에 기록합니다.
+    """
+    name = 'base'
+
+    def __init__(self, options: dict, api_type: str, api_url: str):
+        self.options = options
+        self.api_type = api_type
+        self.api_url = api_url.rstrip('/')
+        self.ready_timeout = options.get('ready_timeout', 600)
+        self.health_path = options.get('health_path', '/' if api_type == 'ollama' else '/health') # Ollama has no /health
+        self.poll_interval = options.get('ready_poll_interval', 0.5)
+        self.command = None
+        self.readiness = {}
+        self._launched = None
+
+    def validate(self, configs: list):
+        """실행 전에 이 런처로 실행할 수 없는 설정이 있으면 ValueError 를 냅니다."""
+
+    @abc.abstractmethod
+    def start(self, model: str, flags: dict) -> bool:
+        """model 을 flags 로 띄우고 서버가 준비되면 True 를 반환합니다."""
+
+    def stop(self):
+        pass
+
+    def _wait_ready(self, alive=None) -> bool:
+        """서버가 준비될 때까지 폴링하고 준비 측정값을 self.readiness 에 남깁니다 (시간은 서버 명령 실행 시점부터)."""
+        elapsed_before = time.perf_counter() - self._launched if self._launched is not None else 0.0
+        self.readiness = run_test.wait_for_ready(self.api_url + self.health_path, self.ready_timeout, self.poll_interval, alive, elapsed_before)
+        if self.readiness['ready']:
+            print(f"  Server ready after {self.readiness['time_to_ready_sec']:.2f}s", file=sys.stderr)
+        return self.readiness['ready']
+
+    def describe(self) -> dict:
+        return {'type': self.name, 'command': self.command, 'time_to_ready_sec': self.readiness.get('time_to_ready_sec'),
+                'ready_disk_read_bytes': self.readiness.get('ready_disk_read_bytes')}
+
+class DockerVllmLauncher(ServerLauncher):
+    """run_batch_test.sh 와 같은 docker run 명령으로 설정마다 vLLM 컨테이너를 새로 띄웁니다.
+
+    옵션: image, container_name, port (호스트), container_port, volume (허깅페이스 캐시), shm_size, gpus, env, pause_after_stop.
+    """
+    name = 'docker-vllm'
+
+    def __init__(self, options: dict, api_type: str, api_url: str):
+        super().__init__(options, api_type, api_url)
+        self.container = options.get('container_name', 'vllm_test_container')
+
+    def _remove_container(self):
+        subprocess.run(['docker', 'rm', '-f', self.container], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _running(self) -> bool:
+        state = subprocess.run(['docker', 'inspect', '-f', '{{.State.Running}}', self.container], capture_output=True, text=True)
+        return state.stdout.strip() == 'true'
+
+    def start(self, model: str, flags: dict) -> bool:
+        self._remove_container()
+        options = self.options
+        container_port = options.get('container_port', 8000)
+        command = ['docker', 'run', '--gpus', options.get('gpus', 'all'), '-d', '--name', self.container,
+                   '-p', f"{options.get('port', urlparse(self.api_url).port or 8000)}:{container_port}",
+                   '--shm-size', options.get('shm_size', '16g')]
+        if options.get('volume'):
+            command += ['-v', f"{options['volume']}:/root/.cache/huggingface"]
+        for name, value in dict(DEFAULT_DOCKER_ENV, **options.get('env', {})).items():
+            command += ['-e', f'{name}={value}']
+        if os.environ.get('HUGGING_FACE_HUB_TOKEN'):
+            command += ['-e', 'HUGGING_FACE_HUB_TOKEN'] # Passed from the environment so the token never appears in logs or results
+        command += [options.get('image', DEFAULT_VLLM_IMAGE), '--model', model, '--port', str(container_port)] + flag_args(flags)
+        self.command = shlex.join(command)
+        print(f"  Starting: {self.command}", file=sys.stderr)
+        self._launched = time.perf_counter()
+        if subprocess.run(command, stdout=subprocess.DEVNULL).returncode != 0:
+            return False
+        if self._wait_ready(self._running):
+            return True
+        logs = subprocess.run(['docker', 'logs', '--tail', '30', self.container], capture_output=True, text=True)
+        print(f"  vLLM did not become ready; last container output:\n{logs.stdout}{logs.stderr}", file=sys.stderr)
+        return False
+
+    def stop(self):
+        self._remove_container()
+        time.sleep(self.options.get('pause_after_stop', 10)) # Let the GPUs release memory before the next container
+
+class MockLauncher(ServerLauncher):
+    """mock_server.py 를 api_url 의 포트에 하위 프로세스로 띄웁니다 (서버 플래그 = mock_server.py 인자, 모델 이름은 무시)."""
+    name = 'mock'
+
+    def __init__(self, options: dict, api_type: str, api_url: str):
+        super().__init__(options, api_type, api_url)
+        self.ready_timeout = options.get('ready_timeout', 30)
+        self.poll_interval = options.get('ready_poll_interval', 0.1)
+        self._process = None
+
+    def start(self, model: str, flags: dict) -> bool:
+        port = urlparse(self.api_url).port or 11434
+        command = [sys.executable, os.path.join(SCRIPT_DIR, 'mock_server.py'), '--port', str(port)] + flag_args(flags)
+        self.command = shlex.join(command)
+        self._launched = time.perf_counter()
+        self._process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        return self._wait_ready(lambda: self._process.poll() is None)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+class ExternalLauncher(ServerLauncher):
+    """이미 떠 있는 서버를 그대로 사용합니다. 서버 플래그는 결과에 기록만 하므로 모델마다 조합이 하나여야 합니다."""
+    name = 'external'
+
+    def validate(self, configs: list):
+        for model, group in itertools.groupby(configs, key=lambda c: c['model']):
+            if len({json.dumps(c['server_flags'], sort_keys=True) for c in group}) > 1:
+                raise ValueError(f"The external launcher cannot change server flags; {model} has more than one server_flags combination")
+
+    def start(self, model: str, flags: dict) -> bool:
+        return self._wait_ready()
+
+LAUNCHERS = {'docker-vllm': DockerVllmLauncher, 'mock': MockLauncher, 'external': ExternalLauncher}
+
+def create_launcher(options: dict, api_type: str, api_url: str) -> ServerLauncher:
+    """launcher.type 에 맞는 런처를 만듭니다. '<모듈>:<클래스>' 형식이면 그 클래스를 임포트해 사용합니다."""
+    kind = (options or {}).get('type', 'external')
+    if kind in LAUNCHERS:
+        launcher_class = LAUNCHERS[kind]
+    elif ':' in kind:
+        module_name, _, class_name = kind.partition(':')
+        launcher_class = getattr(importlib.import_module(module_name), class_name)
+    else:
+        raise ValueError(f"Unknown launcher type '{kind}' (expected one of {', '.join(LAUNCHERS)} or <module>:<Class>)")
+    return launcher_class(options or {}, api_type, api_url)
+
+def run_sweep(matrix: dict, results_dir: str, timestamp: str, resume: bool = False, dry_run: bool = False,
+              matrix_name: str = None) -> list:
+    """매트릭스의 모든 설정을 실행하고 결과 파일 경로 목록을 반환합니다.
+
+    서버가 준비되지 않은 설정은 건너뛰고 계속합니다. resume 이면 결과 파일이 모두 있는 서버 설정은 서버를 띄우지 않습니다.
+    """
+    api_type = matrix.get('api_type', 'vllm')
+    api_url = matrix.get('api_url') or DEFAULT_API_URLS[api_type]
+    configs = plan_configs(matrix)
+    launcher = create_launcher(matrix.get('launcher'), api_type, api_url)
+    launcher.validate(configs)
+    contexts, continuous_runs = matrix.get('contexts', [12800]), matrix.get('continuous_runs', 1)
+    print(f"Sweep {timestamp}: {len(configs)} configurations x {len(contexts) * (1 + continuous_runs)} runs via {launcher.name} launcher ({api_type} at {api_url})", file=sys.stderr)
+    for config in configs:
+        print(f"  {config['config_id']}: {config['model']} server {json.dumps(config['server_flags'])} sampling {json.dumps(config['sampling'])}", file=sys.stderr)
+    for config in configs: # Before any server starts: a bad context would otherwise end the sweep mid-way
+        batch_session.check_run_args(api_type, api_url, batch_session.plan_runs([config['model']], contexts, continuous_runs),
+                                     list(matrix.get('run_test_args', [])) + sampling_args(config['sampling']))
+    if dry_run:
+        return []
+
+    written = []
+    groups = itertools.groupby(configs, key=lambda c: (c['model'], json.dumps(c['server_flags'], sort_keys=True)))
+    for (model, _), group in groups:
+        group = list(group)
+        model_runs = batch_session.plan_runs([model], contexts, continuous_runs)
+        paths = [batch_session.result_file_path(results_dir, model, api_type, context, timestamp, test_type, run_index, config['config_id'])
+                 for config in group for _, context, test_type, run_index in model_runs]
+        if resume and all(os.path.exists(p) and os.path.getsize(p) > 0 for p in paths):
+            print(f"Skipping {', '.join(c['config_id'] for c in group)}, already completed", file=sys.stderr)
+            written += paths
+            continue
+
+        server_flags = group[0]['server_flags']
+        print(f"\nStarting server for {', '.join(c['config_id'] for c in group)}: {model} {json.dumps(server_flags)}", file=sys.stderr)
+        try:
+            if not launcher.start(model, server_flags):
+                print(f"Error: Server for {model} {json.dumps(server_flags)} did not become ready; skipping {len(group)} configurations", file=sys.stderr)
+                continue
+            for config in group:
+                tags = {'sweep': dict(config, launcher=launcher.describe(), matrix=matrix_name)}
+                run_test_args = list(matrix.get('run_test_args', [])) + sampling_args(config['sampling'])
+                written += batch_session.run_batch_session(api_type, api_url, model_runs, results_dir, timestamp, run_test_args,
+                                                           matrix.get('pause', 2.0), resume, config['config_id'], tags)
+        finally:
+            launcher.stop() # Also on Ctrl+C, so no container keeps holding the GPUs
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the sLLM tests over a matrix of server flags x sampling parameters x models')
+    parser.add_argument('matrix', help='Sweep matrix JSON (see sweep_matrix_example.json)')
+    parser.add_argument('--results-dir', default='experiment_results', help='Directory for per-run JSON files')
+    parser.add_argument('--timestamp', default=None, help='Timestamp used in result filenames (default: now, YYYYMMDD_HHMMSS)')
+    parser.add_argument('--resume', action='store_true', help='Skip completed runs and continue interrupted ones (use with the same --timestamp)')
+    parser.add_argument('--dry-run', action='store_true', help='Print the expanded configurations without starting any server')
+    parser.add_argument('--report', action='store_true', help='Generate the markdown report after all runs')
+    parser.add_argument('--group-by', nargs='+', default=None, help='Report columns to compare configurations by (default: model plus every varying server./sampling. column)')
+    args = parser.parse_args()
+    if args.resume and not args.timestamp:
+        parser.error('--resume requires the --timestamp of the sweep to continue')
+
+    with open(args.matrix, 'r', encoding='utf-8') as f:
+        matrix = json.load(f)
+    timestamp = args.timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+    try:
+        written = run_sweep(matrix, args.results_dir, timestamp, args.resume, args.dry_run, os.path.basename(args.matrix))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.dry_run:
+        return
+    print(f"Sweep completed with {len(written)} result files. Timestamp: {timestamp}", file=sys.stderr)
+
+    if args.report and written:
+        import generate_report # pandas/matplotlib 은 보고서 생성 시에만 로드
+        generate_report.build_report(args.results_dir, timestamp, args.group_by)
+
+    # 이 스윕의 타임스탬프를 stdout 으로 출력 (셸 스크립트에서 보고서 생성에 사용)
+    print(timestamp)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""batch_session.py 의 실행 계획/모델 로드 스케줄 테스트."""
+import time
+
+from batch_session import ModelSwapScheduler, count_model_loads, plan_runs, schedule_runs
+
+
+def test_plan_runs_matches_the_bash_loop_order():
+    assert plan_runs(['m1', 'm2'], [4096], 2) == [
+        ('m1', 4096, 'initial', None), ('m1', 4096, 'continuous', 1), ('m1', 4096, 'continuous', 2),
+        ('m2', 4096, 'initial', None), ('m2', 4096, 'continuous', 1), ('m2', 4096, 'continuous', 2),
+    ]
+
+
+def test_count_model_loads_counts_load_unit_changes():
+    runs = plan_runs(['m1', 'm2'], [4096, 8192], 1)
+    assert count_model_loads(runs) == 4 # A num_ctx change reloads the model
+    assert count_model_loads([]) == 0
+
+
+def test_schedule_keeps_grouped_plans_unchanged():
+    runs = plan_runs(['m1', 'm2'], [4096, 8192], 3)
+    assert schedule_runs(runs) == runs
+
+
+def test_schedule_groups_interleaved_runs():
+    runs = [
+        ('m1', 4096, 'initial', None), ('m2', 4096, 'initial', None),
+        ('m1', 8192, 'initial', None), ('m1', 4096, 'continuous', 1),
+        ('m2', 4096, 'continuous', 1), ('m1', 8192, 'continuous', 1),
+    ]
+    scheduled = schedule_runs(runs)
+    assert scheduled == [
+        ('m1', 4096, 'initial', None), ('m1', 4096, 'continuous', 1),
+        ('m1', 8192, 'initial', None), ('m1', 8192, 'continuous', 1),
+        ('m2', 4096, 'initial', None), ('m2', 4096, 'continuous', 1),
+    ]
+    assert sorted(scheduled, key=repr) == sorted(runs, key=repr)
+    assert count_model_loads(runs) == 6
+    assert count_model_loads(scheduled) == 3
+
+
+def test_idle_gap_counts_from_the_last_request():
+    scheduler = ModelSwapScheduler('http://localhost:11434', plan_runs(['m1'], [4096], 1), baseline_keep_alive='5m')
+    scheduler.before_run(0)
+    scheduler.after_run(0, {'requests_end_time': time.time() - 400}) # Quality evaluation ran after the last request
+    tags = scheduler.before_run(1)
+    assert tags['schedule']['idle_before_sec'] >= 400
+    assert scheduler.summary()['expiry_reloads'] == 1
@@ -0,0 +1,77 @@
+"""result_files.py 의 스트리밍 JSONL 재구성 테스트."""
+import json
+
+from result_files import JsonlResultWriter, read_jsonl_results
+
+
+def _write_jsonl(path, records, truncated_tail: str = None):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        if truncated_tail:
+            f.write(truncated_tail)
+
+
+def _prompt(scenario, index, success):
+    return {'record_type': 'prompt_result', 'scenario_id': scenario, 'prompt_index': index, 'result': {'success': success}}
+
+
+def test_single_run_with_summary(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write_jsonl(path, [
+        {'record_type': 'run', 'model': 'm', 'test_type': 'continuous'},
+        _prompt('a', 0, True),
+        _prompt('a', 1, False),
+        {'record_type': 'summary', 'model': 'm', 'quality_evaluation': {'score': 1}},
+    ])
+    results = read_jsonl_results(str(path))
+    assert results['model'] == 'm'
+    assert [r['prompt_index'] for r in results['test_results']] == [0, 1]
+    assert results['quality_evaluation'] == {'score': 1}
+    assert 'incomplete' not in results and 'resumed_runs' not in results
+
+
+def test_interrupted_run_skips_truncated_line(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write_jsonl(path, [{'record_type': 'run', 'model': 'm'}, _prompt('a', 0, True)], truncated_tail='{"record_type": "prompt_res')
+    results = read_jsonl_results(str(path))
+    assert len(results['test_results']) == 1
+    assert results['incomplete'] is True
+
+
+def test_resume_drops_failures_that_later_succeeded(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write_jsonl(path, [
+        {'record_type': 'run', 'model': 'm'},
+        _prompt('a', 0, True),
+        _prompt('a', 1, False),
+        _prompt('b', 0, False),
+        {'record_type': 'summary', 'stale': True}, # Written before the resume: must not describe the whole file
+        {'record_type': 'run', 'model': 'm', 'resumed': True},
+        _prompt('a', 1, True),
+    ])
+    results = read_jsonl_results(str(path))
+    kept = [(r['scenario_id'], r['prompt_index'], r['result']['success']) for r in results['test_results']]
+    assert kept == [('a', 0, True), ('b', 0, False), ('a', 1, True)]
+    assert results['resumed_runs'] == 1
+    assert results['incomplete'] is True
+    assert 'stale' not in results
+
+
+def test_file_without_run_header(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write_jsonl(path, [_prompt('a', 0, True)])
+    assert read_jsonl_results(str(path)) is None
+
+
+def test_resume_after_truncated_tail(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write_jsonl(path, [{'record_type': 'run', 'model': 'm'}, _prompt('a', 0, False)], truncated_tail='{"record_type": "prompt_res')
+    with JsonlResultWriter(str(path), append=True) as writer:
+        writer.write('run', {'model': 'm', 'resumed': True})
+        writer.write('prompt_result', {'scenario_id': 'a', 'prompt_index': 0, 'result': {'success': True}})
+        writer.write('summary', {'model': 'm'})
+    results = read_jsonl_results(str(path))
+    assert [r['result']['success'] for r in results['test_results']] == [True]
+    assert results['resumed_runs'] == 1
+    assert 'incomplete' not in results
@@ -0,0 +1,87 @@
+"""run_test.py 의 순수 도우미 함수 테스트 (서버 없이 실행: python -m pytest)."""
+import random
+from array import array
+
+import pytest
+
+from run_test import _mean, _percentile, arrival_offsets, decode_timeline, encode_timeline, find_max_sustainable_level, keep_alive_seconds
+
+
+def _recording_measure(limit):
+    """limit 이하 수준만 SLO 를 만족하는 measure 함수와 측정한 수준 목록을 반환합니다."""
+    probed = []
+    def measure(level):
+        probed.append(level)
+        return {'load_level': level, 'meets_slo': level <= limit}
+    return measure, probed
+
+
+def test_percentile_interpolates_between_ranks():
+    values = [4, 1, 3, 2]
+    assert _percentile(values, 0) == 1
+    assert _percentile(values, 100) == 4
+    assert _percentile(values, 50) == pytest.approx(2.5)
+    assert _percentile(values, 90) == pytest.approx(3.7)
+    assert _percentile([7], 99) == 7
+    assert _percentile([], 50) is None
+
+
+def test_mean_of_empty_is_none():
+    assert _mean([1, 2, 6]) == 3
+    assert _mean([]) is None
+
+
+@pytest.mark.parametrize('limit', [1, 5, 8, 13, 63])
+def test_saturation_search_finds_the_largest_passing_integer_level(limit):
+    measure, probed = _recording_measure(limit)
+    best, curve = find_max_sustainable_level(measure, 1, 64)
+    assert best == limit
+    assert len(probed) == len(set(probed)) # Each level is measured once
+    assert [point['load_level'] for point in curve] == sorted(probed)
+
+
+def test_saturation_search_bounds():
+    measure, probed = _recording_measure(0)
+    assert find_max_sustainable_level(measure, 1, 64)[0] is None # Even the start level misses the SLO
+    assert probed == [1]
+
+    measure, probed = _recording_measure(1000)
+    assert find_max_sustainable_level(measure, 1, 48)[0] == 48 # Ramp-up is capped at the upper bound
+    assert probed == [1, 2, 4, 8, 16, 32, 48]
+
+
+def test_saturation_search_stops_at_rate_resolution():
+    measure, _ = _recording_measure(3.3)
+    best, _ = find_max_sustainable_level(measure, 0.5, 64, integer=False, resolution=0.25)
+    assert 3.3 - 0.25 <= best <= 3.3
+
+
+def test_arrival_offsets():
+    constant = arrival_offsets(4.0, 5, 'constant', random.Random(0))
+    assert constant == pytest.approx([0.0, 0.25, 0.5, 0.75, 1.0])
+
+    poisson = arrival_offsets(10.0, 2000, 'poisson', random.Random(1))
+    assert poisson[0] == 0.0
+    assert all(b >= a for a, b in zip(poisson, poisson[1:]))
+    assert (len(poisson) - 1) / poisson[-1] == pytest.approx(10.0, rel=0.1)
+    assert poisson == arrival_offsets(10.0, 2000, 'poisson', random.Random(1)) # Seeded schedules repeat
+
+
+def test_timeline_round_trip():
+    arrivals = array('q', [5_000_000_000, 5_000_250_000, 5_012_000_000, 6_500_000_000])
+    timeline = encode_timeline(arrivals)
+    assert timeline['count'] == 4
+    assert list(decode_timeline(timeline)) == pytest.approx([0.0, 0.25, 12.0, 1500.0], abs=1e-3)
+
+    empty = encode_timeline(array('q'))
+    assert empty['count'] == 0
+    assert len(decode_timeline(empty)) == 0
+
+
+def test_keep_alive_seconds():
+    assert keep_alive_seconds(30) == 30
+    assert keep_alive_seconds('1h30m') == 5400
+    assert keep_alive_seconds('250ms') == pytest.approx(0.25)
+    assert keep_alive_seconds(-1) == float('inf') # Negative keeps the model loaded indefinitely
+    with pytest.raises(ValueError):
+        keep_alive_seconds('forever')
@@ -0,0 +1,27 @@
+"""tokenizer_registry.py 의 토크나이저 로드 실패 처리 테스트."""
+import sys
+import types
+
+import pytest
+
+from tokenizer_registry import TokenizerLoadError, TokenizerRegistry
+
+
+def test_failed_fallback_is_reported_once_and_cached(tmp_path, monkeypatch):
+    attempts = []
+    def get_encoding(name):
+        attempts.append(name)
+        raise ConnectionError("no network")
+    monkeypatch.setitem(sys.modules, 'tiktoken', types.SimpleNamespace(get_encoding=get_encoding, encoding_for_model=get_encoding))
+
+    corrupt = tmp_path / 'model.tokenizer.json'
+    corrupt.write_text('{not json')
+    registry = TokenizerRegistry(search_dirs=(), modelfile_dir=str(tmp_path))
+    registry.register('m', str(corrupt))
+    with pytest.raises(TokenizerLoadError, match='No usable tokenizer for m'):
+        registry.get('m')
+    with pytest.raises(TokenizerLoadError):
+        registry.get('m')
+    with pytest.raises(TokenizerLoadError):
+        registry.get('other') # The fallback download is not retried for another model either
+    assert len(attempts) == 2 # get_encoding + encoding_for_model, once
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+모델 이름별 토크나이저 레지스트리.
+
+run_test.py 는 모든 모델의 토큰을 tiktoken cl100k_base 로 세어 왔기 때문에 Qwen/Gemma 모델의
+generated_tokens 와 TPS 가 체계적으로 어긋났습니다. 이 모듈은 모델 이름을 실제 토크나이저(tokenizer.json)에 매핑하고,
+한 번 로드한 토크나이저를 메모리에 캐시합니다. 로컬 파일을 찾지 못하면 tiktoken cl100k_base 로 대체하며,
+어느 토크나이저를 사용했는지 source 로 남깁니다.
+
+tokenizer.json 탐색 순서 (모델 이름의 ':' 와 '/' 는 '_' 로 바꾼 safe name 사용):
+  1. register() 또는 --tokenizer 로 명시한 경로
+  2. 각 검색 디렉토리의 <safe name>.tokenizer.json, <safe name>/tokenizer.json
+  3. modelfiles/ 에서 파일 이름 또는 FROM 줄이 모델과 일치하는 Modelfile 옆의 <stem>.tokenizer.json, <stem>/tokenizer.json
+  4. 로컬 Hugging Face 캐시 (HF_HOME/hub/models--<org>--<name>/snapshots/*/tokenizer.json), 네트워크 접근 없음
+
+python tokenizer_registry.py <model> [<text>] 로 해석 결과와 토큰 수를 확인할 수 있습니다.
+"""
+import glob
+import os
+import re
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SEARCH_DIRS = (os.path.join(SCRIPT_DIR, 'tokenizers'), os.path.join(SCRIPT_DIR, 'modelfiles'))
+MODELFILE_DIR = os.path.join(SCRIPT_DIR, 'modelfiles')
+FALLBACK_NAME = 'tiktoken:cl100k_base'
+
+
+def safe_model_name(model: str) -> str:
+    """모델 이름의 ':' 와 '/' 를 '_' 로 바꿉니다 (결과 파일 이름과 같은 규칙)."""
+    return re.sub(r'[:/]', '_', model)
+
+class TokenizerLoadError(RuntimeError):
+    """모델 토크나이저도, tiktoken 대체 토크나이저도 로드하지 못했습니다."""
+
+class ModelTokenizer:
+    """encode/decode/count 를 제공하는 토크나이저 래퍼입니다.
+
+    name 은 사용한 토크나이저 (tokenizer.json 경로 또는 tiktoken 인코딩 이름),
+    source 는 'tokenizer_json' 또는 'tiktoken_fallback' 입니다.
+    """
+    def __init__(self, backend, name: str, source: str):
+        self._backend = backend
+        self.name = name
+        self.source = source
+
+    def encode(self, text: str) -> list:
+        if self.source == 'tokenizer_json':
+            return self._backend.encode(text, add_special_tokens=False).ids
+        return self._backend.encode(text, disallowed_special=())
+
+    def decode(self, ids: list) -> str:
+        return self._backend.decode(ids)
+
+    def count(self, text: str) -> int:
+        """text 의 토큰 수를 반환합니다 (특수 토큰 제외)."""
+        return len(self.encode(text)) if text else 0
+
+class TokenizerRegistry:
+    """모델 이름 -> ModelTokenizer 매핑을 해석하고 로드된 토크나이저를 캐시합니다."""
+    def __init__(self, search_dirs: tuple = DEFAULT_SEARCH_DIRS, modelfile_dir: str = MODELFILE_DIR):
+        self.search_dirs = list(search_dirs)
+        self.modelfile_dir = modelfile_dir
+        self._explicit = {}
+        self._cache = {} # model name -> ModelTokenizer
+        self._loaded = {} # tokenizer path -> ModelTokenizer (모델 여러 개가 같은 파일을 쓰는 경우 공유)
+        self._failed = {} # model name -> error message, so a failed load is not retried for every request
+        self._fallback_error = None
+
+    def register(self, model: str, path: str):
+        """model 에 사용할 tokenizer.json 경로를 명시적으로 지정합니다."""
+        self._explicit[model] = path
+        self._cache.pop(model, None)
+        self._failed.pop(model, None)
+
+    def add_search_dir(self, path: str):
+        """tokenizer.json 검색 디렉토리를 가장 높은 우선순위로 추가합니다."""
+        if path in self.search_dirs:
+            self.search_dirs.remove(path)
+        self.search_dirs.insert(0, path)
+        self._cache.clear()
+        self._failed.clear()
+
+    def _modelfile_stems(self, model: str) -> list:
+        """파일 이름 또는 FROM 줄이 model 과 일치하는 Modelfile 의 stem 목록을 반환합니다."""
+        stems = []
+        for path in sorted(glob.glob(os.path.join(self.modelfile_dir, '*.Modelfile'))):
+            stem = os.path.basename(path)[:-len('.Modelfile')]
+            if stem in (model, safe_model_name(model)):
+                stems.append(stem)
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    base = next((line.split(None, 1)[1].strip() for line in f if line.upper().startswith('FROM ')), None)
+            except (OSError, IndexError):
+                continue
+            if base == model:
+                stems.append(stem)
+        return stems
+
+    def candidate_paths(self, model: str) -> list:
+        """model 에 대해 확인할 tokenizer.json 후보 경로를 우선순위 순으로 반환합니다."""
+        candidates = []
+        if model in self._explicit:
+            candidates.append(self._explicit[model])
+        names = [safe_model_name(model)] + self._modelfile_stems(model)
+        for directory in self.search_dirs:
+            for name in names:
+                candidates.append(os.path.join(directory, f"{name}.tokenizer.json"))
+                candidates.append(os.path.join(directory, name, 'tokenizer.json'))
+        if '/' in model: # Hugging Face model id -> local hub cache only
+            hf_home = os.environ.get('HF_HOME', os.path.join(os.path.expanduser('~'), '.cache', 'huggingface'))
+            pattern = os.path.join(hf_home, 'hub', f"models--{model.replace('/', '--')}", 'snapshots', '*', 'tokenizer.json')
+            candidates.extend(sorted(glob.glob(pattern)))
+        return candidates
+
+    def resolve_path(self, model: str):
+        """존재하는 첫 번째 tokenizer.json 경로를 반환합니다 (없으면 None)."""
+        return next((path for path in self.candidate_paths(model) if os.path.isfile(path)), None)
+
+    def _load_tokenizer_json(self, path: str):
+        if path not in self._loaded:
+            from tokenizers import Tokenizer # Hugging Face tokenizers, only needed when a tokenizer.json exists
+            self._loaded[path] = ModelTokenizer(Tokenizer.from_file(path), path, 'tokenizer_json')
+        return self._loaded[path]
+
+    def _load_fallback(self):
+        if self._fallback_error:
+            raise TokenizerLoadError(self._fallback_error)
+        if FALLBACK_NAME not in self._loaded:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    encoding = tiktoken.encoding_for_model("gpt-4") # Fallback
+            except Exception as e: # tiktoken not installed, or no network to download the encoding
+                self._fallback_error = f"Could not load {FALLBACK_NAME}: {e}"
+                raise TokenizerLoadError(self._fallback_error) from e
+            self._loaded[FALLBACK_NAME] = ModelTokenizer(encoding, FALLBACK_NAME, 'tiktoken_fallback')
+        return self._loaded[FALLBACK_NAME]
+
+    def get(self, model: str = None) -> ModelTokenizer:
+        """model 의 토크나이저를 반환합니다. 찾지 못하거나 로드에 실패하면 tiktoken cl100k_base 를 사용합니다.
+
+        대체 토크나이저까지 로드하지 못하면 TokenizerLoadError 를 내며, 실패는 캐시되어 이후 호출은 다시 시도하지 않습니다.
+        """
+        if model in self._cache:
+            return self._cache[model]
+        if model in self._failed:
+            raise TokenizerLoadError(self._failed[model])
+        tokenizer = None
+        path = self.resolve_path(model) if model else None
+        if path:
+            try:
+                tokenizer = self._load_tokenizer_json(path)
+            except Exception as e: # ImportError (tokenizers not installed) or a malformed file
+                print(f"Warning: Could not load tokenizer {path} for {model}: {e}. Falling back to {FALLBACK_NAME}.", file=sys.stderr)
+        elif model:
+            print(f"Warning: No tokenizer.json found for {model}. Falling back to {FALLBACK_NAME}.", file=sys.stderr)
+        try:
+            tokenizer = tokenizer or self._load_fallback()
+        except TokenizerLoadError as e:
+            self._failed[model] = f"No usable tokenizer for {model}: {e}"
+            raise TokenizerLoadError(self._failed[model]) from e
+        self._cache[model] = tokenizer
+        return tokenizer
+
+_registry = TokenizerRegistry()
+
+def get_registry() -> TokenizerRegistry:
+    """프로세스 전역 레지스트리를 반환합니다."""
+    return _registry
+
+def get_tokenizer(model: str = None) -> ModelTokenizer:
+    """프로세스 전역 레지스트리에서 model 의 토크나이저를 반환합니다."""
+    return _registry.get(model)
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python tokenizer_registry.py <model> [<text>]", file=sys.stderr)
+        sys.exit(1)
+    model = sys.argv[1]
+    tokenizer = get_tokenizer(model)
+    print(f"model:     {model}")
+    print(f"tokenizer: {tokenizer.name} ({tokenizer.source})")
+    if len(sys.argv) > 2:
+        print(f"tokens:    {tokenizer.count(sys.argv[2])}")
+
+if __name__ == '__main__':
+    main()
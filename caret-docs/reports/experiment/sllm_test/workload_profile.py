@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+실제 Caret 작업 로그에서 만든 워크로드 프로파일.
+
+evaluator.py 의 시나리오 프롬프트는 한두 줄짜리라, 큰 에이전트 시스템 프롬프트와 긴 도구 결과가 쌓인 대화를 보내는
+실제 Caret 요청과 부하 모양이 다릅니다. 이 모듈은 Caret 작업 폴더 (globalStorage/caretive.caret/tasks/<id>/) 의
+ui_messages.json 에 기록된 API 요청별 토큰 수 (api_req_started 의 tokensIn/tokensOut/cacheWrites/cacheReads) 를 모아
+프로파일 JSON 을 만들고, run_test.py --workload-profile 이 요청마다 (입력 토큰 수, 출력 토큰 수) 쌍을 여기서 뽑습니다.
+
+- 입력 토큰 = tokensIn + cacheWrites + cacheReads (Anthropic 방식: tokensIn 에 캐시된 토큰이 빠져 있음). 원래 값도 함께 저장합니다.
+- 취소되었거나 스트리밍이 실패한 요청, 토큰 수가 기록되지 않은 요청은 제외합니다.
+- 토큰 수는 작업 당시 공급자의 토크나이저 기준이므로 벤치마크 모델 토크나이저와 몇 % 차이가 날 수 있습니다.
+- 프로파일에는 토큰 수와 작업 ID 만 저장하고 대화 내용은 저장하지 않습니다.
+- 시스템 프롬프트는 system-prompt-token-measurement.js 가 저장한 system-prompt-agent-<날짜>.txt 를 --system-prompt-file 로 넣습니다.
+
+python workload_profile.py build [--tasks-dir <dir> ...] [--system-prompt-file <txt>] -o <profile.json>
+python workload_profile.py show <profile.json>
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+from datetime import datetime
+
+PROFILE_VERSION = 1
+EXTENSION_ID = 'caretive.caret'
+INPUT_TOKEN_ACCOUNTING = 'tokensIn + cacheWrites + cacheReads'
+
+
+def default_tasks_dirs() -> list:
+    """VS Code 계열 에디터의 Caret 작업 폴더 중 존재하는 것을 반환합니다."""
+    if sys.platform == 'win32':
+        bases = [os.environ.get('APPDATA', '')]
+    elif sys.platform == 'darwin':
+        bases = [os.path.expanduser('~/Library/Application Support')]
+    else:
+        bases = [os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')]
+    candidates = [os.path.join(base, editor, 'User', 'globalStorage', EXTENSION_ID, 'tasks')
+                  for base in bases if base for editor in ('Code', 'Code - Insiders', 'Cursor', 'VSCodium')]
+    return [path for path in candidates if os.path.isdir(path)]
+
+def find_task_dirs(tasks_dirs: list) -> list:
+    """tasks 폴더 목록 (또는 작업 폴더 자체) 에서 ui_messages.json 이 있는 작업 폴더를 정렬해 반환합니다."""
+    task_dirs = set()
+    for path in tasks_dirs:
+        if os.path.isfile(os.path.join(path, 'ui_messages.json')):
+            task_dirs.add(path)
+        task_dirs.update(os.path.dirname(p) for p in glob.glob(os.path.join(path, '*', 'ui_messages.json')))
+    return sorted(task_dirs)
+
+def extract_task_requests(task_dir: str) -> list:
+    """작업 하나의 완료된 API 요청별 토큰 수 목록을 반환합니다 (읽을 수 없는 작업은 빈 목록)."""
+    try:
+        with open(os.path.join(task_dir, 'ui_messages.json'), 'r', encoding='utf-8') as f:
+            messages = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return []
+    task_id = os.path.basename(os.path.normpath(task_dir))
+    requests = []
+    for message in messages if isinstance(messages, list) else []:
+        if message.get('say') != 'api_req_started' or message.get('partial'):
+            continue
+        try:
+            info = json.loads(message.get('text') or '{}')
+        except json.JSONDecodeError:
+            continue
+        if info.get('cancelReason') or info.get('streamingFailedMessage'):
+            continue # Interrupted: the output length says nothing about the real response
+        tokens_in, tokens_out = info.get('tokensIn'), info.get('tokensOut')
+        if not tokens_in or not tokens_out:
+            continue
+        cache_writes, cache_reads = info.get('cacheWrites') or 0, info.get('cacheReads') or 0
+        requests.append({
+            'task': task_id,
+            'index': len(requests), # Position within the task's conversation
+            'input_tokens': tokens_in + cache_writes + cache_reads,
+            'output_tokens': tokens_out,
+            'tokens_in': tokens_in,
+            'cache_write_tokens': cache_writes,
+            'cache_read_tokens': cache_reads,
+        })
+    return requests
+
+def _distribution(values: list) -> dict:
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+    return {'count': len(values), 'mean': sum(values) / len(values), 'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': values[-1]}
+
+def build_profile(tasks_dirs: list, system_prompt_file: str = None) -> dict:
+    """작업 폴더들에서 워크로드 프로파일 dict 를 만듭니다 (완료된 요청이 하나도 없으면 ValueError)."""
+    task_dirs = find_task_dirs(tasks_dirs)
+    requests = [request for task_dir in task_dirs for request in extract_task_requests(task_dir)]
+    if not requests:
+        raise ValueError(f"No completed API requests with token counts found in {len(task_dirs)} task folders")
+    profile = {
+        'profile_version': PROFILE_VERSION,
+        'created': datetime.now().isoformat(),
+        'source': {
+            'task_folders': len(task_dirs),
+            'tasks_used': len({r['task'] for r in requests}),
+            'requests': len(requests),
+            'input_token_accounting': INPUT_TOKEN_ACCOUNTING,
+        },
+        'summary': {
+            'input_tokens': _distribution([r['input_tokens'] for r in requests]),
+            'output_tokens': _distribution([r['output_tokens'] for r in requests]),
+        },
+        'requests': requests,
+    }
+    if system_prompt_file:
+        with open(system_prompt_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+        profile['system_prompt'] = {'source': os.path.basename(system_prompt_file), 'chars': len(text), 'text': text}
+    return profile
+
+class WorkloadProfile:
+    """프로파일 JSON 에서 실제 요청의 (입력 토큰 수, 출력 토큰 수) 쌍을 복원 추출합니다.
+
+    두 값을 따로 뽑지 않고 같은 요청에서 함께 뽑으므로 긴 대화 끝의 짧은 응답 같은 상관관계가 유지됩니다.
+    """
+    def __init__(self, profile: dict, path: str = None):
+        if profile.get('profile_version') != PROFILE_VERSION:
+            raise ValueError(f"Unsupported workload profile version: {profile.get('profile_version')}")
+        if not profile.get('requests'):
+            raise ValueError('Workload profile has no requests')
+        self.profile = profile
+        self.path = path
+        self.requests = profile['requests']
+
+    @classmethod
+    def load(cls, path: str) -> 'WorkloadProfile':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), path)
+
+    @property
+    def system_prompt(self):
+        """프로파일에 포함된 시스템 프롬프트 텍스트 (없으면 None)."""
+        return (self.profile.get('system_prompt') or {}).get('text')
+
+    def sample(self, rng: random.Random) -> tuple:
+        """(입력 토큰 수, 출력 토큰 수) 쌍 하나를 반환합니다."""
+        request = rng.choice(self.requests)
+        return request['input_tokens'], request['output_tokens']
+
+    def describe(self) -> dict:
+        """결과 파일에 기록할 프로파일 요약 (요청 목록과 시스템 프롬프트 본문 제외)."""
+        system_prompt = self.profile.get('system_prompt') or {}
+        return {
+            'path': self.path,
+            'created': self.profile.get('created'),
+            'source': self.profile.get('source'),
+            'summary': self.profile.get('summary'),
+            'system_prompt_source': system_prompt.get('source'),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect a Caret workload profile for run_test.py --workload-profile')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Collect per-request token counts from Caret task folders')
+    build.add_argument('--tasks-dir', action='append', default=None, help='Caret tasks folder or single task folder (repeatable, default: the editor globalStorage)')
+    build.add_argument('--system-prompt-file', default=None, help='System prompt dump from system-prompt-token-measurement.js to embed in the profile')
+    build.add_argument('-o', '--output', required=True, help='Profile JSON to write')
+    show = subparsers.add_parser('show', help='Print the summary of a profile')
+    show.add_argument('profile', help='Profile JSON')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        profile = WorkloadProfile.load(args.profile)
+        print(json.dumps(profile.describe(), ensure_ascii=False, indent=2))
+        return
+    tasks_dirs = args.tasks_dir or default_tasks_dirs()
+    if not tasks_dirs:
+        print(f"Error: No Caret tasks folder found. Pass --tasks-dir (globalStorage/{EXTENSION_ID}/tasks).", file=sys.stderr)
+        sys.exit(1)
+    try:
+        profile = build_profile(tasks_dirs, args.system_prompt_file)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    source, summary = profile['source'], profile['summary']
+    print(f"Wrote {args.output}: {source['requests']} requests from {source['tasks_used']} tasks", file=sys.stderr)
+    for name in ('input_tokens', 'output_tokens'):
+        d = summary[name]
+        print(f"  {name}: p50 {d['p50']}, p90 {d['p90']}, p99 {d['p99']}, max {d['max']}", file=sys.stderr)
+    if 'system_prompt' not in profile:
+        print("  No system prompt embedded; pass --system-prompt-file to run_test.py or rebuild with it.", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()